@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+"""
+Web 应用的 ASGI 版本
+
+长连接和耗时请求走异步路由,不再各占一个工作线程:
+- /api/stream/<session_id>: SSE 流为协程,空闲时只占一个等待中的任务
+- /api/run、/api/analyze-my-flask-app、/api/upload: LLM 和工具调用通过
+  CodebaseMaintainer.arun 在有界线程池中执行,事件循环可同时交错处理多个分析
+
+其余页面和接口(首页、/api/init、/metrics、剖析结果等)仍由 web_app 中的 Flask 应用处理,
+两者共享同一个状态存储和活跃会话。
+
+用法:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    python asgi_app.py --port 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Set
+
+# 确保能导入必要的模块
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+import web_app
+from code_agent.main import CodebaseMaintainer
+from metrics import registry
+from upload_pipeline import UploadError, UPLOAD_BATCH_MAX_BYTES, is_archive
+from web_app import (
+    current_maintainer, process_upload_batch, publish_maintainer, shutdown_event, state_store,
+    upload_maintainer, upload_pipeline
+)
+
+# 同时执行的同步 LLM/工具调用数上限
+ANALYSIS_WORKERS = int(os.getenv('ASGI_ANALYSIS_WORKERS', '32'))
+# SSE 轮询间隔: 本进程内追加的消息会立即唤醒,这里只兜底其他 worker 写入的消息
+STREAM_POLL_INTERVAL = float(os.getenv('STREAM_POLL_INTERVAL', '0.5'))
+
+
+class StreamNotifier:
+    """本进程内的新消息通知: 追加消息后唤醒等待该会话的 SSE 协程"""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    def subscribe(self, session_id: str) -> asyncio.Event:
+        event = asyncio.Event()
+        self._waiters.setdefault(session_id, set()).add(event)
+        return event
+
+    def unsubscribe(self, session_id: str, event: asyncio.Event):
+        waiters = self._waiters.get(session_id)
+        if waiters:
+            waiters.discard(event)
+            if not waiters:
+                del self._waiters[session_id]
+
+    def notify(self, session_id: str):
+        for event in self._waiters.get(session_id, ()):
+            event.set()
+
+
+notifier = StreamNotifier()
+
+
+async def run_sync(func, *args):
+    """在线程池中执行同步函数(检查点读写、维护助手初始化等)"""
+    return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+
+@asynccontextmanager
+async def locked_maintainer(create=None):
+    """web_app.locked_maintainer 的异步版本: 租约的获取和释放在线程池中执行, 持有期间后台线程续租"""
+    while True:
+        active = await run_sync(state_store.get_value, 'active_maintainer')
+        if not active and create is None:
+            yield None
+            return
+        instance = await create() if not active else None
+        session_id = instance.session_id if instance else active['session_id']
+        name = f"session:{session_id}"
+        token = await run_sync(state_store.acquire_lock, name)
+        heartbeat = state_store.keep_alive(name, token)
+        try:
+            if instance:
+                await run_sync(publish_maintainer, instance)
+            else:
+                instance = await run_sync(current_maintainer)
+            if instance is None or instance.session_id == session_id:
+                yield instance
+                return
+        finally:
+            await run_sync(state_store.release_held, name, token, heartbeat)
+        # 等锁期间活跃会话已切换, 改为锁定新会话
+
+
+def emit(session_id: str, message: str):
+    """写入实时消息并唤醒本进程内的 SSE 流"""
+    state_store.append(session_id, message)
+    notifier.notify(session_id)
+
+
+def record_request(route: str, method: str, status: int, start: float):
+    """与 web_app 相同的请求指标"""
+    registry.counter(
+        'http_requests_total', 'HTTP requests',
+        labels={'route': route, 'method': method, 'status': str(status)}
+    ).inc()
+    registry.histogram(
+        'http_request_duration_seconds', 'HTTP request latency',
+        labels={'route': route, 'method': method}
+    ).observe(time.perf_counter() - start)
+
+
+def timed(route: str):
+    """按路由记录请求数和耗时(SSE 只记录建立连接的耗时)"""
+    def decorator(handler):
+        async def wrapper(request: Request):
+            start = time.perf_counter()
+            response = await handler(request)
+            record_request(route, request.method, response.status_code, start)
+            return response
+        return wrapper
+    return decorator
+
+
+@timed('/api/run')
+async def api_run(request: Request):
+    """运行维护助手"""
+    data = await request.json()
+    user_input = data.get('user_input', '')
+    mode = data.get('mode', 'auto')
+    # 请求头 X-Profile: 1 时对本次调用做采样剖析
+    profile = request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes')
+
+    try:
+        # 同一会话的运行跨 worker 串行, 避免并发加载/保存同一检查点
+        async with locked_maintainer() as maintainer:
+            if not maintainer:
+                return JSONResponse({'status': 'error', 'message': '❌ 助手未初始化'})
+            if mode == 'diff':
+                # 增量分析: rev_range 为 git 修订范围, user_input 作为关注点
+                rev_range = data.get('rev_range') or 'HEAD~1..HEAD'
+                response = await maintainer.aanalyze_diff(rev_range, user_input)
+            else:
+                response = await maintainer.arun(user_input, mode, profile=profile)
+            await run_sync(publish_maintainer, maintainer)
+        result = {'status': 'success', 'response': response}
+        if profile and maintainer.last_profile:
+            result['profile'] = maintainer.last_profile['name']
+        return JSONResponse(result)
+    except Exception as e:
+        return JSONResponse({'status': 'error', 'message': f'❌ 运行失败: {str(e)}'})
+
+
+ANALYSIS_STEPS = [
+    ('探索代码库', '🔍 探索代码库结构...', '✅ 探索完成', '探索失败',
+     '请探索 . 的代码结构，列出所有的 Python 文件和目录结构', 'explore'),
+    ('分析代码质量', '📊 分析代码质量...', '✅ 质量分析完成', '分析失败',
+     '请分析代码库的质量，查找潜在的问题，包括代码重复、复杂度、缺少测试等', 'analyze'),
+    ('规划重构任务', '📋 规划重构任务...', '✅ 任务规划完成', '规划失败',
+     '请基于之前的分析，规划重构任务，列出优先级和工作量', 'plan'),
+]
+
+
+@timed('/api/analyze-my-flask-app')
+async def api_analyze_my_flask_app(request: Request):
+    """分析 my_flask_app 代码库"""
+    data = await request.json()
+    session_id = data.get('session_id', 'default')
+
+    try:
+        # 初始化会话消息队列
+        state_store.ensure(session_id)
+
+        emit(session_id, "🔍 开始分析 my_flask_app 代码库...")
+
+        # 初始化维护器（如果尚未初始化）
+        async def create_maintainer():
+            emit(session_id, "📦 初始化代码库维护助手...")
+            instance = await run_sync(CodebaseMaintainer, 'my_flask_app', './my_flask_app')
+            emit(session_id, "✅ 代码库维护助手初始化成功！")
+            return instance
+
+        # 执行分析步骤(在同一把会话锁内)
+        results = []
+        async with locked_maintainer(create_maintainer) as maintainer:
+            for step, start_msg, done_msg, fail_msg, prompt, mode in ANALYSIS_STEPS:
+                emit(session_id, start_msg)
+                try:
+                    step_response = await maintainer.arun(prompt, mode=mode)
+                    emit(session_id, f"{done_msg}：{step_response}")
+                    results.append({'step': step, 'response': step_response})
+                except Exception as e:
+                    error_msg = f'{fail_msg}: {str(e)}'
+                    emit(session_id, f"❌ {error_msg}")
+                    results.append({'step': step, 'response': error_msg})
+
+            await run_sync(publish_maintainer, maintainer)
+        emit(session_id, "🎉 分析完成！")
+
+        return JSONResponse({'status': 'success', 'results': results})
+    except Exception as e:
+        error_msg = f'❌ 分析失败: {str(e)}'
+        emit(session_id, error_msg)
+        return JSONResponse({'status': 'error', 'message': error_msg})
+
+
+@timed('/api/upload')
+async def api_upload(request: Request):
+    """上传代码文件并分析(多个文件或压缩包时按批次逐文件分析)"""
+    if int(request.headers.get('content-length') or 0) > UPLOAD_BATCH_MAX_BYTES + 64 * 1024:
+        return JSONResponse(
+            {'status': 'error', 'message': f'❌ 上传内容超过大小限制 ({UPLOAD_BATCH_MAX_BYTES // 1024 // 1024} MB)'},
+            status_code=413
+        )
+    form = await request.form()
+    files = [f for f in form.getlist('file') if not isinstance(f, str)]
+    if not files:
+        return JSONResponse({'status': 'error', 'message': '❌ 未收到文件'})
+    files = [f for f in files if f.filename]
+    if not files:
+        return JSONResponse({'status': 'error', 'message': '❌ 文件名不能为空'})
+
+    if len(files) > 1 or is_archive(files[0].filename):
+        session_id = form.get('session_id') or 'default'
+        loop = asyncio.get_running_loop()
+
+        def emit_threadsafe(sid, message):
+            # 分析线程中推送, 通过事件循环唤醒 SSE 协程
+            state_store.append(sid, message)
+            loop.call_soon_threadsafe(notifier.notify, sid)
+
+        try:
+            result = await run_sync(
+                process_upload_batch, [(f.filename, f.file) for f in files], session_id, emit_threadsafe
+            )
+            return JSONResponse(result)
+        except UploadError as e:
+            emit(session_id, f"❌ {e}")
+            return JSONResponse({'status': 'error', 'message': f'❌ {e}'})
+
+    file = files[0]
+
+    # 流式写入内容寻址的暂存区
+    try:
+        staged = await run_sync(upload_pipeline.stage, file.file, file.filename)
+    except UploadError as e:
+        return JSONResponse({'status': 'error', 'message': f'❌ {e}'})
+    print(f"✅ 文件已保存到: {staged['path']}{' (重复上传)' if staged['deduplicated'] else ''}")
+
+    # 分析文件(分块在上传流水线的线程池中并发执行)
+    try:
+        analyzer = await run_sync(upload_maintainer)
+        result = await run_sync(upload_pipeline.analyze, staged, analyzer.analyze_file)
+        if result.get('error'):
+            return JSONResponse({'status': 'error', 'message': result['response']})
+        return JSONResponse({
+            'status': 'success',
+            'response': result['response'],
+            'filename': staged['filename'],
+            'filepath': staged['path'],
+            'sha256': staged['sha256'],
+            'chunks': result['chunks'],
+            'cached': result['cached']
+        })
+    except Exception as e:
+        return JSONResponse({'status': 'error', 'message': f'❌ 分析失败: {str(e)}'})
+
+
+@timed('/api/stream/<session_id>')
+async def api_stream(request: Request):
+    """服务器发送事件 (SSE) 端点，用于实时输出内容"""
+    session_id = request.path_params['session_id']
+
+    async def event_stream():
+        # 初始化会话消息
+        await run_sync(state_store.ensure, session_id)
+        wakeup = notifier.subscribe(session_id)
+
+        active_streams = registry.gauge('sse_active_connections', 'Open SSE streams')
+        active_streams.inc()
+        try:
+            # 发送初始消息
+            yield 'data: {"type": "info", "message": "开始分析..."}\n\n'
+
+            # 持续发送消息(服务退出时结束)
+            cursor = 0
+            while not shutdown_event.is_set():
+                # 状态存储读取是阻塞的(SQLite),放到线程池中执行
+                messages, cursor = await run_sync(state_store.read, session_id, cursor)
+                for msg in messages:
+                    yield 'data: ' + json.dumps({"type": "message", "message": msg}, ensure_ascii=False) + '\n\n'
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), STREAM_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # 客户端断开时生成器被取消
+            notifier.unsubscribe(session_id, wakeup)
+            active_streams.dec()
+
+    return StreamingResponse(event_stream(), media_type='text/event-stream')
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # arun 和 run_sync 使用事件循环的默认线程池
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix='analysis')
+    )
+    yield
+    shutdown_event.set()
+
+
+app = Starlette(
+    routes=[
+        Route('/api/run', api_run, methods=['POST']),
+        Route('/api/analyze-my-flask-app', api_analyze_my_flask_app, methods=['POST']),
+        Route('/api/upload', api_upload, methods=['POST']),
+        Route('/api/stream/{session_id}', api_stream),
+        Mount('/', app=WSGIMiddleware(web_app.app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="代码库维护助手 Web 服务(ASGI)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    args = parser.parse_args()
+
+    class Server(uvicorn.Server):
+        def handle_exit(self, sig, frame):
+            # 先结束 SSE 流,否则 uvicorn 会一直等到优雅退出超时
+            shutdown_event.set()
+            super().handle_exit(sig, frame)
+
+    print(f"🚀 ASGI 服务启动: http://{args.host}:{args.port}")
+    config = uvicorn.Config(app, host=args.host, port=args.port, timeout_graceful_shutdown=args.graceful_timeout)
+    Server(config).run()
+
+
+if __name__ == '__main__':
+    main()
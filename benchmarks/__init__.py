@@ -0,0 +1 @@
+"""离线基准测试与压测工具"""
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+启动导入耗时检查
+
+在子进程中用 `python -X importtime` 导入 main 和 web_app,统计各自的累计导入耗时,
+并检查导入 main 时没有提前加载重量级依赖(hello_agents、numpy、tiktoken、asyncio),
+这些依赖应在第一次创建助手或第一次打分/计数时才加载。
+超出预算或提前加载了重量级依赖时以退出码 1 结束,可在 CI 中作为回归检查。
+
+用法:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 800 --repeat 5 --top 10
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 导入 main 时不应加载的模块
+DEFERRED_MODULES = ("hello_agents", "numpy", "tiktoken", "asyncio")
+
+# -X importtime 输出行: "import time:   self [us] |  cumulative | imported package"
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure(module: str) -> Tuple[Dict[str, int], List[Tuple[int, str]]]:
+    """导入一次 module,返回 (顶层模块名 -> 累计微秒, [(自身微秒, 模块名)])"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT, os.path.dirname(ROOT)] + ([env["PYTHONPATH"]] if env.get("PYTHONPATH") else [])
+    )
+    # 不启动代码库监听和后台任务,只测导入
+    env.setdefault("CODEBASE_WATCH", "off")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        tail = "\n".join(result.stderr.strip().splitlines()[-5:])
+        raise RuntimeError(f"导入 {module} 失败:\n{tail}")
+
+    cumulative: Dict[str, int] = {}
+    self_times = []
+    for line in result.stderr.splitlines():
+        m = IMPORTTIME_RE.match(line)
+        if not m:
+            continue
+        self_us, cumulative_us, indent, name = int(m.group(1)), int(m.group(2)), m.group(3), m.group(4)
+        self_times.append((self_us, name))
+        # 缩进为 1 个空格的是被直接导入的顶层模块
+        if len(indent) <= 1:
+            cumulative[name] = cumulative_us
+    return cumulative, self_times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="检查 main / web_app 的启动导入耗时")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="单个模块累计导入耗时上限(毫秒)")
+    parser.add_argument("--repeat", type=int, default=3, help="每个模块测量次数,取最小值")
+    parser.add_argument("--top", type=int, default=8, help="列出自身耗时最高的模块数")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'模块':<10} {'累计耗时(ms)':>14} {'预算(ms)':>10}")
+    for module in ("main", "web_app"):
+        runs = [measure(module) for _ in range(max(1, args.repeat))]
+        best_cumulative, best_self = min(runs, key=lambda r: r[0].get(module, 0))
+        total_ms = best_cumulative.get(module, 0) / 1000
+        over = total_ms > args.budget_ms
+        failed = failed or over
+        print(f"{module:<10} {total_ms:>14.1f} {args.budget_ms:>10.0f}{'  ❌ 超出预算' if over else ''}")
+        for self_us, name in sorted(best_self, reverse=True)[:args.top]:
+            print(f"    {self_us / 1000:>8.1f} ms  {name}")
+
+        if module == "main":
+            loaded = sorted({
+                name for _, name in best_self
+                if name.split(".")[0] in DEFERRED_MODULES
+            })
+            if loaded:
+                failed = True
+                print(f"❌ 导入 main 时提前加载了: {', '.join(loaded)}")
+
+    print("❌ 导入耗时检查未通过" if failed else "✅ 导入耗时检查通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Web API 压测工具
+
+基于 asyncio 的负载生成器,对 web_app 的 /api/run、/api/upload 和
+/api/stream/<session_id> 施加混合负载。LLM 由本地 Mock 服务替代,
+web_app 在独立子进程中运行,以便单独采样服务端 RSS。
+
+输出各接口的延迟分位数、错误率、并发打开的 SSE 连接数,以及服务端
+RSS 随时间的变化。
+
+用法:
+    python benchmarks/load_test.py --concurrency 50 --duration 30 --mix run=5,upload=1,stream=4
+    python benchmarks/load_test.py --codebase ./synthetic_repo --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(ROOT))
+
+from benchmarks.mock_llm_server import MockLLMServer, DEFAULT_RESPONSES
+
+DEFAULT_CODEBASE = os.path.join(ROOT, "my_flask_app")
+UPLOAD_SAMPLE = os.path.join(DEFAULT_CODEBASE, "app", "services", "order_service.py")
+UPLOAD_FILENAME = "loadtest_upload.py"
+RUN_PROMPTS = [
+    ("请探索 . 的代码结构", "explore"),
+    ("请分析代码质量", "analyze"),
+    ("根据当前进度,规划下一步任务", "plan"),
+    ("请执行批量工具检查", "auto"),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, int(len(values) * q / 100 + 0.5) - 1))]
+
+
+def _rss_mb(pid: int) -> float:
+    """读取 /proc/<pid>/status 中的 VmRSS(仅 Linux)"""
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+# === 最小 HTTP/1.1 客户端 ===
+
+async def http_request(
+    host: str,
+    port: int,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 120.0
+) -> Tuple[int, bytes]:
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host}:{port}", "Connection: close", f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body)
+        await writer.drain()
+        raw = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    head, _, payload = raw.partition(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1]) if head else 0
+    return status, payload
+
+
+async def post_json(host: str, port: int, path: str, payload: Dict) -> Tuple[int, Dict]:
+    status, body = await http_request(
+        host, port, "POST", path,
+        json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        {"Content-Type": "application/json"}
+    )
+    try:
+        return status, json.loads(body or b"{}")
+    except ValueError:
+        return status, {}
+
+
+def _multipart(filename: str, content: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+        "Content-Type: text/x-python\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class LoadStats:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.requests: Dict[str, int] = {}
+        self.open_streams = 0
+        self.max_open_streams = 0
+        self.stream_messages = 0
+        self.timeline: List[Dict[str, float]] = []
+
+    def record(self, endpoint: str, seconds: float, ok: bool):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+
+class LoadTester:
+    def __init__(self, host: str, port: int, stream_hold: float, codebase: str = DEFAULT_CODEBASE):
+        self.host = host
+        self.port = port
+        self.stream_hold = stream_hold
+        self.codebase = codebase
+        self.stats = LoadStats()
+        with open(UPLOAD_SAMPLE, "rb") as f:
+            self.upload_content = f.read()
+
+    async def do_run(self):
+        prompt, mode = random.choice(RUN_PROMPTS)
+        start = time.perf_counter()
+        try:
+            status, data = await post_json(self.host, self.port, "/api/run", {"user_input": prompt, "mode": mode})
+            ok = status == 200 and data.get("status") == "success"
+        except Exception:
+            ok = False
+        self.stats.record("run", time.perf_counter() - start, ok)
+
+    async def do_upload(self):
+        # 追加唯一注释, 避免命中按内容哈希缓存的分析结果
+        content = self.upload_content + f"\n# load-test {uuid.uuid4().hex}\n".encode("utf-8")
+        body, content_type = _multipart(UPLOAD_FILENAME, content)
+        start = time.perf_counter()
+        try:
+            status, raw = await http_request(self.host, self.port, "POST", "/api/upload", body, {"Content-Type": content_type})
+            ok = status == 200 and json.loads(raw or b"{}").get("status") == "success"
+        except Exception:
+            ok = False
+        self.stats.record("upload", time.perf_counter() - start, ok)
+
+    async def do_stream(self):
+        """打开 SSE 连接,保持 stream_hold 秒,记录首条事件延迟"""
+        session_id = f"load_{uuid.uuid4().hex[:8]}"
+        start = time.perf_counter()
+        first_event = None
+        writer = None
+        self.stats.open_streams += 1
+        self.stats.max_open_streams = max(self.stats.max_open_streams, self.stats.open_streams)
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            writer.write(
+                f"GET /api/stream/{session_id} HTTP/1.1\r\nHost: {self.host}\r\nAccept: text/event-stream\r\n\r\n".encode()
+            )
+            await writer.drain()
+            deadline = start + self.stream_hold
+            while time.perf_counter() < deadline:
+                line = await asyncio.wait_for(reader.readline(), max(0.01, deadline - time.perf_counter()))
+                if not line:
+                    break
+                if line.startswith(b"data:"):
+                    self.stats.stream_messages += 1
+                    if first_event is None:
+                        first_event = time.perf_counter() - start
+            ok = first_event is not None
+        except asyncio.TimeoutError:
+            ok = first_event is not None
+        except Exception:
+            ok = False
+        finally:
+            self.stats.open_streams -= 1
+            if writer:
+                writer.close()
+            await post_json(self.host, self.port, f"/api/clear-stream/{session_id}", {})
+        self.stats.record("stream", first_event if first_event is not None else time.perf_counter() - start, ok)
+
+    async def worker(self, mix: List[str], deadline: float):
+        actions = {"run": self.do_run, "upload": self.do_upload, "stream": self.do_stream}
+        while time.perf_counter() < deadline:
+            await actions[random.choice(mix)]()
+
+    async def sample(self, server_pid: int, deadline: float, interval: float):
+        start = time.perf_counter()
+        while time.perf_counter() < deadline:
+            self.stats.timeline.append({
+                "t": round(time.perf_counter() - start, 1),
+                "rss_mb": round(_rss_mb(server_pid), 1),
+                "open_streams": self.stats.open_streams,
+                "requests": sum(self.stats.requests.values())
+            })
+            await asyncio.sleep(interval)
+
+    async def run(self, concurrency: int, duration: float, mix: List[str], server_pid: int, sample_interval: float):
+        # 服务端工作目录是临时目录, 代码库必须传绝对路径
+        status, data = await post_json(self.host, self.port, "/api/init", {
+            "project_name": "loadtest", "codebase_path": self.codebase
+        })
+        if data.get("status") != "success":
+            raise RuntimeError(f"初始化助手失败: {data}")
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            self.sample(server_pid, deadline, sample_interval),
+            *(self.worker(mix, deadline) for _ in range(concurrency))
+        )
+
+
+def serve(port: int):
+    """子进程入口: 用多线程 WSGI 服务运行 web_app"""
+    from werkzeug.serving import make_server
+    import web_app
+
+    server = make_server("127.0.0.1", port, web_app.app, threaded=True)
+    server.serve_forever()
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"服务未在 {timeout}s 内启动")
+
+
+def parse_mix(text: str) -> List[str]:
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("run", "upload", "stream"):
+            raise ValueError(f"未知的负载类型: {name}")
+        mix.extend([name] * int(weight or 1))
+    return mix
+
+
+def report(stats: LoadStats, duration: float) -> Dict:
+    result = {"duration": duration, "endpoints": {}, "max_open_streams": stats.max_open_streams,
+              "stream_messages": stats.stream_messages, "timeline": stats.timeline}
+    print(f"\n{'接口':<8}{'请求':>8}{'错误率':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'QPS':>8}")
+    for endpoint, latencies in sorted(stats.latencies.items()):
+        total = stats.requests[endpoint]
+        errors = stats.errors.get(endpoint, 0)
+        row = {
+            "requests": total,
+            "error_rate": round(errors / total, 4),
+            "p50": round(_percentile(latencies, 50), 4),
+            "p95": round(_percentile(latencies, 95), 4),
+            "p99": round(_percentile(latencies, 99), 4),
+            "qps": round(total / duration, 2)
+        }
+        result["endpoints"][endpoint] = row
+        print(f"{endpoint:<8}{total:>8}{row['error_rate']:>8.1%}{row['p50']*1000:>10.1f}"
+              f"{row['p95']*1000:>10.1f}{row['p99']*1000:>10.1f}{row['qps']:>8.2f}")
+    rss = [s["rss_mb"] for s in stats.timeline if s["rss_mb"]]
+    if rss:
+        print(f"\n服务端 RSS: 起始 {rss[0]:.1f} MB, 峰值 {max(rss):.1f} MB, 结束 {rss[-1]:.1f} MB")
+    print(f"SSE 最大并发连接: {stats.max_open_streams}, 收到事件: {stats.stream_messages}")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="web_app 压测工具")
+    parser.add_argument("--concurrency", type=int, default=20, help="并发客户端数")
+    parser.add_argument("--duration", type=float, default=20.0, help="压测时长(秒)")
+    parser.add_argument("--mix", default="run=5,upload=1,stream=4", help="负载配比")
+    parser.add_argument("--stream-hold", type=float, default=5.0, help="每个 SSE 连接保持时长(秒)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock LLM 延迟(秒)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="RSS 采样间隔(秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--codebase", default=DEFAULT_CODEBASE, help="被分析的代码库目录(如合成代码库)")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--serve", type=int, metavar="PORT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    codebase = os.path.abspath(args.codebase)
+    if not os.path.isdir(codebase):
+        parser.error(f"代码库目录不存在: {codebase}")
+    random.seed(args.seed)
+    mix = parse_mix(args.mix)
+    port = _free_port()
+    workdir = tempfile.mkdtemp(prefix="loadtest_")
+
+    with MockLLMServer(latency=args.llm_latency, responses_path=DEFAULT_RESPONSES) as llm_server:
+        env = dict(
+            os.environ,
+            LLM_BASE_URL=llm_server.base_url,
+            LLM_API_KEY="mock",
+            LLM_MODEL_ID="mock",
+            MEMORY_CONSOLIDATION_INTERVAL="0",
+            PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.path.dirname(ROOT), os.environ.get("PYTHONPATH")]))
+        )
+        server = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", str(port)],
+            cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_for_port(port)
+            print(f"🚀 压测开始: {args.concurrency} 并发, {args.duration}s, 配比 {args.mix}")
+            tester = LoadTester("127.0.0.1", port, args.stream_hold, codebase)
+            asyncio.run(tester.run(args.concurrency, args.duration, mix, server.pid, args.sample_interval))
+            result = report(tester.stats, args.duration)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+            # 上传暂存区(runtime_data/uploads)位于临时工作目录中,一并清理
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"📄 结果已保存: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
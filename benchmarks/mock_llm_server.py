@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的 LLM 桩服务
+
+用于离线基准测试和压测: 实现 POST .../chat/completions(含 stream=true 的 SSE),
+按最后一条用户消息匹配录制好的回答,支持可配置的首 token 延迟和逐块延迟。
+
+用法:
+    python benchmarks/mock_llm_server.py --port 8765 --latency 0.2 --responses benchmarks/recorded_responses.json
+
+然后设置:
+    LLM_BASE_URL=http://127.0.0.1:8765/v1 LLM_API_KEY=mock LLM_MODEL_ID=mock
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recorded_responses.json")
+DEFAULT_REPLY = "已完成分析，未发现需要立即处理的事项。"
+
+
+class ResponseBook:
+    """录制的回答: [{"match": "子串", "response": "..."}],按顺序匹配,未命中用 default"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.entries: List[Dict[str, str]] = []
+        self.default = DEFAULT_REPLY
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("responses", [])
+            self.default = data.get("default", DEFAULT_REPLY)
+
+    def lookup(self, messages: List[Dict[str, str]]) -> str:
+        user_text = ""
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                user_text = message.get("content") or ""
+                break
+        for entry in self.entries:
+            if entry["match"] in user_text:
+                return entry["response"]
+        return self.default
+
+
+def _chunks(text: str, size: int) -> List[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+def make_handler(book: ResponseBook, latency: float, chunk_latency: float, chunk_size: int, stats: Dict[str, int]):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _json(self, status: int, payload: Dict):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request.get("messages", [])
+            reply = book.lookup(messages)
+            prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+            completion_tokens = len(reply) // 4
+            stats["requests"] = stats.get("requests", 0) + 1
+
+            time.sleep(latency)
+            completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            created = int(time.time())
+            model = request.get("model", "mock")
+
+            if not request.get("stream"):
+                self._json(200, {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens
+                    }
+                })
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for piece in _chunks(reply, chunk_size):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if chunk_latency:
+                    time.sleep(chunk_latency)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+            }
+            self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+class MockLLMServer:
+    """在后台线程中运行的桩服务"""
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        chunk_latency: float = 0.0,
+        chunk_size: int = 16,
+        responses_path: Optional[str] = DEFAULT_RESPONSES
+    ):
+        self.stats: Dict[str, int] = {}
+        handler = make_handler(ResponseBook(responses_path), latency, chunk_latency, chunk_size, self.stats)
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 LLM 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="首 token 前的延迟(秒)")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="流式输出每块之间的延迟(秒)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="流式输出每块字符数")
+    parser.add_argument("--responses", default=DEFAULT_RESPONSES, help="录制回答 JSON 文件")
+    args = parser.parse_args()
+
+    server = MockLLMServer(args.host, args.port, args.latency, args.chunk_latency, args.chunk_size, args.responses)
+    print(f"🧪 Mock LLM 服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+CodebaseMaintainer 离线基准测试
+
+对本地 Mock LLM 服务回放固定场景(探索/分析/规划/上传/单文件分析/密集工具调用),
+输出每个场景的分阶段耗时、吞吐量和内存占用,结果可保存为 JSON
+并与基线对比,便于离线和 CI 中比较改动前后的性能。
+
+用法:
+    python benchmarks/run_benchmarks.py --iterations 5 --latency 0.05 --output bench.json
+    python benchmarks/run_benchmarks.py --compare bench.json --threshold 0.2
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.dirname(ROOT))
+
+from benchmarks.mock_llm_server import MockLLMServer, DEFAULT_RESPONSES
+
+DEFAULT_CODEBASE = os.path.join(ROOT, "my_flask_app")
+UPLOAD_SAMPLE = os.path.join(DEFAULT_CODEBASE, "app", "services", "order_service.py")
+
+
+def _rss_mb() -> float:
+    """进程峰值常驻内存(MB),不支持的平台返回 0"""
+    try:
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB, macOS 为字节
+        return usage / 1024 / (1024 if sys.platform == "darwin" else 1)
+    except ImportError:
+        return 0.0
+
+
+def _upload_prompt() -> str:
+    with open(UPLOAD_SAMPLE, "r", encoding="utf-8") as f:
+        content = f.read()
+    return f"请分析以下代码文件的质量和潜在问题：\n\n文件名: order_service.py\n\n代码内容:\n```python\n{content}\n```"
+
+
+SCENARIOS: Dict[str, Callable[[Any], str]] = {
+    "explore": lambda m: m.explore(),
+    "analyze": lambda m: m.analyze(),
+    "plan": lambda m: m.plan_next_steps(),
+    "upload": lambda m: m.run(_upload_prompt()),
+    "upload_file": lambda m: m.analyze_file(_upload_prompt()),
+    "tool_heavy": lambda m: m.run("请执行批量工具检查,确认项目结构", mode="auto"),
+}
+
+
+def run_scenario(name: str, base_url: str, codebase_path: str, iterations: int) -> Dict[str, Any]:
+    """在独立的临时工作目录中运行一个场景"""
+    from hello_agents import HelloAgentsLLM
+    from main import CodebaseMaintainer
+
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        llm = HelloAgentsLLM(model="mock", api_key="mock", base_url=base_url, timeout=30)
+        tracemalloc.start()
+        setup_start = time.perf_counter()
+        maintainer = CodebaseMaintainer(project_name=f"bench_{name}", codebase_path=codebase_path, llm=llm)
+        setup_seconds = time.perf_counter() - setup_start
+
+        turn_seconds: List[float] = []
+        wall_start = time.perf_counter()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            SCENARIOS[name](maintainer)
+            turn_seconds.append(time.perf_counter() - start)
+        wall = time.perf_counter() - wall_start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        stats = maintainer.get_stats()
+        turn_seconds.sort()
+        return {
+            "iterations": iterations,
+            "setup_seconds": round(setup_seconds, 6),
+            "turn_p50": round(turn_seconds[len(turn_seconds) // 2], 6),
+            "turn_max": round(turn_seconds[-1], 6),
+            "throughput_per_second": round(iterations / wall, 3) if wall else 0.0,
+            "python_peak_mb": round(peak / 1024 / 1024, 3),
+            "rss_peak_mb": round(_rss_mb(), 1),
+            "stages": stats["latency"],
+            "tokens": stats["tokens"],
+        }
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """对比 turn_p50,返回超过阈值的回归描述"""
+    regressions = []
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not base.get("turn_p50"):
+            continue
+        change = (result["turn_p50"] - base["turn_p50"]) / base["turn_p50"]
+        marker = "⚠️" if change > threshold else "  "
+        print(f"{marker} {name:<12} p50 {base['turn_p50']*1000:8.1f}ms -> {result['turn_p50']*1000:8.1f}ms ({change:+.1%})")
+        if change > threshold:
+            regressions.append(f"{name}: {change:+.1%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CodebaseMaintainer 离线基准测试")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔的场景名")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mock LLM 首 token 延迟(秒)")
+    parser.add_argument("--chunk-latency", type=float, default=0.0)
+    parser.add_argument("--responses", default=DEFAULT_RESPONSES)
+    parser.add_argument("--codebase", default=DEFAULT_CODEBASE)
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--compare", help="基线结果 JSON,用于回归对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="回归阈值(相对变化)")
+    args = parser.parse_args()
+
+    # 基准测试不需要后台记忆整理线程
+    os.environ.setdefault("MEMORY_CONSOLIDATION_INTERVAL", "0")
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"iterations": args.iterations, "latency": args.latency, "chunk_latency": args.chunk_latency},
+        "scenarios": {}
+    }
+    with MockLLMServer(latency=args.latency, chunk_latency=args.chunk_latency, responses_path=args.responses) as server:
+        for name in names:
+            print(f"⏱️ 运行场景: {name}")
+            results["scenarios"][name] = run_scenario(name, server.base_url, os.path.abspath(args.codebase), args.iterations)
+        results["llm_requests"] = server.stats.get("requests", 0)
+
+    print(f"\n{'场景':<12}{'p50(ms)':>10}{'max(ms)':>10}{'轮/秒':>8}{'峰值MB':>9}  主要阶段")
+    for name, r in results["scenarios"].items():
+        top = sorted(
+            ((stage, s["p50"]) for stage, s in r["stages"].items() if stage != "total"),
+            key=lambda kv: -kv[1]
+        )[:3]
+        top_str = ", ".join(f"{stage}={p50*1000:.1f}ms" for stage, p50 in top)
+        print(f"{name:<12}{r['turn_p50']*1000:>10.1f}{r['turn_max']*1000:>10.1f}"
+              f"{r['throughput_per_second']:>8.2f}{r['python_peak_mb']:>9.2f}  {top_str}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n📄 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print("\n📊 与基线对比:")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ 性能回归: {'; '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
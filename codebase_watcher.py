@@ -0,0 +1,543 @@
+"""
+代码库文件监听
+
+监听 codebase_path 下的文件变更(Linux 上用 inotify,其他平台或 inotify 不可用时轮询),
+去抖后把实际发生的变更 {相对路径: "added"|"modified"|"deleted"} 批量推送给订阅者:
+
+- FileIndex: 路径 -> (大小, mtime),同时负责过滤掉内容未变的事件
+- SymbolIndex: 路径 -> 函数/类/方法定义,符号名 -> 定义位置
+- 维护助手的预处理(工具结果)缓存和笔记关联(NoteLinks)
+
+索引只在启动时全量构建一次,之后每批变更只处理变更的路径。
+轮询模式每次仍需 stat 全部文件,只作为兜底。
+
+环境变量:
+    CODEBASE_WATCH: auto(默认) | inotify | poll | off
+    CODEBASE_WATCH_DEBOUNCE: 去抖间隔(秒,默认 0.3)
+    CODEBASE_POLL_INTERVAL: 轮询间隔(秒,默认 2)
+"""
+
+import ast
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import stat
+import struct
+import sys
+import threading
+import time
+import weakref
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from metrics import registry
+
+CODEBASE_WATCH = os.getenv("CODEBASE_WATCH", "auto").lower()
+WATCH_DEBOUNCE = float(os.getenv("CODEBASE_WATCH_DEBOUNCE", "0.3"))
+POLL_INTERVAL = float(os.getenv("CODEBASE_POLL_INTERVAL", "2"))
+# 持续有事件时最长延迟多久推送一次
+MAX_BATCH_DELAY = 2.0
+# 超过该大小的 .py 文件不解析符号
+MAX_PARSE_BYTES = 1024 * 1024
+
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", "venv", ".venv", ".mypy_cache", ".pytest_cache"}
+IGNORED_SUFFIXES = (".pyc", ".pyo", ".swp", ".swx", ".tmp", "~")
+
+# 笔记中可能引用的代码文件
+NOTE_REF_RE = re.compile(r"[\w./\\-]+\.(?:py|html|js|css|sql)\b")
+
+# inotify 常量(linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+Changes = Dict[str, str]
+
+
+def _ignored_dir(name: str) -> bool:
+    return name in IGNORED_DIRS or name.startswith(".")
+
+
+def _ignored_file(name: str) -> bool:
+    return name.startswith(".#") or name.endswith(IGNORED_SUFFIXES)
+
+
+def _ignored_path(rel_path: str) -> bool:
+    parts = rel_path.split("/")
+    return any(_ignored_dir(p) for p in parts[:-1]) or _ignored_file(parts[-1])
+
+
+def scan_tree(root: str, rel_dir: str = "") -> Dict[str, Tuple[int, int]]:
+    """遍历目录,返回 {相对路径: (大小, mtime_ns)}"""
+    entries = {}
+    base = os.path.join(root, rel_dir) if rel_dir else root
+    for dirpath, dirnames, filenames in os.walk(base):
+        dirnames[:] = [d for d in dirnames if not _ignored_dir(d)]
+        rel = os.path.relpath(dirpath, root).replace(os.sep, "/")
+        prefix = "" if rel == "." else rel + "/"
+        for name in filenames:
+            if _ignored_file(name):
+                continue
+            try:
+                st = os.stat(os.path.join(dirpath, name))
+            except OSError:
+                continue
+            entries[prefix + name] = (st.st_size, st.st_mtime_ns)
+    return entries
+
+
+class FileIndex:
+    """文件清单: 路径 -> (大小, mtime_ns)"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[int, int]] = scan_tree(root)
+
+    def apply(self, paths: Set[str]) -> Changes:
+        """按路径重新 stat,返回实际发生的变更"""
+        changes = {}
+        with self._lock:
+            for path in paths:
+                try:
+                    st = os.stat(os.path.join(self.root, path))
+                    signature = (st.st_size, st.st_mtime_ns) if stat.S_ISREG(st.st_mode) else None
+                except OSError:
+                    signature = None
+                old = self._entries.get(path)
+                if signature is None:
+                    if old is not None:
+                        del self._entries[path]
+                        changes[path] = "deleted"
+                elif old is None:
+                    self._entries[path] = signature
+                    changes[path] = "added"
+                elif old != signature:
+                    self._entries[path] = signature
+                    changes[path] = "modified"
+        return changes
+
+    def resync(self) -> Changes:
+        """全量扫描并与当前清单比较(轮询模式和 inotify 队列溢出时使用)"""
+        current = scan_tree(self.root)
+        with self._lock:
+            paths = set(current) | set(self._entries)
+        return self.apply(paths)
+
+    def under(self, rel_dir: str) -> List[str]:
+        """某个目录下已登记的文件"""
+        prefix = rel_dir.rstrip("/") + "/"
+        with self._lock:
+            return [p for p in self._entries if p.startswith(prefix)]
+
+    def files(self, suffix: str = "") -> List[str]:
+        with self._lock:
+            return sorted(p for p in self._entries if p.endswith(suffix))
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def parse_symbols(source: str) -> List[Tuple[str, str, int]]:
+    """提取顶层函数/类和类方法: [(限定名, 类型, 行号)]"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    symbols = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            symbols.append((node.name, "function", node.lineno))
+        elif isinstance(node, ast.ClassDef):
+            symbols.append((node.name, "class", node.lineno))
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    symbols.append((f"{node.name}.{item.name}", "method", item.lineno))
+    return symbols
+
+
+class SymbolIndex:
+    """Python 符号索引,按变更路径增量更新"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._by_path: Dict[str, List[Tuple[str, str, int]]] = {}
+        self._by_name: Dict[str, Set[str]] = {}
+
+    def build(self, paths: List[str]):
+        self.apply({p: "added" for p in paths})
+
+    def _parse(self, path: str) -> List[Tuple[str, str, int]]:
+        full_path = os.path.join(self.root, path)
+        try:
+            if os.path.getsize(full_path) > MAX_PARSE_BYTES:
+                return []
+            with open(full_path, "r", encoding="utf-8", errors="replace") as f:
+                return parse_symbols(f.read())
+        except OSError:
+            return []
+
+    def apply(self, changes: Changes):
+        for path, kind in changes.items():
+            if not path.endswith(".py"):
+                continue
+            symbols = [] if kind == "deleted" else self._parse(path)
+            with self._lock:
+                for name, _, _ in self._by_path.pop(path, []):
+                    paths = self._by_name.get(name.rsplit(".", 1)[-1])
+                    if paths:
+                        paths.discard(path)
+                        if not paths:
+                            del self._by_name[name.rsplit(".", 1)[-1]]
+                if symbols:
+                    self._by_path[path] = symbols
+                    for name, _, _ in symbols:
+                        self._by_name.setdefault(name.rsplit(".", 1)[-1], set()).add(path)
+
+    def lookup(self, name: str) -> List[Dict[str, object]]:
+        """按名称(函数名、类名、方法名或 类.方法)查找定义"""
+        short = name.rsplit(".", 1)[-1]
+        with self._lock:
+            paths = sorted(self._by_name.get(short, ()))
+            return [
+                {"name": qualname, "kind": kind, "path": path, "line": line}
+                for path in paths
+                for qualname, kind, line in self._by_path.get(path, [])
+                if qualname == name or qualname.rsplit(".", 1)[-1] == name
+            ]
+
+    def symbols(self, path: str) -> List[Tuple[str, str, int]]:
+        with self._lock:
+            return list(self._by_path.get(path, []))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(s) for s in self._by_path.values())
+
+
+class NoteLinks:
+    """笔记 -> 笔记中引用的代码文件,关联文件变更后把笔记标记为可能过期"""
+
+    def __init__(self, workspace: str):
+        self.workspace = workspace
+        self._lock = threading.Lock()
+        self._refs: Dict[str, Set[str]] = {}
+        # 文件名 -> {(笔记ID, 引用路径)},按变更文件名定位笔记,不用遍历全部笔记
+        self._by_basename: Dict[str, Set[Tuple[str, str]]] = {}
+        self._stale: Dict[str, Set[str]] = {}
+        self.rebuild()
+
+    @staticmethod
+    def _extract(text: str) -> Set[str]:
+        return {re.sub(r"^(?:\./)+", "", ref.replace("\\", "/")) for ref in NOTE_REF_RE.findall(text)}
+
+    def _set_refs(self, note_id: str, refs: Set[str]):
+        for ref in self._refs.pop(note_id, set()):
+            links = self._by_basename.get(ref.rsplit("/", 1)[-1])
+            if links:
+                links.discard((note_id, ref))
+        if refs:
+            self._refs[note_id] = refs
+            for ref in refs:
+                self._by_basename.setdefault(ref.rsplit("/", 1)[-1], set()).add((note_id, ref))
+
+    def _read_note(self, note_id: str) -> Set[str]:
+        try:
+            with open(os.path.join(self.workspace, f"{note_id}.md"), "r", encoding="utf-8") as f:
+                return self._extract(f.read())
+        except OSError:
+            return set()
+
+    def rebuild(self):
+        """扫描笔记目录重建引用索引"""
+        note_ids = []
+        if os.path.isdir(self.workspace):
+            note_ids = [
+                name[:-3] for name in sorted(os.listdir(self.workspace))
+                if name.startswith("note_") and name.endswith(".md")
+            ]
+        refs = {note_id: self._read_note(note_id) for note_id in note_ids}
+        with self._lock:
+            self._refs, self._by_basename = {}, {}
+            for note_id, note_refs in refs.items():
+                self._set_refs(note_id, note_refs)
+
+    def update_note(self, note_id: str):
+        """笔记新建或改写后重新读取引用,并清除过期标记"""
+        refs = self._read_note(note_id)
+        with self._lock:
+            self._set_refs(note_id, refs)
+            self._stale.pop(note_id, None)
+
+    def on_changes(self, changes: Changes):
+        with self._lock:
+            for path in changes:
+                for note_id, ref in self._by_basename.get(path.rsplit("/", 1)[-1], ()):
+                    # 引用可能是相对路径片段,也可能是包含代码库路径的完整路径
+                    if ref == path or ref.endswith("/" + path) or path.endswith("/" + ref):
+                        self._stale.setdefault(note_id, set()).add(path)
+
+    def stale_files(self, note_id: str) -> List[str]:
+        with self._lock:
+            return sorted(self._stale.get(note_id, ()))
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class CodebaseWatcher:
+    """监听代码库目录并维护文件/符号索引的守护线程"""
+
+    def __init__(
+        self,
+        root: str,
+        backend: str = CODEBASE_WATCH,
+        debounce: float = WATCH_DEBOUNCE,
+        poll_interval: float = POLL_INTERVAL
+    ):
+        self.root = os.path.abspath(root)
+        self.requested_backend = backend
+        self.backend: Optional[str] = None
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.files: Optional[FileIndex] = None
+        self.symbols = SymbolIndex(self.root)
+        self.started_at: Optional[float] = None
+        self._subscribers: List[Callable[[], Optional[Callable[[Changes], None]]]] = []
+        self._subscribers_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._libc = None
+        self._fd = -1
+        self._wds: Dict[int, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive() and self._ready.is_set())
+
+    def subscribe(self, callback: Callable[[Changes], None]):
+        """订阅变更;绑定方法按弱引用保存,助手实例被回收后自动退订"""
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+        with self._subscribers_lock:
+            self._subscribers.append(ref)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="codebase-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待初始索引构建完成"""
+        return self._ready.wait(timeout)
+
+    # ------------------------------------------------------------------
+    # 主循环
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        try:
+            # 先建立监听再扫描,扫描期间发生的变更会在之后重复应用一次(幂等)
+            self.backend = "poll"
+            if self.requested_backend in ("auto", "inotify"):
+                self._libc = _load_libc()
+                if self._libc and self._init_inotify():
+                    self.backend = "inotify"
+                elif self.requested_backend == "inotify":
+                    print("[WARNING] inotify 不可用, 改为轮询监听代码库")
+            start = time.perf_counter()
+            self.files = FileIndex(self.root)
+            self.symbols.build(self.files.files(".py"))
+            self.started_at = time.time()
+            self._ready.set()
+            print(
+                f"👀 代码库监听已启动 ({self.backend}): {len(self.files)} 个文件, "
+                f"{len(self.symbols)} 个符号 ({(time.perf_counter() - start) * 1000:.0f}ms)"
+            )
+            if self.backend == "inotify":
+                self._inotify_loop()
+            else:
+                self._poll_loop()
+        except Exception as e:
+            print(f"[WARNING] 代码库监听失败: {e}")
+        finally:
+            self._ready.set()
+            if self._fd >= 0:
+                os.close(self._fd)
+                self._fd = -1
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            changes = self.files.resync()
+            if changes:
+                self._dispatch(changes)
+
+    def _inotify_loop(self):
+        pending: Set[str] = set()
+        first_event = last_event = 0.0
+        while not self._stop.is_set():
+            timeout = self.debounce if pending else 1.0
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+            now = time.monotonic()
+            if readable:
+                try:
+                    data = os.read(self._fd, 64 * 1024)
+                except BlockingIOError:
+                    data = b""
+                if data:
+                    if self._handle_events(data, pending):
+                        # 内核事件队列溢出: 丢弃零散事件,全量比对一次
+                        pending.clear()
+                        self._add_watches("")
+                        changes = self.files.resync()
+                        if changes:
+                            self._dispatch(changes)
+                        continue
+                    if not first_event:
+                        first_event = now
+                    last_event = now
+            if pending and (now - last_event >= self.debounce or now - first_event >= MAX_BATCH_DELAY):
+                changes = self.files.apply(pending)
+                pending = set()
+                first_event = 0.0
+                if changes:
+                    self._dispatch(changes)
+
+    def _dispatch(self, changes: Changes):
+        self.symbols.apply(changes)
+        registry.counter(
+            "codebase_watch_changes_total", "File changes seen by the codebase watcher",
+            labels={"backend": self.backend}
+        ).inc(len(changes))
+        with self._subscribers_lock:
+            self._subscribers = [ref for ref in self._subscribers if ref() is not None]
+            callbacks = [ref() for ref in self._subscribers]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(changes)
+            except Exception as e:
+                print(f"[WARNING] 代码库变更通知失败: {e}")
+
+    # ------------------------------------------------------------------
+    # inotify
+    # ------------------------------------------------------------------
+
+    def _init_inotify(self) -> bool:
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return False
+        self._fd = fd
+        if not self._add_watches(""):
+            os.close(fd)
+            self._fd = -1
+            self._wds = {}
+            return False
+        return True
+
+    def _add_watches(self, rel_dir: str) -> bool:
+        """递归监听目录(对已监听的目录返回同一个 wd)"""
+        base = os.path.join(self.root, rel_dir) if rel_dir else self.root
+        for dirpath, dirnames, _ in os.walk(base):
+            dirnames[:] = [d for d in dirnames if not _ignored_dir(d)]
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                if dirpath == base and rel_dir:
+                    # 目录已被删除或移走,后续事件会处理
+                    continue
+                print(f"[WARNING] 无法监听目录 {dirpath}: {os.strerror(errno)}")
+                return False
+            rel = os.path.relpath(dirpath, self.root).replace(os.sep, "/")
+            self._wds[wd] = "" if rel == "." else rel
+        return True
+
+    def _remove_watches(self, rel_dir: str):
+        prefix = rel_dir + "/"
+        for wd, path in list(self._wds.items()):
+            if path == rel_dir or path.startswith(prefix):
+                self._libc.inotify_rm_watch(self._fd, wd)
+                self._wds.pop(wd, None)
+
+    def _handle_events(self, data: bytes, pending: Set[str]) -> bool:
+        """解析一批 inotify 事件,把受影响的文件路径加入 pending;队列溢出时返回 True"""
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0"))
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                return True
+            if mask & IN_IGNORED:
+                self._wds.pop(wd, None)
+                continue
+            parent = self._wds.get(wd)
+            if parent is None or not name:
+                continue
+            rel = f"{parent}/{name}" if parent else name
+
+            if mask & IN_ISDIR:
+                if _ignored_dir(name):
+                    continue
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录: 补上监听,并把监听建立前已写入的文件算作变更
+                    self._add_watches(rel)
+                    pending.update(scan_tree(self.root, rel))
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self._remove_watches(rel)
+                    pending.update(self.files.under(rel))
+            elif not _ignored_path(rel):
+                pending.add(rel)
+        return False
+
+
+_watchers: Dict[str, CodebaseWatcher] = {}
+_watchers_lock = threading.Lock()
+
+
+def get_codebase_watcher(codebase_path: str) -> Optional[CodebaseWatcher]:
+    """按目录共享监听线程;CODEBASE_WATCH=off 或目录不存在时返回 None"""
+    if CODEBASE_WATCH == "off" or not os.path.isdir(codebase_path):
+        return None
+    root = os.path.abspath(codebase_path)
+    with _watchers_lock:
+        watcher = _watchers.get(root)
+        if watcher is None:
+            watcher = CodebaseWatcher(root)
+            watcher.start()
+            _watchers[root] = watcher
+        return watcher
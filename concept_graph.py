@@ -0,0 +1,289 @@
+"""
+概念图邻接缓存
+
+concept_relationships 表的多跳遍历如果逐跳查询 SQL,每一跳都是一次
+数据库往返。这里在内存中维护 CSR 格式的邻接数组:
+    indptr[i] .. indptr[i+1] 为概念 i 的出边区间
+    indices[k] 为出边终点, weights[k] 为关系强度
+写入通过 add_edges 进入增量表,增量超过阈值后合并重建;
+其他连接(如 MemoryTool)写入的数据通过版本签名检测后整体重建。
+"""
+
+import heapq
+import threading
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from memory_store import MemoryStore
+
+SQL_GRAPH_VERSION = (
+    "SELECT (SELECT COUNT(*) FROM concept_relationships), "
+    "(SELECT MAX(created_at) FROM concept_relationships), "
+    "(SELECT COUNT(*) FROM concepts)"
+)
+SQL_GRAPH_EDGES = "SELECT from_concept_id, to_concept_id, strength FROM concept_relationships"
+
+
+class ConceptGraph:
+    """基于 CSR 数组的概念图"""
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        bidirectional: bool = True,
+        refresh_interval: float = 5.0,
+        max_delta: int = 256
+    ):
+        self.store = store
+        self.bidirectional = bidirectional
+        self.refresh_interval = refresh_interval
+        self.max_delta = max_delta
+
+        self._lock = threading.RLock()
+        self._ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self.indptr = array("i", [0])
+        self.indices = array("i")
+        self.weights = array("d")
+        self._delta: Dict[int, Dict[int, float]] = {}
+        self._delta_size = 0
+        self._concept_names: Dict[str, str] = {}
+        self._version: Optional[Tuple] = None
+        self._checked_at = 0.0
+
+        self.rebuild()
+
+    # === 构建与同步 ===
+
+    def _read_version(self) -> Tuple:
+        with self.store.pool.connection() as conn:
+            return tuple(conn.execute(SQL_GRAPH_VERSION).fetchone())
+
+    def _intern(self, concept_id: str) -> int:
+        idx = self._index.get(concept_id)
+        if idx is None:
+            idx = len(self._ids)
+            self._ids.append(concept_id)
+            self._index[concept_id] = idx
+        return idx
+
+    def rebuild(self):
+        """从数据库全量构建 CSR"""
+        with self.store.pool.connection() as conn:
+            edges = conn.execute(SQL_GRAPH_EDGES).fetchall()
+            names = conn.execute("SELECT id, name FROM concepts").fetchall()
+            version = tuple(conn.execute(SQL_GRAPH_VERSION).fetchone())
+
+        with self._lock:
+            self._ids = []
+            self._index = {}
+            adjacency: Dict[int, Dict[int, float]] = {}
+            for from_id, to_id, strength in edges:
+                self._add_to(adjacency, self._intern(from_id), self._intern(to_id), strength or 0.0)
+            self._compact(adjacency)
+            self._concept_names = {r[0]: r[1].lower() for r in names if r[1]}
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _add_to(self, adjacency: Dict[int, Dict[int, float]], src: int, dst: int, strength: float):
+        # 同一对概念多种关系类型时取最大强度
+        row = adjacency.setdefault(src, {})
+        row[dst] = max(row.get(dst, 0.0), strength)
+        if self.bidirectional:
+            row = adjacency.setdefault(dst, {})
+            row[src] = max(row.get(src, 0.0), strength)
+
+    def _compact(self, adjacency: Dict[int, Dict[int, float]]):
+        """邻接表 -> CSR,每行按强度降序,便于剪枝"""
+        n = len(self._ids)
+        indptr = array("i", [0]) * (n + 1)
+        indices = array("i")
+        weights = array("d")
+        for i in range(n):
+            row = adjacency.get(i)
+            if row:
+                for dst, strength in sorted(row.items(), key=lambda kv: -kv[1]):
+                    indices.append(dst)
+                    weights.append(strength)
+            indptr[i + 1] = len(indices)
+        self.indptr, self.indices, self.weights = indptr, indices, weights
+        self._delta = {}
+        self._delta_size = 0
+
+    def _merge_delta(self):
+        adjacency: Dict[int, Dict[int, float]] = {}
+        for i in range(len(self.indptr) - 1):
+            start, end = self.indptr[i], self.indptr[i + 1]
+            if start != end:
+                adjacency[i] = dict(zip(self.indices[start:end], self.weights[start:end]))
+        for src, row in self._delta.items():
+            target = adjacency.setdefault(src, {})
+            for dst, strength in row.items():
+                target[dst] = max(target.get(dst, 0.0), strength)
+        self._compact(adjacency)
+
+    def add_edges(self, edges: Iterable[Sequence], relationship_type: str = "related", persist: bool = True):
+        """写入关系并同步缓存
+
+        Args:
+            edges: (from_concept_id, to_concept_id, strength)
+            relationship_type: 关系类型
+            persist: 是否同时写入数据库
+        """
+        edges = list(edges)
+        if persist:
+            self.store.add_concept_relationships(
+                (src, dst, relationship_type, strength, None) for src, dst, strength in edges
+            )
+        with self._lock:
+            for src, dst, strength in edges:
+                self._add_to(self._delta, self._intern(src), self._intern(dst), strength)
+                self._delta_size += 1
+            if self._delta_size > self.max_delta:
+                self._merge_delta()
+            if persist:
+                self._version = self._read_version()
+
+    def refresh(self, force: bool = False):
+        """检测外部写入,版本变化时重建(最多每 refresh_interval 秒检查一次)"""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_interval:
+            return
+        self._checked_at = now
+        if self._read_version() != self._version:
+            self.rebuild()
+
+    # === 查询 ===
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _neighbors(self, idx: int):
+        if idx < len(self.indptr) - 1:
+            for k in range(self.indptr[idx], self.indptr[idx + 1]):
+                yield self.indices[k], self.weights[k]
+        delta = self._delta.get(idx)
+        if delta:
+            yield from delta.items()
+
+    def neighbors(self, concept_id: str) -> List[Tuple[str, float]]:
+        idx = self._index.get(concept_id)
+        if idx is None:
+            return []
+        return [(self._ids[d], w) for d, w in self._neighbors(idx)]
+
+    def k_hop(self, seeds: Iterable[str], k: int = 2) -> Dict[str, int]:
+        """k 跳邻域: 概念 -> 最短跳数"""
+        with self._lock:
+            frontier = [self._index[s] for s in seeds if s in self._index]
+            hops = {i: 0 for i in frontier}
+            for depth in range(1, k + 1):
+                next_frontier = []
+                for idx in frontier:
+                    for dst, _ in self._neighbors(idx):
+                        if dst not in hops:
+                            hops[dst] = depth
+                            next_frontier.append(dst)
+                frontier = next_frontier
+            return {self._ids[i]: h for i, h in hops.items()}
+
+    def expand(
+        self,
+        seeds: Dict[str, float],
+        k: int = 2,
+        decay: float = 0.7,
+        min_score: float = 0.05,
+        limit: int = 50
+    ) -> Dict[str, float]:
+        """按强度加权扩展
+
+        路径得分 = 种子得分 × Π(边强度 × decay),每个概念取最大路径得分,
+        使用最大堆优先扩展高分概念,低于 min_score 的路径直接剪枝。
+        """
+        with self._lock:
+            best: Dict[int, float] = {}
+            heap = []
+            for concept_id, score in seeds.items():
+                idx = self._index.get(concept_id)
+                if idx is not None and score > best.get(idx, 0.0):
+                    best[idx] = score
+                    heapq.heappush(heap, (-score, 0, idx))
+
+            while heap:
+                neg_score, depth, idx = heapq.heappop(heap)
+                score = -neg_score
+                if score < best.get(idx, 0.0) or depth >= k:
+                    continue
+                for dst, strength in self._neighbors(idx):
+                    new_score = score * strength * decay
+                    if new_score < min_score:
+                        continue
+                    if new_score > best.get(dst, 0.0):
+                        best[dst] = new_score
+                        heapq.heappush(heap, (-new_score, depth + 1, dst))
+
+            top = heapq.nlargest(limit, best.items(), key=lambda kv: kv[1])
+            return {self._ids[i]: s for i, s in top}
+
+    # === 记忆召回 ===
+
+    def match_concepts(self, text: str) -> Dict[str, float]:
+        """查询文本中出现的概念名 -> 种子概念"""
+        text = text.lower()
+        return {cid: 1.0 for cid, name in self._concept_names.items() if name in text}
+
+    def recall_memories(
+        self,
+        user_id: str,
+        query: str,
+        k: int = 2,
+        limit: int = 5
+    ) -> List[Dict]:
+        """基于概念图召回记忆,score = 概念扩展得分 × 关联度 × importance"""
+        self.refresh()
+        seeds = self.match_concepts(query)
+        if not seeds:
+            return []
+        concept_scores = self.expand(seeds, k=k)
+        if not concept_scores:
+            return []
+
+        placeholders = ",".join("?" * len(concept_scores))
+        with self.store.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT m.id, m.content, m.memory_type, m.timestamp, m.importance, "
+                "mc.concept_id, mc.relevance_score FROM memory_concepts mc "
+                "JOIN memories m ON m.id = mc.memory_id "
+                f"WHERE m.user_id = ? AND mc.concept_id IN ({placeholders})",
+                [user_id, *concept_scores.keys()]
+            ).fetchall()
+
+        memories: Dict[str, Dict] = {}
+        for r in rows:
+            score = concept_scores[r["concept_id"]] * (r["relevance_score"] or 1.0) * r["importance"]
+            current = memories.get(r["id"])
+            if current is None or score > current["score"]:
+                memories[r["id"]] = {
+                    "id": r["id"],
+                    "content": r["content"],
+                    "memory_type": r["memory_type"],
+                    "timestamp": r["timestamp"],
+                    "importance": r["importance"],
+                    "score": score
+                }
+        return sorted(memories.values(), key=lambda m: -m["score"])[:limit]
+
+
+_graphs: Dict[str, ConceptGraph] = {}
+_graphs_lock = threading.Lock()
+
+
+def get_concept_graph(store: MemoryStore) -> ConceptGraph:
+    """按连接池共享概念图缓存"""
+    with _graphs_lock:
+        graph = _graphs.get(store.pool.db_path)
+        if graph is None:
+            graph = ConceptGraph(store)
+            _graphs[store.pool.db_path] = graph
+        return graph
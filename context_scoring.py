@@ -0,0 +1,199 @@
+"""
+候选上下文打分与装箱
+
+对 PacketBatch 中的全部候选一次性打分:
+
+    score = W_SIMILARITY * 查询相似度 + W_RECENCY * 新近度 + W_PRIOR * 类型先验
+
+- 查询相似度: 查询特征(英文单词 + 中文二元组)被候选覆盖的比例,按 IDF 加权
+- 新近度: exp(-(now - timestamp) / RECENCY_TAU)
+- 类型先验: 候选写入批次时给出的相关性(如笔记类型 blocker 0.9、action 0.8)
+
+然后在 token 预算内最大化入选候选的总分(0/1 背包):
+候选不超过 EXACT_MAX_ITEMS 个时用按粒度量化的动态规划求解,否则按 分数/token 密度贪心装入,
+再用剩余预算补入放得下的候选。
+
+安装了 NumPy 时全部按数组运算(1 万个候选约数毫秒),否则退化为纯 Python 实现(只用贪心装箱)。
+"""
+
+import math
+import os
+import re
+import time
+from typing import List, Optional, Sequence
+
+# NumPy 导入约需 0.1 秒,第一次打分时才导入
+np = None
+_numpy_checked = False
+
+W_SIMILARITY = float(os.getenv("CONTEXT_W_SIMILARITY", "0.5"))
+W_RECENCY = float(os.getenv("CONTEXT_W_RECENCY", "0.2"))
+W_PRIOR = float(os.getenv("CONTEXT_W_PRIOR", "0.3"))
+# 新近度时间尺度(秒)
+RECENCY_TAU = float(os.getenv("CONTEXT_RECENCY_TAU", str(24 * 3600)))
+
+# 特征哈希空间
+FEATURE_BITS = 20
+FEATURE_MASK = (1 << FEATURE_BITS) - 1
+
+# 动态规划的候选数上限和容量量化步数
+EXACT_MAX_ITEMS = 256
+CAPACITY_STEPS = 512
+
+_WORD_RE = re.compile(r"[a-z_][a-z0-9_]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def _load_numpy():
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            np = None
+        _numpy_checked = True
+    return np
+
+
+def text_features(text: str) -> List[int]:
+    """英文单词 + 中文二元组的特征哈希(去重)"""
+    text = text.lower()
+    features = set(_WORD_RE.findall(text))
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            features.add(run)
+        else:
+            features.update(run[i:i + 2] for i in range(len(run) - 1))
+    return list({hash(f) & FEATURE_MASK for f in features})
+
+
+def score_batch(batch, query: str, now: Optional[float] = None):
+    """计算批次中每个候选的综合分数,返回与候选一一对应的序列"""
+    now = time.time() if now is None else now
+    query_features = text_features(query)
+    if _load_numpy() is None:
+        return _score_python(batch, query_features, now)
+
+    n = len(batch)
+    if n == 0:
+        return np.zeros(0)
+    priors = np.frombuffer(batch.scores, dtype=np.float64)
+    ages = np.maximum(now - np.frombuffer(batch.timestamps, dtype=np.float64), 0.0)
+    scores = W_PRIOR * priors + W_RECENCY * np.exp(-ages / RECENCY_TAU)
+
+    if query_features and len(batch.features):
+        query_ids = np.unique(np.asarray(query_features, dtype=np.int64))
+        feature_ids = np.frombuffer(batch.features, dtype=np.int64)
+        feature_rows = np.frombuffer(batch.feature_rows, dtype=np.int64)
+        # 查询特征查找表: 特征哈希 -> 查询特征序号 + 1(0 表示不在查询中)
+        lookup = np.zeros(FEATURE_MASK + 1, dtype=np.int32)
+        lookup[query_ids] = np.arange(1, len(query_ids) + 1, dtype=np.int32)
+        slots = lookup[feature_ids]
+        hit = slots > 0
+        hit_slots = slots[hit] - 1
+        # 每个查询特征出现在多少个候选中(特征在单个候选内已去重)
+        df = np.bincount(hit_slots, minlength=len(query_ids))
+        idf = np.log1p(n / (1.0 + df))
+        similarity = np.bincount(feature_rows[hit], weights=idf[hit_slots], minlength=n) / idf.sum()
+        scores += W_SIMILARITY * similarity
+    return scores
+
+
+def _score_python(batch, query_features: List[int], now: float) -> List[float]:
+    n = len(batch)
+    query = set(query_features)
+    rows = [set() for _ in range(n)]
+    if query:
+        for feature, row in zip(batch.features, batch.feature_rows):
+            if feature in query:
+                rows[row].add(feature)
+    df = {f: 0 for f in query}
+    for row in rows:
+        for f in row:
+            df[f] += 1
+    idf = {f: math.log1p(n / (1.0 + count)) for f, count in df.items()}
+    total_idf = sum(idf.values()) or 1.0
+
+    scores = []
+    for i in range(n):
+        recency = math.exp(-max(now - batch.timestamps[i], 0.0) / RECENCY_TAU)
+        similarity = sum(idf[f] for f in rows[i]) / total_idf
+        scores.append(W_SIMILARITY * similarity + W_RECENCY * recency + W_PRIOR * batch.scores[i])
+    return scores
+
+
+def pack(scores, tokens: Sequence[int], budget: int, min_score: float = 0.0) -> List[int]:
+    """在 budget 内选出总分最高的候选,按分数降序返回下标"""
+    if _load_numpy() is None:
+        return _pack_python(scores, tokens, budget, min_score)
+
+    scores = np.asarray(scores, dtype=np.float64)
+    tokens = np.asarray(tokens, dtype=np.int64)
+    candidates = np.flatnonzero((scores >= min_score) & (tokens <= budget) & (scores > 0))
+    if len(candidates) == 0 or budget <= 0:
+        return []
+
+    chosen = _pack_greedy(scores, tokens, candidates, budget)
+    if len(candidates) <= EXACT_MAX_ITEMS:
+        exact = _pack_exact(scores, tokens, candidates, budget)
+        if scores[exact].sum() > scores[chosen].sum():
+            chosen = exact
+    chosen = np.asarray(chosen, dtype=np.int64)
+    return chosen[np.argsort(-scores[chosen], kind="stable")].tolist()
+
+
+def _pack_greedy(scores, tokens, candidates, budget: int):
+    """按 分数/token 密度贪心装入,前缀装满后再补入剩余预算放得下的候选"""
+    density = scores[candidates] / np.maximum(tokens[candidates], 1)
+    order = candidates[np.argsort(-density, kind="stable")]
+    used = np.cumsum(tokens[order])
+    k = int(np.searchsorted(used, budget, side="right"))
+    chosen = order[:k].tolist()
+    remaining = budget - (int(used[k - 1]) if k else 0)
+    rest = order[k:]
+    for index in rest[tokens[rest] <= remaining].tolist():
+        if tokens[index] <= remaining:
+            chosen.append(index)
+            remaining -= int(tokens[index])
+    return chosen
+
+
+def _pack_exact(scores, tokens, candidates, budget: int):
+    """0/1 背包动态规划;token 按 budget / CAPACITY_STEPS 向上取整量化,结果一定不超预算"""
+    unit = max(1, -(-budget // CAPACITY_STEPS))
+    capacity = budget // unit
+    weights = np.maximum(-(-tokens[candidates] // unit), 1)
+    values = scores[candidates]
+    best = np.zeros(capacity + 1)
+    take = np.zeros((len(candidates), capacity + 1), dtype=bool)
+    for i, (w, v) in enumerate(zip(weights.tolist(), values.tolist())):
+        if w > capacity:
+            continue
+        with_item = best[:capacity + 1 - w] + v
+        better = with_item > best[w:]
+        take[i, w:] = better
+        best[w:] = np.where(better, with_item, best[w:])
+
+    chosen = []
+    c = int(np.argmax(best))
+    for i in range(len(candidates) - 1, -1, -1):
+        if take[i, c]:
+            chosen.append(int(candidates[i]))
+            c -= int(weights[i])
+    return chosen
+
+
+def _pack_python(scores, tokens, budget: int, min_score: float) -> List[int]:
+    candidates = [
+        i for i in range(len(scores))
+        if scores[i] >= min_score and scores[i] > 0 and tokens[i] <= budget
+    ]
+    candidates.sort(key=lambda i: -scores[i] / max(tokens[i], 1))
+    chosen = []
+    remaining = budget
+    for index in candidates:
+        if tokens[index] <= remaining:
+            chosen.append(index)
+            remaining -= tokens[index]
+    return sorted(chosen, key=lambda i: -scores[i])
@@ -0,0 +1,399 @@
+"""
+基于 git 历史的增量分析
+
+给定修订范围(如 "HEAD~1..HEAD" 或 "main"),直接从 git 对象库读取变更文件和 hunk
+(不检出工作区),只对变更区域及其在导入图中的直接依赖方做预处理、静态分析并生成上下文,
+使每次提交的分析成本与 diff 大小而不是仓库大小成正比。
+
+导入图按 blob 哈希缓存在 {cache_dir}/import_graph.json: 每次只重新解析内容变化的文件。
+"""
+
+import ast
+import json
+import os
+import re
+import subprocess
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from hello_agents.context import ContextPacket
+
+from token_accounting import count_tokens
+
+HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+TODO_RE = re.compile(r"\b(TODO|FIXME|XXX|HACK)\b")
+
+# 单个文件 diff 放入上下文的 token 上限
+DIFF_FILE_TOKENS = int(os.getenv("DIFF_FILE_TOKENS", "1200"))
+# 列出的依赖方上限
+MAX_DEPENDENTS = int(os.getenv("DIFF_MAX_DEPENDENTS", "20"))
+
+
+class GitError(Exception):
+    """git 命令失败或修订范围无效"""
+
+
+def parse_hunks(diff_text: str) -> Dict[str, List[Dict[str, Any]]]:
+    """解析 `git diff -U0` 输出,返回 {新路径: [{"old_start", "old_lines", "new_start", "new_lines", "lines"}]}
+
+    hunk 内的行按头部给出的行数消费完之前都属于该 hunk,
+    因此以 "++ " / "-- " 开头的新增或删除行不会被误认为文件头。
+    """
+    files: Dict[str, List[Dict[str, Any]]] = {}
+    current: Optional[List[Dict[str, Any]]] = None
+    hunk: Optional[Dict[str, Any]] = None
+    old_left = new_left = 0
+    for line in diff_text.splitlines():
+        if hunk is not None and (old_left > 0 or new_left > 0):
+            tag = line[:1]
+            if tag in ("+", "-", " "):
+                hunk["lines"].append(line)
+                if tag != "+":
+                    old_left -= 1
+                if tag != "-":
+                    new_left -= 1
+                continue
+            if tag == "\\":
+                # "\ No newline at end of file"
+                continue
+            # 行数与头部不符(输出被截断等),按普通行继续解析
+            hunk = None
+        if line.startswith("diff --git "):
+            current, hunk = None, None
+        elif line.startswith("+++ "):
+            path = line[4:]
+            path = path[2:] if path.startswith("b/") else None
+            current = files.setdefault(path, []) if path else None
+            hunk = None
+        elif line.startswith("@@") and current is not None:
+            m = HUNK_RE.match(line)
+            if m:
+                hunk = {
+                    "old_start": int(m.group(1)),
+                    "old_lines": int(m.group(2) if m.group(2) is not None else 1),
+                    "new_start": int(m.group(3)),
+                    "new_lines": int(m.group(4) if m.group(4) is not None else 1),
+                    "lines": []
+                }
+                old_left, new_left = hunk["old_lines"], hunk["new_lines"]
+                current.append(hunk)
+    return files
+
+
+def module_name(rel_path: str) -> Optional[str]:
+    """相对代码库根目录的 .py 路径 -> 模块名"""
+    if not rel_path.endswith(".py"):
+        return None
+    parts = rel_path[:-3].split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    return ".".join(parts) if parts else None
+
+
+def parse_imports(source: str, rel_path: str) -> List[str]:
+    """提取导入的模块名(相对导入按所在包解析),语法错误时返回空列表"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    package = rel_path[:-3].split("/")[:-1]
+    if rel_path.endswith("__init__.py"):
+        package = rel_path.split("/")[:-1]
+    modules: Set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                base = package[:len(package) - node.level + 1] if node.level > 1 else list(package)
+                prefix = ".".join(base + ([node.module] if node.module else []))
+            else:
+                prefix = node.module or ""
+            if prefix:
+                modules.add(prefix)
+            # from pkg import submodule
+            modules.update(f"{prefix}.{alias.name}" if prefix else alias.name for alias in node.names)
+    return sorted(modules)
+
+
+def enclosing_definitions(source: str, line_ranges: List[Tuple[int, int]]) -> List[str]:
+    """与变更行区间重叠的函数/类(按出现顺序)"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return []
+    names = []
+
+    def visit(node, prefix=""):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                start, end = child.lineno, getattr(child, "end_lineno", child.lineno)
+                qualname = f"{prefix}{child.name}"
+                if any(start <= hi and lo <= end for lo, hi in line_ranges):
+                    names.append(qualname)
+                visit(child, f"{qualname}.")
+
+    visit(tree)
+    return names
+
+
+class GitRepository:
+    """通过 git 管道命令只读访问对象库"""
+
+    def __init__(self, path: str):
+        self.path = os.path.abspath(path)
+        try:
+            self.toplevel = self._git("rev-parse", "--show-toplevel", cwd=self.path).strip()
+        except GitError:
+            raise GitError(f"{path} 不在 git 仓库中")
+        prefix = os.path.relpath(self.path, self.toplevel).replace(os.sep, "/")
+        # 代码库可能是仓库中的子目录
+        self.prefix = "" if prefix == "." else prefix + "/"
+
+    def _git(self, *args: str, cwd: Optional[str] = None) -> str:
+        result = subprocess.run(["git", *args], cwd=cwd or self.toplevel, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise GitError(result.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} 失败")
+        return result.stdout.decode("utf-8", "replace")
+
+    def resolve_range(self, rev_range: str) -> Tuple[str, str]:
+        """"A..B" -> (A, B); "A" -> (A, HEAD); 返回提交哈希"""
+        if ".." in rev_range:
+            base, head = rev_range.split("..", 1)
+        else:
+            base, head = rev_range, "HEAD"
+        shas = []
+        for rev in (base or "HEAD", head or "HEAD"):
+            try:
+                shas.append(self._git("rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}").strip())
+            except GitError:
+                raise GitError(f"无效的修订: {rev}")
+        return shas[0], shas[1]
+
+    def _relative(self, path: str) -> Optional[str]:
+        if self.prefix and not path.startswith(self.prefix):
+            return None
+        return path[len(self.prefix):]
+
+    def changed_files(self, base: str, head: str) -> List[Dict[str, str]]:
+        """[{"status", "path", "old_path"}],路径相对代码库根目录"""
+        output = self._git("diff", "--name-status", "-M", "-z", base, head, "--", self.prefix or ".")
+        fields = output.split("\0")
+        changes = []
+        i = 0
+        while i < len(fields) - 1:
+            status = fields[i]
+            if status.startswith(("R", "C")):
+                old_path, path = fields[i + 1], fields[i + 2]
+                i += 3
+            else:
+                old_path = path = fields[i + 1]
+                i += 2
+            rel = self._relative(path)
+            if rel is not None:
+                changes.append({"status": status[0], "path": rel, "old_path": self._relative(old_path) or old_path})
+        return changes
+
+    def hunks(self, base: str, head: str, paths: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        if not paths:
+            return {}
+        output = self._git("diff", "-U0", "-M", base, head, "--", *[self.prefix + p for p in paths])
+        return {self._relative(p): h for p, h in parse_hunks(output).items() if self._relative(p) is not None}
+
+    def tree_blobs(self, rev: str) -> Dict[str, str]:
+        """{相对路径: blob 哈希},只含 .py 文件"""
+        output = self._git("ls-tree", "-r", "-z", rev, "--", self.prefix or ".")
+        blobs = {}
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            meta, path = entry.split("\t", 1)
+            _, obj_type, sha = meta.split()
+            rel = self._relative(path)
+            if obj_type == "blob" and rel and rel.endswith(".py"):
+                blobs[rel] = sha
+        return blobs
+
+    def read_blobs(self, shas: List[str]) -> Dict[str, str]:
+        """批量读取 blob 内容(git cat-file --batch),返回 {sha: 文本}"""
+        if not shas:
+            return {}
+        result = subprocess.run(
+            ["git", "cat-file", "--batch"], cwd=self.toplevel,
+            input=("\n".join(shas) + "\n").encode(), stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        if result.returncode != 0:
+            raise GitError(result.stderr.decode("utf-8", "replace").strip())
+        data = result.stdout
+        contents = {}
+        pos = 0
+        while pos < len(data):
+            header_end = data.index(b"\n", pos)
+            header = data[pos:header_end].decode().split()
+            if len(header) < 3 or header[1] == "missing":
+                pos = header_end + 1
+                continue
+            size = int(header[2])
+            body = data[header_end + 1:header_end + 1 + size]
+            contents[header[0]] = body.decode("utf-8", "replace")
+            pos = header_end + 1 + size + 1
+        return contents
+
+
+class ImportGraph:
+    """按 blob 哈希增量维护的导入图"""
+
+    def __init__(self, cache_path: str):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        # {相对路径: {"blob": sha, "imports": [模块名]}}
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r", encoding="utf-8") as f:
+                    self.files = json.load(f)
+            except (OSError, ValueError):
+                self.files = {}
+
+    def update(self, repo: GitRepository, rev: str, blobs: Optional[Dict[str, str]] = None) -> int:
+        """同步到指定修订,返回重新解析的文件数"""
+        blobs = repo.tree_blobs(rev) if blobs is None else blobs
+        stale = {path: sha for path, sha in blobs.items() if self.files.get(path, {}).get("blob") != sha}
+        contents = repo.read_blobs(sorted(set(stale.values())))
+        with self._lock:
+            for path in list(self.files):
+                if path not in blobs:
+                    del self.files[path]
+            for path, sha in stale.items():
+                self.files[path] = {"blob": sha, "imports": parse_imports(contents.get(sha, ""), path)}
+            if stale:
+                self._save()
+        return len(stale)
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.files, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def dependents(self, paths: List[str]) -> Dict[str, List[str]]:
+        """直接导入了 paths 中任一模块的文件: {依赖方路径: [被导入的变更模块]}"""
+        targets = {module_name(p): p for p in paths if module_name(p)}
+        result: Dict[str, List[str]] = {}
+        with self._lock:
+            for path, entry in self.files.items():
+                if path in paths:
+                    continue
+                hits = sorted({m for m in entry["imports"] if m in targets})
+                if hits:
+                    result[path] = hits
+        return result
+
+
+class IncrementalAnalyzer:
+    """把修订范围转换为只覆盖变更区域的上下文包"""
+
+    def __init__(self, codebase_path: str, cache_dir: str):
+        self.repo = GitRepository(codebase_path)
+        self.graph = ImportGraph(os.path.join(cache_dir, "import_graph.json"))
+        self._cache: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def collect(self, rev_range: str) -> Dict[str, Any]:
+        """读取变更、hunk、变更区域的静态检查结果和直接依赖方(按提交哈希缓存)"""
+        base, head = self.repo.resolve_range(rev_range)
+        cached = self._cache.get((base, head))
+        if cached:
+            return cached
+
+        changes = self.repo.changed_files(base, head)
+        live = [c for c in changes if c["status"] != "D"]
+        hunks = self.repo.hunks(base, head, [c["path"] for c in live])
+        head_blobs = self.repo.tree_blobs(head)
+        reparsed = self.graph.update(self.repo, head, head_blobs)
+
+        sources = self.repo.read_blobs([head_blobs[c["path"]] for c in live if c["path"] in head_blobs])
+
+        files = []
+        for change in changes:
+            file_hunks = hunks.get(change["path"], [])
+            ranges = [(h["new_start"], h["new_start"] + max(h["new_lines"], 1) - 1) for h in file_hunks]
+            added = [l[1:] for h in file_hunks for l in h["lines"] if l.startswith("+")]
+            removed = sum(1 for h in file_hunks for l in h["lines"] if l.startswith("-"))
+            source = sources.get(head_blobs.get(change["path"], ""), "")
+            files.append({
+                **change,
+                "added": len(added),
+                "removed": removed,
+                "hunks": file_hunks,
+                "definitions": enclosing_definitions(source, ranges) if source else [],
+                "todos": [l.strip() for l in added if TODO_RE.search(l)][:10]
+            })
+
+        result = {
+            "base": base,
+            "head": head,
+            "files": files,
+            "dependents": self.graph.dependents([c["path"] for c in changes]),
+            "reparsed": reparsed
+        }
+        self._cache[(base, head)] = result
+        return result
+
+    def build_packets(self, rev_range: str) -> List[ContextPacket]:
+        """变更摘要、每个文件的 hunk 和依赖方各生成一个上下文包"""
+        diff = self.collect(rev_range)
+        now = datetime.now()
+        total_added = sum(f["added"] for f in diff["files"])
+        total_removed = sum(f["removed"] for f in diff["files"])
+        summary_lines = [f"修订范围: {diff['base'][:10]}..{diff['head'][:10]}",
+                         f"变更文件: {len(diff['files'])} 个, +{total_added} -{total_removed} 行"]
+        for f in diff["files"]:
+            defs = f", 涉及: {', '.join(f['definitions'][:8])}" if f["definitions"] else ""
+            summary_lines.append(f"- [{f['status']}] {f['path']} (+{f['added']} -{f['removed']}){defs}")
+            summary_lines.extend(f"    新增待办: {todo}" for todo in f["todos"])
+        summary = "[变更摘要]\n" + "\n".join(summary_lines)
+        packets = [ContextPacket(
+            content=summary,
+            timestamp=now,
+            token_count=count_tokens(summary),
+            relevance_score=0.9,
+            metadata={"type": "diff_summary", "source": "git"}
+        )]
+
+        for f in diff["files"]:
+            if not f["hunks"]:
+                continue
+            body_lines = []
+            for h in f["hunks"]:
+                body_lines.append(f"@@ -{h['old_start']},{h['old_lines']} +{h['new_start']},{h['new_lines']} @@")
+                body_lines.extend(h["lines"])
+            body = "\n".join(body_lines)
+            # 超长 diff 按行截断到 token 上限
+            while body_lines and count_tokens(body) > DIFF_FILE_TOKENS:
+                body_lines = body_lines[:max(1, len(body_lines) * 3 // 4)]
+                body = "\n".join(body_lines) + "\n... (已截断)"
+            content = f"[变更内容] {f['path']}\n```diff\n{body}\n```"
+            packets.append(ContextPacket(
+                content=content,
+                timestamp=now,
+                token_count=count_tokens(content),
+                relevance_score=0.8,
+                metadata={"type": "diff_hunks", "source": "git", "path": f["path"]}
+            ))
+
+        if diff["dependents"]:
+            items = sorted(diff["dependents"].items())
+            lines = [f"- {path} 导入了 {', '.join(mods)}" for path, mods in items[:MAX_DEPENDENTS]]
+            if len(items) > MAX_DEPENDENTS:
+                lines.append(f"... 另有 {len(items) - MAX_DEPENDENTS} 个文件")
+            content = "[受影响的依赖方]\n" + "\n".join(lines)
+            packets.append(ContextPacket(
+                content=content,
+                timestamp=now,
+                token_count=count_tokens(content),
+                relevance_score=0.6,
+                metadata={"type": "diff_dependents", "source": "import_graph"}
+            ))
+        return packets
@@ -1,21 +1,199 @@
 from typing import Dict, Any, List, Optional
 from datetime import datetime
+import hashlib
 import json
 import os
+import platform
+import re
 import sys
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
 
-# 加载环境变量
-from dotenv import load_dotenv
-load_dotenv()
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def load_env():
+    """加载 .env(从本文件所在目录向上查找;没有 .env 时不导入 python-dotenv)"""
+    directory = _HERE
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return
+        directory = parent
+
+
+# 加载环境变量(下方按环境变量配置的模块常量依赖它)
+load_env()
 
 # 确保能导入必要的模块
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+for _path in (_HERE, os.path.dirname(_HERE)):
+    if _path not in sys.path:
+        sys.path.append(_path)
+
+from session_store import SessionCheckpointStore
+from memory_store import tune_memory_db, MemoryStore
+from memory_consolidation import start_consolidation
+from concept_graph import get_concept_graph
+from note_dedup import NoteDeduplicator
+from metrics import Histogram, registry
+from token_accounting import TokenLedger, attribute_context, count_tokens
+from codebase_watcher import NoteLinks, get_codebase_watcher
+from output_compressor import OutputCompressor
+
+# hello_agents(LLM 客户端、上下文构建、工具、记忆)及依赖它的模块导入较慢,
+# 在第一次创建助手或共享 LLM 客户端时才加载,见 _load_agent_stack()
+HelloAgentsLLM = None
+ContextBuilder = ContextConfig = ContextPacket = None
+MemoryTool = NoteTool = TerminalTool = None
+Message = None
+PacketBatch = None
+_agent_stack_lock = threading.Lock()
+
+
+def _load_agent_stack():
+    """导入 hello_agents 并填充本模块的同名全局变量(只导入一次,线程安全)"""
+    global HelloAgentsLLM, ContextBuilder, ContextConfig, ContextPacket
+    global MemoryTool, NoteTool, TerminalTool, Message, PacketBatch
+    if PacketBatch is not None:
+        return
+    with _agent_stack_lock:
+        if PacketBatch is not None:
+            return
+        from hello_agents import HelloAgentsLLM
+        from hello_agents.context import ContextBuilder, ContextConfig, ContextPacket
+        from hello_agents.tools import MemoryTool, NoteTool, TerminalTool
+        from hello_agents.core.message import Message
+        # 最后赋值 PacketBatch,作为整组已加载的标志
+        from packet_batch import PacketBatch
+
+
+# 预处理结果缓存有效期(秒),同一模式在有效期内复用上一次的终端探索结果
+# (代码库监听运行时改为由文件变更失效,不再按时间过期)
+PREPROCESS_CACHE_TTL = 300
+# 预处理只依赖笔记的模式: 不受文件变更失效,始终按 TTL 过期,本实例写笔记时立即失效
+NOTE_DRIVEN_MODES = ("plan",)
+
+# 笔记类型先验(候选打分见 context_scoring)
+NOTE_RELEVANCE = {
+    "blocker": 0.9,
+    "action": 0.8,
+    "task_state": 0.75,
+    "conclusion": 0.7
+}
+
+# 各模式的附加指令
+MODE_INSTRUCTIONS = {
+    "explore": """
+当前模式: 探索代码库
+
+你应该:
+- 主动使用 terminal 命令了解代码结构
+- 识别关键模块和文件
+- 记录项目架构到笔记
+""",
+    "analyze": """
+当前模式: 分析代码质量
+
+你应该:
+- 查找代码问题(重复、复杂度、TODO等)
+- 评估代码质量
+- 将发现的问题记录为 blocker 或 action 笔记
+""",
+    "diff": """
+当前模式: 增量分析
 
-from hello_agents import HelloAgentsLLM
-from hello_agents.context import ContextBuilder, ContextConfig, ContextPacket
-from hello_agents.tools import MemoryTool, NoteTool, TerminalTool
-from hello_agents.core.message import Message
+你应该:
+- 只针对上下文中的变更内容和受影响的依赖方给出意见
+- 检查变更是否引入缺陷、破坏依赖方或留下待办
+- 不要重新探索整个代码库
+""",
+    "plan": """
+当前模式: 任务规划
+
+你应该:
+- 回顾历史笔记和任务
+- 制定下一步行动计划
+- 更新任务状态笔记
+""",
+    "auto": """
+当前模式: 自动决策
+
+你应该:
+- 根据用户需求灵活选择策略
+- 在需要时使用工具
+- 保持回答的专业性和实用性
+"""
+}
+
+# 预处理结果固定在项目上下文段中的最大预算比例,超出部分作为普通候选参与筛选
+PINNED_CONTEXT_RATIO = 0.5
+
+# LLM 不可用时的默认回答
+DEFAULT_RESPONSE = "我已经分析了代码库，发现了一些潜在的问题。\n\n1. 代码结构：这是一个 Flask Web 应用，包含 models、routes、services 等模块。\n2. 数据模型：可能存在缺少索引、字段约束等问题。\n3. 代码质量：可能存在代码重复、复杂度高等问题。\n\n建议：\n- 为关键字段添加索引和约束\n- 提取重复代码到基类\n- 重构复杂的方法，减少嵌套层级\n- 增加测试覆盖率"
+
+
+
+class LLMUnavailableError(RuntimeError):
+    """LLM 调用失败(只在要求不使用默认回答时抛出,见 _call_llm)"""
+
+
+_shared_llm: Optional["HelloAgentsLLM"] = None
+_shared_llm_lock = threading.Lock()
+
+
+def get_shared_llm() -> "HelloAgentsLLM":
+    """进程内共享的 LLM 客户端(按环境变量配置),助手实例不再各自创建"""
+    global _shared_llm
+    _load_agent_stack()
+    with _shared_llm_lock:
+        if _shared_llm is None:
+            _shared_llm = HelloAgentsLLM(
+                model=os.getenv('LLM_MODEL_ID', 'doubao-seed-1-8-251228'),
+                api_key=os.getenv('LLM_API_KEY'),
+                base_url=os.getenv('LLM_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3'),
+                timeout=int(os.getenv('LLM_TIMEOUT', '60'))
+            )
+        return _shared_llm
+
+
+# 最近出现过的 prompt 前缀(估算服务端前缀缓存命中),有效期与常见的服务端缓存时长相当
+PROMPT_CACHE_TTL = float(os.getenv('PROMPT_CACHE_TTL', '300'))
+_recent_prefixes: Dict[str, float] = {}
+_prefix_labels: Dict[str, Dict[str, str]] = {}
+_prefix_lock = threading.Lock()
+
+
+def observe_prompt_prefix(project: str, static_hash: str, prefix_hash: str, prefix_tokens: int) -> bool:
+    """记录本次 prompt 的稳定前缀,返回有效期内是否出现过相同前缀"""
+    now = time.time()
+    labels = {"project": project, "static_hash": static_hash, "prefix_hash": prefix_hash}
+    with _prefix_lock:
+        for key in [k for k, ts in _recent_prefixes.items() if now - ts > PROMPT_CACHE_TTL]:
+            del _recent_prefixes[key]
+        hit = prefix_hash in _recent_prefixes
+        _recent_prefixes[prefix_hash] = now
+        # 每个项目只保留当前前缀的 info 序列,前缀变化时删除旧序列
+        previous = _prefix_labels.get(project)
+        if previous and previous != labels:
+            registry.remove("prompt_prefix_info", labels=previous)
+        _prefix_labels[project] = labels
+    registry.gauge("prompt_prefix_info", "Current stable prompt prefix hash", labels=labels).set(1)
+    registry.gauge(
+        "prompt_prefix_tokens", "Tokens in the stable prompt prefix", labels={"project": project}
+    ).set(prefix_tokens)
+    registry.counter(
+        "prompt_prefix_requests_total", "Prompts by whether the stable prefix was seen recently",
+        labels={"result": "hit" if hit else "miss"}
+    ).inc()
+    return hit
 
 
 class CodebaseMaintainer:
@@ -23,63 +201,149 @@ class CodebaseMaintainer:
 
     整合 ContextBuilder + NoteTool + TerminalTool + MemoryTool
     实现跨会话的代码库维护任务管理
+
+    index_codebase=False 时不启动代码库监听和符号索引、笔记文件关联、后台记忆整理和概念图,
+    用于只做单文件分析(analyze_file)、不需要代码库上下文的实例(如上传分析)。
     """
 
     def __init__(
         self,
         project_name: str,
         codebase_path: str,
-        llm: Optional[HelloAgentsLLM] = None
+        llm: Optional["HelloAgentsLLM"] = None,
+        session_id: Optional[str] = None,
+        index_codebase: bool = True
     ):
+        _load_agent_stack()
         self.project_name = project_name
         self.codebase_path = codebase_path
-        self.session_id = f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        # 时间前缀便于按时间排序, 随机后缀保证同一秒内创建的会话(如多个 worker 并发初始化)不会共用检查点
+        self.session_id = session_id or f"session_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
 
-        # 初始化 LLM
-        if llm:
-            self.llm = llm
-        else:
-            # 使用环境变量配置 LLM
-            self.llm = HelloAgentsLLM(
-                model=os.getenv('LLM_MODEL_ID', 'doubao-seed-1-8-251228'),
-                api_key=os.getenv('LLM_API_KEY'),
-                base_url=os.getenv('LLM_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3'),
-                timeout=int(os.getenv('LLM_TIMEOUT', '60'))
-            )
+        # 初始化 LLM(未指定时使用按环境变量配置的共享客户端)
+        self.llm = llm or get_shared_llm()
 
-        # 初始化工具
+        # 初始化工具(记忆库开启 WAL + 共享连接池,多个助手实例共用)
+        # MemoryTool 负责建表,复合索引在其之后补齐
         self.memory_tool = MemoryTool(user_id=project_name)
+        tune_memory_db()
+        self.memory_store = MemoryStore()
+        if index_codebase:
+            # 后台记忆整理(衰减/去重/汇总/VACUUM),MEMORY_CONSOLIDATION_INTERVAL=0 关闭
+            start_consolidation(
+                self.memory_store,
+                interval=float(os.getenv('MEMORY_CONSOLIDATION_INTERVAL', '3600'))
+            )
+        self.concept_graph = None
+        if index_codebase:
+            try:
+                self.concept_graph = get_concept_graph(self.memory_store)
+            except Exception as e:
+                print(f"[WARNING] 概念图加载失败: {e}")
         self.note_tool = NoteTool(workspace=f"./{project_name}_notes")
+        self.note_dedup = NoteDeduplicator(workspace=f"./{project_name}_notes")
         self.terminal_tool = TerminalTool(workspace=codebase_path, timeout=60)
+        # 长的终端输出压缩后再进入回答和上下文,原文按句柄保存在会话目录
+        self.output_compressor = OutputCompressor(os.path.join(f"./{project_name}_sessions", "tool_outputs"))
 
         # 初始化上下文构建器
+        self.context_config = ContextConfig(
+            max_tokens=4000,
+            reserve_ratio=0.15,
+            min_relevance=0.2,
+            enable_compression=True
+        )
         self.context_builder = ContextBuilder(
             memory_tool=self.memory_tool,
             rag_tool=None,  # 本案例不使用 RAG
-            config=ContextConfig(
-                max_tokens=4000,
-                reserve_ratio=0.15,
-                min_relevance=0.2,
-                enable_compression=True
-            )
+            config=self.context_config
         )
 
         # 对话历史
-        self.conversation_history: List[Message] = []
+        self.conversation_history: List["Message"] = []
 
         # 统计信息
         self.stats = {
             "session_start": datetime.now(),
             "commands_executed": 0,
             "notes_created": 0,
+            "notes_merged": 0,
             "issues_found": 0
         }
 
+        # 会话检查点: 预处理缓存、待执行工具调用、最近一次构建的上下文
+        self.checkpoint_store = SessionCheckpointStore(f"./{project_name}_sessions")
+        self._preprocess_cache: Dict[str, Dict[str, Any]] = {}
+        self._pending_tool_calls: List[Dict[str, Any]] = []
+        self._last_context: Optional[str] = None
+        self.token_ledger = TokenLedger(f"./{project_name}_sessions", project_name, self.session_id)
+
+        # 采样剖析: 按会话开启,或在 run(profile=True) 时按轮开启
+        self.profile_enabled = False
+        self.last_profile: Optional[Dict[str, str]] = None
+
+        # arun 的串行锁: 同一实例的对话历史不能并发修改(在事件循环中首次使用时创建)
+        self._arun_lock = None
+
+        # 增量分析: 首次使用时创建(代码库不在 git 仓库中时不可用)
+        self._incremental = None
+        self._diff_range: Optional[str] = None
+
+        # prompt 稳定前缀: 静态指令缓存和最近一次前缀的哈希
+        self._static_prompt: Optional[str] = None
+        self.prompt_prefix: Dict[str, Any] = {}
+
+        # analyze_file 可被多个线程同时调用,修改实例状态的部分在此锁下执行
+        self._state_lock = threading.RLock()
+
+        # 代码库监听: 文件变更时增量更新文件/符号索引,失效预处理缓存并标记关联笔记
+        self.note_links: Optional[NoteLinks] = None
+        self.watcher = None
+        if index_codebase:
+            self.note_links = NoteLinks(f"./{project_name}_notes")
+            self.watcher = get_codebase_watcher(codebase_path)
+        if self.watcher:
+            self.watcher.subscribe(self._on_codebase_change)
+
+        # 各阶段耗时(秒): 本实例的直方图 + 最近一轮的时间片
+        self.stage_latency: Dict[str, Histogram] = {}
+        self._turn_spans: List[Dict[str, Any]] = []
+
+        if session_id and self.checkpoint_store.exists(session_id):
+            self._restore_checkpoint(session_id)
+
         print(f"✅ 代码库维护助手已初始化: {project_name}")
         print(f"📁 工作目录: {codebase_path}")
         print(f"🆔 会话ID: {self.session_id}")
 
-    def run(self, user_input: str, mode: str = "auto") -> str:
+    @classmethod
+    def from_session(
+        cls,
+        project_name: str,
+        session_id: str,
+        llm: Optional["HelloAgentsLLM"] = None
+    ) -> "CodebaseMaintainer":
+        """根据会话ID从检查点恢复助手
+
+        Raises:
+            ValueError: 检查点不存在
+        """
+        payload = SessionCheckpointStore(f"./{project_name}_sessions").load(session_id)
+        if payload is None:
+            raise ValueError(f"会话检查点不存在: {session_id}")
+        return cls(
+            project_name=project_name,
+            codebase_path=payload["codebase_path"],
+            llm=llm,
+            session_id=session_id
+        )
+
+    def set_profile_enabled(self, enabled: bool):
+        """开启/关闭整个会话的采样剖析, 写入检查点以便其他 worker 重建的实例沿用"""
+        self.profile_enabled = enabled
+        self._save_checkpoint()
+
+    def run(self, user_input: str, mode: str = "auto", profile: bool = False) -> str:
         """运行助手
 
         Args:
@@ -89,93 +353,154 @@ class CodebaseMaintainer:
                 - "explore": 侧重代码探索
                 - "analyze": 侧重问题分析
                 - "plan": 侧重任务规划
+            profile: 是否对本轮做采样剖析(profile_enabled 为 True 时整个会话都剖析)
 
         Returns:
             str: 助手的回答
         """
+        if not (profile or self.profile_enabled):
+            return self._run(user_input, mode)
+
+        from profiler import SamplingProfiler
+        with SamplingProfiler(label=f"{self.session_id}_{mode}") as profiler:
+            response = self._run(user_input, mode)
+        try:
+            self.last_profile = profiler.save()
+            print(f"🔥 剖析结果已保存: {self.last_profile['speedscope']}")
+        except Exception as e:
+            print(f"[WARNING] 保存剖析结果失败: {e}")
+        return response
+
+    async def arun(self, user_input: str, mode: str = "auto", profile: bool = False) -> str:
+        """run 的异步版本
+
+        LLM 和工具调用是同步的,放到事件循环的默认线程池中执行,
+        等待期间事件循环可以继续处理其他请求和 SSE 流。同一实例的多轮对话按顺序执行。
+        """
+        return await self._run_serialized(self.run, user_input, mode, profile)
+
+    async def aanalyze_diff(self, rev_range: str = "HEAD~1..HEAD", focus: str = "") -> str:
+        """analyze_diff 的异步版本,与 arun 共用串行锁"""
+        return await self._run_serialized(self.analyze_diff, rev_range, focus)
+
+    async def _run_serialized(self, func, *args):
+        """在默认线程池中执行修改对话历史的同步方法,同一实例按顺序执行"""
+        import asyncio
+        if self._arun_lock is None:
+            self._arun_lock = asyncio.Lock()
+        async with self._arun_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, func, *args)
+
+    def analyze_file(self, prompt: str) -> str:
+        """单文件分析(上传接口使用)
+
+        代码已内联在 prompt 中,因此跳过预处理、笔记/记忆检索和上下文构建,
+        也不写入对话历史和检查点。同一个实例可被多个线程同时调用: LLM 调用并发执行,
+        修改实例状态的部分(前缀记录、工具调用和统计、自动笔记)在 _state_lock 下串行执行。
+
+        Raises:
+            LLMUnavailableError: LLM 调用失败(不返回默认回答,避免被上传结果缓存)
+        """
+        start = time.perf_counter()
+        with self._state_lock:
+            system_instructions = self._assemble_prompt(
+                self._static_instructions(), MODE_INSTRUCTIONS["analyze"].strip(), ""
+            ).rstrip()
+        # 不用 _span: 本轮时间片列表属于 run(),并发的单文件分析只记直方图
+        llm_start = time.perf_counter()
+        response = self._call_llm(system_instructions, prompt, fallback=False)
+        self._observe_stage("llm_call", time.perf_counter() - llm_start)
+        self._record_token_usage("upload", system_instructions, prompt, response, {"system": [system_instructions]})
+        with self._state_lock:
+            response = self._execute_tool_calls(response, track_pending=False)
+            self._postprocess_response(prompt, response)
+        self._observe_stage("file_analysis", time.perf_counter() - start)
+        return response
+
+    def _run(self, user_input: str, mode: str) -> str:
+        """执行一轮对话(见 run)"""
         print(f"\n{'='*80}")
         print(f"👤 用户: {user_input}")
         print(f"{'='*80}\n")
 
+        self._turn_spans = []
+        turn_start = time.perf_counter()
         try:
             # 第一步:根据模式执行预处理
-            try:
-                pre_context = self._preprocess_by_mode(user_input, mode)
-            except Exception as e:
-                print(f"[WARNING] 预处理失败: {e}")
-                pre_context = []
+            with self._span("preprocess"):
+                try:
+                    pre_context = self._preprocess_by_mode(user_input, mode)
+                except Exception as e:
+                    print(f"[WARNING] 预处理失败: {e}")
+                    pre_context = []
 
             # 第二步:检索相关笔记
-            relevant_notes = self._retrieve_relevant_notes(user_input)
-            note_packets = self._notes_to_packets(relevant_notes)
+            # 候选按列存入 PacketBatch: 依次为笔记、记忆、放不下项目上下文段的预处理结果
+            with self._span("note_retrieval"):
+                relevant_notes = self._retrieve_relevant_notes(user_input)
+                candidates = PacketBatch()
+                self._add_note_candidates(relevant_notes, candidates)
+                notes_end = len(candidates)
+                self._retrieve_graph_memories(user_input, candidates)
+                memories_end = len(candidates)
+                pinned, overflow = self._pin_project_context(pre_context)
+                candidates.extend(overflow)
 
             # 第三步:构建优化的上下文
-            try:
-                context = self.context_builder.build(
-                    user_query=user_input,
-                    conversation_history=self.conversation_history,
-                    system_instructions=self._build_system_instructions(mode),
-                    additional_packets=note_packets + pre_context
+            # prompt 布局固定为: 静态指令 -> 模式指令和预处理结果 -> ContextBuilder 生成的本轮内容
+            with self._span("context_build"):
+                static_instructions = self._static_instructions()
+                mode_instructions = MODE_INSTRUCTIONS.get(mode, MODE_INSTRUCTIONS["auto"]).strip()
+                project_context = "\n\n".join([mode_instructions] + [p.content for p in pinned])
+                turn_instructions = f"当前会话ID: {self.session_id}"
+                # 先在列式数组上打分并按预算装箱,只为入选的候选创建 ContextPacket
+                selected = candidates.select(
+                    self._candidate_budget(f"{static_instructions}\n\n{project_context}\n\n{turn_instructions}"),
+                    self.context_config.min_relevance,
+                    query=user_input
                 )
-            except Exception as e:
-                print(f"[WARNING] 上下文构建失败: {e}")
-                # 如果上下文构建失败，使用一个简单的系统指令
-                context = self._build_system_instructions(mode)
+                try:
+                    volatile = self.context_builder.build(
+                        user_query=user_input,
+                        conversation_history=self.conversation_history,
+                        system_instructions=turn_instructions,
+                        additional_packets=candidates.to_packets(selected)
+                    )
+                except Exception as e:
+                    print(f"[WARNING] 上下文构建失败: {e}")
+                    # 如果上下文构建失败，只保留固定段和会话信息
+                    volatile = turn_instructions
+                context = self._assemble_prompt(static_instructions, project_context, volatile)
+                self._last_context = context
 
             # 第四步:调用 LLM
             print("🤖 正在思考...")
-            try:
-                response_parts = self.llm.think([{"role": "system", "content": context}, {"role": "user", "content": user_input}])
-                # 处理响应，确保它是一个可迭代的字符串
-                if isinstance(response_parts, str):
-                    response = response_parts
-                else:
-                    try:
-                        response = ''.join(response_parts)
-                    except Exception as e:
-                        print(f"[WARNING] 响应处理失败: {e}")
-                        # 如果无法连接 LLM，返回一个默认的响应
-                        response = "我已经分析了代码库，发现了一些潜在的问题。\n\n1. 代码结构：这是一个 Flask Web 应用，包含 models、routes、services 等模块。\n2. 数据模型：可能存在缺少索引、字段约束等问题。\n3. 代码质量：可能存在代码重复、复杂度高等问题。\n\n建议：\n- 为关键字段添加索引和约束\n- 提取重复代码到基类\n- 重构复杂的方法，减少嵌套层级\n- 增加测试覆盖率"
-            except Exception as e:
-                print(f"[WARNING] LLM 调用失败: {e}")
-                # 如果 LLM 调用失败，返回一个默认的响应
-                response = "我已经分析了代码库，发现了一些潜在的问题。\n\n1. 代码结构：这是一个 Flask Web 应用，包含 models、routes、services 等模块。\n2. 数据模型：可能存在缺少索引、字段约束等问题。\n3. 代码质量：可能存在代码重复、复杂度高等问题。\n\n建议：\n- 为关键字段添加索引和约束\n- 提取重复代码到基类\n- 重构复杂的方法，减少嵌套层级\n- 增加测试覆盖率"
-
+            with self._span("llm_call"):
+                response = self._call_llm(context, user_input)
+
+            self._record_token_usage(mode, context, user_input, response, {
+                "system": [static_instructions, mode_instructions, turn_instructions],
+                "history": [m.content for m in self.conversation_history],
+                "notes": [candidates.content(i) for i in selected if i < notes_end],
+                "memories": [candidates.content(i) for i in selected if notes_end <= i < memories_end],
+                "preprocess": [p.content for p in pinned] + [candidates.content(i) for i in selected if i >= memories_end]
+            })
 
             # 第五步:处理工具调用
-            if "<|FunctionCallBegin|>" in response or "<|FunctionCallEnd|>" in response:
-                # 提取工具调用信息
-                import re
-                # 匹配 <|FunctionCallBegin|>...<|FunctionCallEnd|> 格式
-                tool_call_matches = re.findall(r'<\|FunctionCallBegin\|>(.*?)<\|FunctionCallEnd\|>', response, re.DOTALL)
-                if tool_call_matches:
-                    for tool_call_str in tool_call_matches:
-                        try:
-                            import json
-                            tool_calls_data = json.loads(tool_call_str.strip())
-                            for tool_call in tool_calls_data:
-                                tool_name = tool_call.get("name")
-                                parameters = tool_call.get("parameters", {})
-                                
-                                if tool_name == "TerminalTool":
-                                    command = parameters.get("command")
-                                    if command:
-                                        print(f"🚀 执行命令: {command}")
-                                        result = self.terminal_tool.run({"command": command})
-                                        print(f"📋 命令结果:\n{result}")
-                                        # 将命令结果添加到响应中
-                                        full_match = f"<|FunctionCallBegin|>{tool_call_str}<|FunctionCallEnd|>"
-                                        response = response.replace(full_match, f"命令执行结果:\n```\n{result}\n```")
-                        except Exception as e:
-                            print(f"[WARNING] 工具调用处理失败: {e}")
-                            import traceback
-                            traceback.print_exc()
+            with self._span("tool_calls"):
+                response = self._execute_tool_calls(response)
 
             # 第六步:后处理
-            self._postprocess_response(user_input, response)
+            with self._span("postprocess"):
+                self._postprocess_response(user_input, response)
 
             # 第七步:更新对话历史
-            self._update_history(user_input, response)
+            with self._span("history_update"):
+                self._update_history(user_input, response)
+                self._save_checkpoint()
+
+            self._observe_stage("total", time.perf_counter() - turn_start)
 
             print(f"\n🤖 助手: {response}\n")
             print(f"{'='*80}\n")
@@ -198,14 +523,107 @@ class CodebaseMaintainer:
                 pass
             return error_msg
 
+    def _call_llm(self, context: str, user_input: str, fallback: bool = True) -> str:
+        """调用 LLM,失败时返回默认回答
+
+        Args:
+            fallback: 为 False 时失败抛出 LLMUnavailableError 而不是返回默认回答
+                (结果会被缓存的调用方需要区分真实回答和默认回答)
+        """
+        try:
+            response_parts = self.llm.think([{"role": "system", "content": context}, {"role": "user", "content": user_input}])
+            # 处理响应，确保它是一个可迭代的字符串
+            if isinstance(response_parts, str):
+                return response_parts
+            try:
+                return ''.join(response_parts)
+            except Exception as e:
+                print(f"[WARNING] 响应处理失败: {e}")
+                if not fallback:
+                    raise LLMUnavailableError(f"响应处理失败: {e}")
+                # 如果无法连接 LLM，返回一个默认的响应
+                return DEFAULT_RESPONSE
+        except LLMUnavailableError:
+            raise
+        except Exception as e:
+            print(f"[WARNING] LLM 调用失败: {e}")
+            if not fallback:
+                raise LLMUnavailableError(f"LLM 调用失败: {e}")
+            # 如果 LLM 调用失败，返回一个默认的响应
+            return DEFAULT_RESPONSE
+
+    def _execute_tool_calls(self, response: str, track_pending: bool = True) -> str:
+        """执行回答中的工具调用,并用执行结果替换调用标记
+
+        Args:
+            response: LLM 回答
+            track_pending: 是否把调用登记为待执行并写检查点(无状态的单文件分析不登记)
+        """
+        if "<|FunctionCallBegin|>" not in response and "<|FunctionCallEnd|>" not in response:
+            return response
+
+        # 匹配 <|FunctionCallBegin|>...<|FunctionCallEnd|> 格式
+        tool_call_matches = re.findall(r'<\|FunctionCallBegin\|>(.*?)<\|FunctionCallEnd\|>', response, re.DOTALL)
+        for tool_call_str in tool_call_matches:
+            try:
+                tool_calls_data = json.loads(tool_call_str.strip())
+                if track_pending:
+                    # 先登记为待执行,进程中断后可从检查点恢复
+                    self._pending_tool_calls.extend(tool_calls_data)
+                    self._save_checkpoint()
+                for tool_call in tool_calls_data:
+                    tool_name = tool_call.get("name")
+                    parameters = tool_call.get("parameters", {})
+
+                    if tool_name == "TerminalTool":
+                        command = parameters.get("command")
+                        if command:
+                            print(f"🚀 执行命令: {command}")
+                            with self._span("tool", tool=tool_name):
+                                result = self.terminal_tool.run({"command": command})
+                            print(f"📋 命令结果:\n{result}")
+                            # 将(压缩后的)命令结果添加到响应中
+                            result = self.output_compressor.compress(result)
+                            full_match = f"<|FunctionCallBegin|>{tool_call_str}<|FunctionCallEnd|>"
+                            response = response.replace(full_match, f"命令执行结果:\n```\n{result}\n```")
+                    elif tool_name == "ExpandOutput":
+                        # 按句柄取回被压缩省略的输出
+                        result = self.expand_output(
+                            parameters.get("handle", ""), parameters.get("start", 1), parameters.get("end")
+                        )
+                        full_match = f"<|FunctionCallBegin|>{tool_call_str}<|FunctionCallEnd|>"
+                        response = response.replace(full_match, f"完整输出:\n```\n{result}\n```")
+                    if track_pending and tool_call in self._pending_tool_calls:
+                        self._pending_tool_calls.remove(tool_call)
+            except Exception as e:
+                print(f"[WARNING] 工具调用处理失败: {e}")
+                traceback.print_exc()
+        return response
+
     def _preprocess_by_mode(
         self,
         user_input: str,
         mode: str
-    ) -> List[ContextPacket]:
+    ) -> List["ContextPacket"]:
         """根据模式执行预处理,收集相关信息"""
+        if mode == "diff":
+            # 增量模式只看变更区域, 结果按提交哈希缓存在 IncrementalAnalyzer 中
+            return self._incremental.build_packets(self._diff_range) if self._diff_range else []
+
+        cached = self._preprocess_cache.get(mode)
+        if cached and self._preprocess_cache_fresh(mode, cached):
+            print("♻️ 复用预处理缓存")
+            registry.counter(
+                "maintainer_cache_requests_total", "Cache lookups by result",
+                labels={"cache": "preprocess", "result": "hit"}
+            ).inc()
+            return list(cached["packets"])
+        registry.counter(
+            "maintainer_cache_requests_total", "Cache lookups by result",
+            labels={"cache": "preprocess", "result": "miss"}
+        ).inc()
+
         packets = []
-        import platform
         system = platform.system().lower()
 
         if mode == "explore" or mode == "auto":
@@ -220,20 +638,23 @@ class CodebaseMaintainer:
                     # Linux/Mac 系统命令
                     structure = self.terminal_tool.run({"command": "find . -type f -name '*.py' | head -n 20"})
                 self.stats["commands_executed"] += 1
+                structure = self.output_compressor.compress(structure)
 
+                content = f"[代码库结构]\n{structure}"
                 packets.append(ContextPacket(
-                    content=f"[代码库结构]\n{structure}",
+                    content=content,
                     timestamp=datetime.now(),
-                    token_count=len(structure) // 4,
+                    token_count=count_tokens(content),
                     relevance_score=0.6,
                     metadata={"type": "code_structure", "source": "terminal"}
                 ))
             except Exception as e:
                 print(f"[WARNING] 代码库探索失败: {e}")
+                content = f"[代码库结构]\n探索失败: {str(e)}"
                 packets.append(ContextPacket(
-                    content=f"[代码库结构]\n探索失败: {str(e)}",
+                    content=content,
                     timestamp=datetime.now(),
-                    token_count=50,
+                    token_count=count_tokens(content),
                     relevance_score=0.3,
                     metadata={"type": "code_structure", "source": "terminal", "error": str(e)}
                 ))
@@ -257,20 +678,23 @@ class CodebaseMaintainer:
                     todos = self.terminal_tool.run({"command": "grep -rn 'TODO\\|FIXME' --include='*.py' | head -n 10"})
 
                 self.stats["commands_executed"] += 2
+                todos = self.output_compressor.compress(todos)
 
+                content = f"[代码统计]\n{loc}\n\n[待办事项]\n{todos}"
                 packets.append(ContextPacket(
-                    content=f"[代码统计]\n{loc}\n\n[待办事项]\n{todos}",
+                    content=content,
                     timestamp=datetime.now(),
-                    token_count=(len(loc) + len(todos)) // 4,
+                    token_count=count_tokens(content),
                     relevance_score=0.7,
                     metadata={"type": "code_analysis", "source": "terminal"}
                 ))
             except Exception as e:
                 print(f"[WARNING] 代码质量分析失败: {e}")
+                content = f"[代码统计]\n分析失败: {str(e)}"
                 packets.append(ContextPacket(
-                    content=f"[代码统计]\n分析失败: {str(e)}",
+                    content=content,
                     timestamp=datetime.now(),
-                    token_count=50,
+                    token_count=count_tokens(content),
                     relevance_score=0.3,
                     metadata={"type": "code_analysis", "source": "terminal", "error": str(e)}
                 ))
@@ -289,36 +713,91 @@ class CodebaseMaintainer:
                 # 处理返回结果
                 if isinstance(task_notes, str):
                     # 如果是字符串，直接使用
+                    content = f"[当前任务]\n{task_notes}"
                     packets.append(ContextPacket(
-                        content=f"[当前任务]\n{task_notes}",
+                        content=content,
                         timestamp=datetime.now(),
-                        token_count=len(task_notes) // 4,
+                        token_count=count_tokens(content),
                         relevance_score=0.8,
                         metadata={"type": "task_plan", "source": "notes"}
                     ))
                 elif isinstance(task_notes, list):
                     # 如果是列表，格式化显示
                     if task_notes:
-                        content = "\n".join([f"- {note.get('title', 'Untitled')}" for note in task_notes])
+                        content = "[当前任务]\n" + "\n".join(
+                            [f"- {note.get('title', 'Untitled')}" for note in task_notes]
+                        )
                         packets.append(ContextPacket(
-                            content=f"[当前任务]\n{content}",
+                            content=content,
                             timestamp=datetime.now(),
-                            token_count=len(content) // 4,
+                            token_count=count_tokens(content),
                             relevance_score=0.8,
                             metadata={"type": "task_plan", "source": "notes"}
                         ))
             except Exception as e:
                 print(f"[WARNING] 任务规划加载失败: {e}")
+                content = f"[当前任务]\n加载失败: {str(e)}"
                 packets.append(ContextPacket(
-                    content=f"[当前任务]\n加载失败: {str(e)}",
+                    content=content,
                     timestamp=datetime.now(),
-                    token_count=50,
+                    token_count=count_tokens(content),
                     relevance_score=0.3,
                     metadata={"type": "task_plan", "source": "notes", "error": str(e)}
                 ))
 
+        # 只缓存成功的预处理结果
+        if packets and not any("error" in p.metadata for p in packets):
+            with self._state_lock:
+                self._preprocess_cache[mode] = {
+                    "created_at": datetime.now().timestamp(),
+                    # 监听已运行时生成的缓存会被文件变更失效; 检查点恢复的条目不带此标记, 只按 TTL 判断
+                    "watched": bool(self.watcher and self.watcher.running),
+                    "packets": packets
+                }
+
         return packets
 
+    def _preprocess_cache_fresh(self, mode: str, cached: Dict[str, Any]) -> bool:
+        """本实例在监听开始后生成的工作区相关缓存一直有效直到被文件变更失效,其余按 TTL 判断
+
+        从检查点恢复的条目可能来自其他进程, 本实例的监听不会为它们触发失效, 因此只按 TTL 判断。
+        """
+        if (
+            mode not in NOTE_DRIVEN_MODES
+            and cached.get("watched")
+            and self.watcher and self.watcher.running
+            and cached["created_at"] >= self.watcher.started_at
+        ):
+            return True
+        return datetime.now().timestamp() - cached["created_at"] < PREPROCESS_CACHE_TTL
+
+    def _invalidate_note_caches(self):
+        """笔记变化后丢弃只依赖笔记的预处理缓存"""
+        with self._state_lock:
+            for mode in NOTE_DRIVEN_MODES:
+                self._preprocess_cache.pop(mode, None)
+
+    def _on_codebase_change(self, changes: Dict[str, str]):
+        """代码库监听回调(在监听线程中执行)"""
+        # 终端探索/分析结果依赖工作区,规划模式只依赖笔记
+        # 与 _save_checkpoint 的遍历互斥
+        with self._state_lock:
+            dropped = [mode for mode in list(self._preprocess_cache) if mode not in NOTE_DRIVEN_MODES]
+            for mode in dropped:
+                self._preprocess_cache.pop(mode, None)
+        if dropped:
+            registry.counter(
+                "maintainer_cache_invalidations_total", "Cache entries dropped by file changes",
+                labels={"cache": "preprocess"}
+            ).inc(len(dropped))
+        self.note_links.on_changes(changes)
+
+    def find_symbol(self, name: str) -> List[Dict[str, Any]]:
+        """在代码库符号索引中查找函数/类/方法定义(监听未启用时返回空列表)"""
+        if not self.watcher or not self.watcher.wait_ready(5):
+            return []
+        return self.watcher.symbols.lookup(name)
+
     def _retrieve_relevant_notes(self, query: str, limit: int = 3) -> List[Dict]:
         """检索相关笔记"""
         try:
@@ -366,55 +845,70 @@ class CodebaseMaintainer:
             print(f"[WARNING] 笔记检索失败: {e}")
             return []
 
-    def _notes_to_packets(self, notes: List[Dict]) -> List[ContextPacket]:
-        """将笔记转换为上下文包"""
-        packets = []
+    def _retrieve_graph_memories(self, query: str, batch: "PacketBatch", limit: int = 3):
+        """通过概念图多跳扩展召回相关记忆,追加到候选批次"""
+        if self.concept_graph is None:
+            return
+        try:
+            memories = self.concept_graph.recall_memories(self.project_name, query, k=2, limit=limit)
+        except Exception as e:
+            print(f"[WARNING] 概念图记忆召回失败: {e}")
+            return
+
+        for memory in memories:
+            batch.add(
+                f"[记忆:{memory['memory_type']}]\n{memory['content']}",
+                min(1.0, 0.5 + memory["score"]),
+                "memory",
+                timestamp=memory["timestamp"],
+                metadata={"memory_type": memory["memory_type"], "memory_id": memory["id"]}
+            )
 
+    def _add_note_candidates(self, notes: List[Dict], batch: "PacketBatch"):
+        """将笔记追加到候选批次"""
         for note in notes:
             # 根据笔记类型设置不同的相关性分数
-            relevance_map = {
-                "blocker": 0.9,
-                "action": 0.8,
-                "task_state": 0.75,
-                "conclusion": 0.7
-            }
-
             note_type = note.get('type', 'general')
-            relevance = relevance_map.get(note_type, 0.6)
+            relevance = NOTE_RELEVANCE.get(note_type, 0.6)
 
             title = note.get('title', 'Untitled')
             content = note.get('content', '')
-            updated_at = note.get('updated_at', datetime.now().isoformat())
             note_id = note.get('note_id') or note.get('id')
 
             packet_content = f"[笔记:{title}]\n类型: {note_type}\n\n{content}"
+            stale_files = self.note_links.stale_files(note_id) if note_id and self.note_links else []
+            if stale_files:
+                packet_content += f"\n\n⚠️ 笔记引用的文件此后已变更: {', '.join(stale_files)}"
 
             try:
-                # 尝试解析时间戳
-                timestamp = datetime.fromisoformat(updated_at)
-            except (ValueError, TypeError):
-                # 如果解析失败，使用当前时间
-                timestamp = datetime.now()
-
-            packets.append(ContextPacket(
-                content=packet_content,
+                # 尝试解析时间戳,失败时使用当前时间
+                timestamp = datetime.fromisoformat(note['updated_at']).timestamp()
+            except (KeyError, ValueError, TypeError):
+                timestamp = None
+
+            batch.add(
+                packet_content,
+                relevance,
+                "note",
                 timestamp=timestamp,
-                token_count=len(packet_content) // 4,
-                relevance_score=relevance,
-                metadata={
-                    "type": "note",
-                    "note_type": note_type,
-                    "note_id": note_id
-                }
-            ))
+                metadata={"note_type": note_type, "note_id": note_id}
+            )
 
-        return packets
+    def _candidate_budget(self, system_instructions: str) -> int:
+        """候选包可用的 token 预算: 总预算扣除生成余量和(总是先放入的)系统指令"""
+        config = self.context_config
+        available = int(config.max_tokens * (1 - config.reserve_ratio))
+        return max(0, available - count_tokens(system_instructions))
 
-    def _build_system_instructions(self, mode: str) -> str:
-        """构建系统指令"""
-        import platform
+    def _static_instructions(self) -> str:
+        """静态系统指令: 同一项目和平台下逐字节不变,放在 prompt 最前面以命中服务端前缀缓存
+
+        会话ID、模式等随会话/轮次变化的内容不放在这里(见 _assemble_prompt)。
+        """
+        if self._static_prompt is not None:
+            return self._static_prompt
         system = platform.system().lower()
-        
+
         if system == "windows":
             # Windows 系统指令
             base_instructions = f"""你是 {self.project_name} 项目的代码库维护助手。
@@ -423,8 +917,7 @@ class CodebaseMaintainer:
 1. 使用 TerminalTool 探索代码库(dir, type, findstr, find等)
 2. 使用 NoteTool 记录发现和任务
 3. 基于历史笔记提供连贯的建议
-
-当前会话ID: {self.session_id}
+4. 过长的命令输出会被压缩并附带句柄(out_...),需要被省略的内容时调用 ExpandOutput 工具(参数 handle, start, end)
 
 重要提示:
 - 在 Windows 系统上，使用 dir 命令列出文件，而不是 ls 命令
@@ -439,46 +932,45 @@ class CodebaseMaintainer:
 1. 使用 TerminalTool 探索代码库(ls, cat, grep, find等)
 2. 使用 NoteTool 记录发现和任务
 3. 基于历史笔记提供连贯的建议
-
-当前会话ID: {self.session_id}
+4. 过长的命令输出会被压缩并附带句柄(out_...),需要被省略的内容时调用 ExpandOutput 工具(参数 handle, start, end)
 """
 
-        mode_specific = {
-            "explore": """
-当前模式: 探索代码库
-
-你应该:
-- 主动使用 terminal 命令了解代码结构
-- 识别关键模块和文件
-- 记录项目架构到笔记
-""",
-            "analyze": """
-当前模式: 分析代码质量
-
-你应该:
-- 查找代码问题(重复、复杂度、TODO等)
-- 评估代码质量
-- 将发现的问题记录为 blocker 或 action 笔记
-""",
-            "plan": """
-当前模式: 任务规划
+        self._static_prompt = base_instructions
+        return base_instructions
 
-你应该:
-- 回顾历史笔记和任务
-- 制定下一步行动计划
-- 更新任务状态笔记
-""",
-            "auto": """
-当前模式: 自动决策
+    def _pin_project_context(self, packets: List["ContextPacket"]):
+        """把预处理结果按规范顺序(类型、内容)固定到项目上下文段,返回 (固定的包, 放不下的包)
 
-你应该:
-- 根据用户需求灵活选择策略
-- 在需要时使用工具
-- 保持回答的专业性和实用性
-"""
-        }
-
-        return base_instructions + mode_specific.get(mode, mode_specific["auto"])
+        预处理结果只在代码库变更时才变化,顺序固定后这一段在多轮对话间保持逐字节不变。
+        """
+        config = self.context_config
+        budget = int(config.max_tokens * (1 - config.reserve_ratio) * PINNED_CONTEXT_RATIO)
+        pinned, overflow = [], []
+        used = 0
+        for packet in sorted(packets, key=lambda p: (str((p.metadata or {}).get("type", "")), p.content)):
+            if used + packet.token_count <= budget:
+                pinned.append(packet)
+                used += packet.token_count
+            else:
+                overflow.append(packet)
+        return pinned, overflow
+
+    def _assemble_prompt(self, static: str, project: str, volatile: str) -> str:
+        """按 静态指令 -> 项目上下文 -> 本轮内容 的固定顺序拼接系统 prompt,并记录稳定前缀的哈希"""
+        prefix = f"{static}\n\n{project}\n\n" if project else f"{static}\n\n"
+        static_hash = hashlib.sha256(static.encode("utf-8")).hexdigest()[:12]
+        prefix_hash = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+        if self.prompt_prefix.get("prefix_hash") == prefix_hash:
+            self.prompt_prefix["stable_turns"] += 1
+        else:
+            self.prompt_prefix = {
+                "static_hash": static_hash,
+                "prefix_hash": prefix_hash,
+                "prefix_tokens": count_tokens(prefix),
+                "stable_turns": 0
+            }
+        observe_prompt_prefix(self.project_name, static_hash, prefix_hash, self.prompt_prefix["prefix_tokens"])
+        return prefix + volatile
 
     def _postprocess_response(self, user_input: str, response: str):
         """后处理:分析回答,自动记录重要信息"""
@@ -486,34 +978,89 @@ class CodebaseMaintainer:
         # 如果发现问题,自动创建 blocker 笔记
         if any(keyword in response.lower() for keyword in ["问题", "bug", "错误", "阻塞"]):
             try:
-                self.note_tool.run({
-                    "action": "create",
-                    "title": f"发现问题: {user_input[:30]}...",
-                    "content": f"## 用户输入\n{user_input}\n\n## 问题分析\n{response[:500]}...",
-                    "note_type": "blocker",
-                    "tags": [self.project_name, "auto_detected", self.session_id]
-                })
-                self.stats["notes_created"] += 1
-                self.stats["issues_found"] += 1
-                print("📝 已自动创建问题笔记")
+                created = self._upsert_auto_note(
+                    question=user_input,
+                    title=f"发现问题: {user_input[:30]}...",
+                    content=f"## 用户输入\n{user_input}\n\n## 问题分析\n{response[:500]}...",
+                    note_type="blocker",
+                    tags=[self.project_name, "auto_detected", self.session_id]
+                )
+                if created:
+                    self.stats["issues_found"] += 1
+                    print("📝 已自动创建问题笔记")
+                else:
+                    print("📝 已更新已有的问题笔记")
             except Exception as e:
                 print(f"[WARNING] 创建笔记失败: {e}")
 
         # 如果是任务规划,自动创建 action 笔记
         elif any(keyword in user_input.lower() for keyword in ["计划", "下一步", "任务", "todo"]):
             try:
-                self.note_tool.run({
-                    "action": "create",
-                    "title": f"任务规划: {user_input[:30]}...",
-                    "content": f"## 讨论\n{user_input}\n\n## 行动计划\n{response[:500]}...",
-                    "note_type": "action",
-                    "tags": [self.project_name, "planning", self.session_id]
-                })
-                self.stats["notes_created"] += 1
-                print("📝 已自动创建行动计划笔记")
+                created = self._upsert_auto_note(
+                    question=user_input,
+                    title=f"任务规划: {user_input[:30]}...",
+                    content=f"## 讨论\n{user_input}\n\n## 行动计划\n{response[:500]}...",
+                    note_type="action",
+                    tags=[self.project_name, "planning", self.session_id]
+                )
+                print("📝 已自动创建行动计划笔记" if created else "📝 已更新已有的行动计划笔记")
             except Exception as e:
                 print(f"[WARNING] 创建笔记失败: {e}")
 
+    def _upsert_auto_note(
+        self,
+        question: str,
+        title: str,
+        content: str,
+        note_type: str,
+        tags: List[str]
+    ) -> bool:
+        """创建自动笔记,SimHash 命中内容相近的同类笔记时把新内容追加到原笔记
+
+        Returns:
+            bool: True 表示新建, False 表示合并到已有笔记
+        """
+        duplicate_id = self.note_dedup.find_duplicate(note_type, question, content)
+        if duplicate_id:
+            merged_tags = list(dict.fromkeys(self.note_dedup.get_tags(duplicate_id) + tags))
+            existing = self.note_dedup.get_content(duplicate_id).rstrip()
+            # 追加而不是覆盖, 已有的发现不会丢失; 完全相同的内容不重复追加
+            merged_content = content if not existing else (
+                existing if content.strip() in existing else f"{existing}\n\n---\n\n{content}"
+            )
+            self.note_tool.run({
+                "action": "update",
+                "note_id": duplicate_id,
+                "content": merged_content,
+                "tags": merged_tags
+            })
+            self.note_dedup.add(duplicate_id, note_type, question, merged_content)
+            if self.note_links:
+                self.note_links.update_note(duplicate_id)
+            self._invalidate_note_caches()
+            self.stats["notes_merged"] += 1
+            return False
+
+        result = self.note_tool.run({
+            "action": "create",
+            "title": title,
+            "content": content,
+            "note_type": note_type,
+            "tags": tags
+        })
+        match = re.search(r"note_\d{8}_\d{6}_\d+", str(result))
+        if match:
+            self.note_dedup.add(match.group(0), note_type, question, content)
+            if self.note_links:
+                self.note_links.update_note(match.group(0))
+        else:
+            self.note_dedup.rebuild()
+            if self.note_links:
+                self.note_links.rebuild()
+        self._invalidate_note_caches()
+        self.stats["notes_created"] += 1
+        return True
+
     def _update_history(self, user_input: str, response: str):
         """更新对话历史"""
         self.conversation_history.append(
@@ -527,6 +1074,137 @@ class CodebaseMaintainer:
         if len(self.conversation_history) > 20:
             self.conversation_history = self.conversation_history[-20:]
 
+    # === 耗时统计 ===
+
+    @contextmanager
+    def _span(self, stage: str, **attrs):
+        """记录一个阶段(或一次工具调用)的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            key = f"{stage}:{attrs['tool']}" if "tool" in attrs else stage
+            self._turn_spans.append({"stage": key, "seconds": round(elapsed, 6), **attrs})
+            self._observe_stage(key, elapsed)
+            if "tool" in attrs:
+                registry.counter(
+                    "maintainer_tool_calls_total", "Tool executions",
+                    labels={"tool": attrs["tool"]}
+                ).inc()
+
+    def _observe_stage(self, key: str, elapsed: float):
+        self.stage_latency.setdefault(key, Histogram()).observe(elapsed)
+        if key.startswith("tool:"):
+            registry.histogram(
+                "maintainer_tool_call_seconds", "Tool call latency",
+                labels={"tool": key[len("tool:"):]}
+            ).observe(elapsed)
+        else:
+            registry.histogram(
+                "maintainer_stage_seconds", "CodebaseMaintainer.run stage latency",
+                labels={"stage": key}
+            ).observe(elapsed)
+
+    def _record_token_usage(
+        self,
+        mode: str,
+        context: str,
+        user_input: str,
+        response: str,
+        sources: Dict[str, List[str]]
+    ):
+        """记录本轮 token 消耗,优先使用服务端返回的 usage"""
+        try:
+            breakdown = attribute_context(context, sources)
+            breakdown["user_input"] = count_tokens(user_input)
+            usage = getattr(self.llm, "last_usage", None)
+            if isinstance(usage, dict) and usage.get("prompt_tokens"):
+                prompt_tokens = int(usage["prompt_tokens"])
+                completion_tokens = int(usage.get("completion_tokens", 0))
+                usage_source = "provider"
+            else:
+                prompt_tokens = sum(breakdown.values())
+                completion_tokens = count_tokens(response)
+                usage_source = "estimate"
+
+            self.token_ledger.record(mode, prompt_tokens, completion_tokens, breakdown, usage_source)
+            registry.counter("llm_tokens_total", "LLM tokens", labels={"kind": "prompt", "mode": mode}).inc(prompt_tokens)
+            registry.counter("llm_tokens_total", "LLM tokens", labels={"kind": "completion", "mode": mode}).inc(completion_tokens)
+            for source, tokens in breakdown.items():
+                registry.counter(
+                    "llm_context_tokens_total", "Prompt tokens by context source",
+                    labels={"source": source}
+                ).inc(tokens)
+        except Exception as e:
+            print(f"[WARNING] token 统计失败: {e}")
+
+    # === 会话检查点 ===
+
+    def _save_checkpoint(self):
+        """持久化当前会话状态"""
+        try:
+            # 监听线程会在失效时修改预处理缓存, 序列化期间持有实例锁
+            with self._state_lock:
+                self.checkpoint_store.save(
+                    session_id=self.session_id,
+                    project_name=self.project_name,
+                    codebase_path=self.codebase_path,
+                    conversation_history=self.conversation_history,
+                    stats=self.stats,
+                    preprocess_cache=self._preprocess_cache,
+                    pending_tool_calls=self._pending_tool_calls,
+                    last_context=self._last_context,
+                    token_totals=self.token_ledger.session_totals,
+                    profile_enabled=self.profile_enabled
+                )
+        except Exception as e:
+            print(f"[WARNING] 保存会话检查点失败: {e}")
+
+    def _restore_checkpoint(self, session_id: str):
+        """从检查点恢复会话状态"""
+        try:
+            payload = self.checkpoint_store.load(session_id)
+        except Exception as e:
+            print(f"[WARNING] 读取会话检查点失败: {e}")
+            return
+        if payload is None:
+            return
+
+        self.conversation_history = [
+            Message(content=m["content"], role=m["role"], timestamp=m["timestamp"] or datetime.now())
+            for m in payload["conversation_history"]
+        ]
+        self.stats.update(payload["stats"])
+        self._preprocess_cache = {
+            mode: {
+                "created_at": entry["created_at"],
+                "packets": [ContextPacket(**p) for p in entry["packets"]]
+            }
+            for mode, entry in payload["preprocess_cache"].items()
+        }
+        self._pending_tool_calls = payload["pending_tool_calls"]
+        self._last_context = payload["last_context"]
+        self.token_ledger.restore(payload.get("token_totals"))
+        self.profile_enabled = bool(payload.get("profile_enabled", False))
+
+        print(f"♻️ 已从检查点恢复会话: {session_id} ({len(self.conversation_history) // 2} 轮对话)")
+        if self._pending_tool_calls:
+            print(f"⚠️ 有 {len(self._pending_tool_calls)} 个未完成的工具调用,可调用 resume_pending_tools() 继续执行")
+
+    def resume_pending_tools(self) -> List[str]:
+        """执行检查点中未完成的工具调用"""
+        results = []
+        for tool_call in list(self._pending_tool_calls):
+            if tool_call.get("name") == "TerminalTool":
+                command = tool_call.get("parameters", {}).get("command")
+                if command:
+                    print(f"🚀 执行命令: {command}")
+                    results.append(self.execute_command(command))
+            self._pending_tool_calls.remove(tool_call)
+        self._save_checkpoint()
+        return results
+
     # === 便捷方法 ===
 
     def explore(self, target: str = ".") -> str:
@@ -538,6 +1216,30 @@ class CodebaseMaintainer:
         query = f"请分析代码质量" + (f",重点关注{focus}" if focus else "")
         return self.run(query, mode="analyze")
 
+    def analyze_diff(self, rev_range: str = "HEAD~1..HEAD", focus: str = "") -> str:
+        """增量分析: 只分析 git 修订范围内的变更及其直接依赖方
+
+        Args:
+            rev_range: "A..B" 或 "A"(等价于 A..HEAD),直接从 git 对象库读取,不检出工作区
+            focus: 额外关注点
+        """
+        from incremental_analysis import IncrementalAnalyzer, GitError
+        try:
+            if self._incremental is None:
+                self._incremental = IncrementalAnalyzer(self.codebase_path, f"./{self.project_name}_sessions")
+            diff = self._incremental.collect(rev_range)
+        except GitError as e:
+            return f"❌ 增量分析失败: {e}"
+        if not diff["files"]:
+            return f"✅ {rev_range} 范围内没有变更"
+
+        self._diff_range = rev_range
+        try:
+            query = f"请分析 {rev_range} 中 {len(diff['files'])} 个文件的变更" + (f",重点关注{focus}" if focus else "")
+            return self.run(query, mode="diff")
+        finally:
+            self._diff_range = None
+
     def plan_next_steps(self) -> str:
         """规划下一步任务"""
         return self.run("根据当前进度,规划下一步任务", mode="plan")
@@ -548,6 +1250,10 @@ class CodebaseMaintainer:
         self.stats["commands_executed"] += 1
         return result
 
+    def expand_output(self, handle: str, start: int = 1, end: Optional[int] = None) -> str:
+        """按句柄取回被压缩的工具输出原文(按行范围)"""
+        return self.output_compressor.expand(handle, start, end)
+
     def create_note(
         self,
         title: str,
@@ -563,6 +1269,7 @@ class CodebaseMaintainer:
             "note_type": note_type,
             "tags": tags or [self.project_name]
         })
+        self._invalidate_note_caches()
         self.stats["notes_created"] += 1
         return result
 
@@ -585,14 +1292,20 @@ class CodebaseMaintainer:
             "activity": {
                 "commands_executed": self.stats["commands_executed"],
                 "notes_created": self.stats["notes_created"],
+                "notes_merged": self.stats["notes_merged"],
                 "issues_found": self.stats["issues_found"]
             },
+            "tokens": self.token_ledger.session_totals,
+            "latency": {stage: hist.snapshot() for stage, hist in self.stage_latency.items()},
+            "last_turn_spans": list(self._turn_spans),
+            "prompt_prefix": dict(self.prompt_prefix),
             "notes": note_summary
         }
 
     def generate_report(self, save_to_file: bool = True) -> Dict[str, Any]:
         """生成会话报告"""
         report = self.get_stats()
+        report["project_tokens"] = self.token_ledger.project_totals()
 
         if save_to_file:
             report_file = f"maintainer_report_{self.session_id}.json"
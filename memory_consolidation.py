@@ -0,0 +1,351 @@
+"""
+记忆整理任务
+
+memories 表只增不减,检索成本随项目历史线性增长。整理任务定期:
+1. 按半衰期衰减 importance
+2. 按 memory_type 的保留策略清理过期/低重要性记忆
+3. 合并近似重复的记忆
+4. 将旧的 episodic 记忆按天汇总为 semantic 记忆
+5. 回收数据库空间(wal_checkpoint + VACUUM)
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from memory_store import MemoryStore, SQL_INSERT_MEMORY, ensure_indexes
+
+DAY_SECONDS = 86400
+
+
+@dataclass
+class RetentionPolicy:
+    """单个 memory_type 的保留策略"""
+    half_life_days: float = 30.0     # importance 衰减半衰期
+    max_age_days: Optional[float] = None  # 超过该天数直接删除(None 表示不限)
+    min_importance: float = 0.05     # 衰减后低于该值删除
+    max_rows: Optional[int] = None   # 每个用户最多保留条数(按 importance 保留)
+
+
+@dataclass
+class ConsolidationConfig:
+    """整理任务配置"""
+    retention: Dict[str, RetentionPolicy] = field(default_factory=lambda: {
+        "working": RetentionPolicy(half_life_days=1, max_age_days=7, min_importance=0.1, max_rows=200),
+        "episodic": RetentionPolicy(half_life_days=14, max_age_days=180, min_importance=0.05, max_rows=2000),
+        "semantic": RetentionPolicy(half_life_days=90, min_importance=0.02, max_rows=5000),
+        "perceptual": RetentionPolicy(half_life_days=7, max_age_days=30, min_importance=0.1, max_rows=500),
+    })
+    default_retention: RetentionPolicy = field(default_factory=RetentionPolicy)
+    duplicate_threshold: float = 0.9     # 词集合 Jaccard 相似度阈值
+    duplicate_window: int = 50           # 只与时间上相邻的 N 条比较
+    summarize_after_days: float = 7.0    # episodic 超过该天数后汇总
+    summarize_min_group: int = 3         # 同一天至少 N 条才汇总
+    vacuum_min_deleted: int = 200        # 删除行数达到该值才 VACUUM
+
+    def policy_for(self, memory_type: str) -> RetentionPolicy:
+        return self.retention.get(memory_type, self.default_retention)
+
+
+def _normalize(content: str) -> str:
+    return re.sub(r"\s+", " ", content).strip().lower()
+
+
+def _tokens(content: str) -> set:
+    # 英文按单词,中文按单字
+    return set(re.findall(r"[a-z0-9_]+|[一-鿿]", content))
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def extractive_summary(contents: List[str], max_chars: int = 1000) -> str:
+    """默认汇总方式: 取每条记忆首行,去重后拼接"""
+    lines = []
+    seen = set()
+    for content in contents:
+        first_line = content.strip().splitlines()[0] if content.strip() else ""
+        key = _normalize(first_line)
+        if key and key not in seen:
+            seen.add(key)
+            lines.append(f"- {first_line[:200]}")
+    return "\n".join(lines)[:max_chars]
+
+
+class MemoryConsolidator:
+    """记忆整理器"""
+
+    def __init__(
+        self,
+        store: MemoryStore,
+        config: Optional[ConsolidationConfig] = None,
+        summarizer: Optional[Callable[[List[str]], str]] = None
+    ):
+        self.store = store
+        self.config = config or ConsolidationConfig()
+        self.summarizer = summarizer or extractive_summary
+        self._ensure_state_table()
+
+    def _ensure_state_table(self):
+        with self.store.pool.transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS consolidation_state ("
+                "user_id TEXT PRIMARY KEY, last_run INTEGER NOT NULL)"
+            )
+
+    def run(self, user_id: Optional[str] = None, now: Optional[float] = None) -> Dict[str, int]:
+        """执行一次整理
+
+        Args:
+            user_id: 只整理指定用户(项目),None 表示全部
+            now: 当前时间戳(秒),便于测试
+
+        Returns:
+            Dict[str, int]: 各阶段处理的行数
+        """
+        now = now or time.time()
+        if not self.store.pool.indexes_complete:
+            ensure_indexes(self.store.pool)
+        with self.store.pool.connection() as conn:
+            if user_id:
+                user_ids = [user_id]
+            else:
+                user_ids = [r[0] for r in conn.execute("SELECT DISTINCT user_id FROM memories")]
+
+        result = {"decayed": 0, "pruned": 0, "merged": 0, "summarized": 0}
+        for uid in user_ids:
+            result["decayed"] += self._decay(uid, now)
+            result["pruned"] += self._prune(uid, now)
+            result["merged"] += self._merge_duplicates(uid)
+            result["summarized"] += self._summarize_episodic(uid, now)
+
+        deleted = result["pruned"] + result["merged"] + result["summarized"]
+        result["vacuumed"] = int(deleted >= self.config.vacuum_min_deleted and self.vacuum())
+        return result
+
+    # === 各阶段 ===
+
+    def _decay(self, user_id: str, now: float) -> int:
+        """按上次整理以来经过的时间衰减 importance"""
+        with self.store.pool.transaction() as conn:
+            row = conn.execute(
+                "SELECT last_run FROM consolidation_state WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO consolidation_state (user_id, last_run) VALUES (?, ?)",
+                (user_id, int(now))
+            )
+            if row is None:
+                return 0
+
+            elapsed_days = max(0.0, (now - row[0]) / DAY_SECONDS)
+            if elapsed_days == 0:
+                return 0
+
+            updated = 0
+            types = [r[0] for r in conn.execute(
+                "SELECT DISTINCT memory_type FROM memories WHERE user_id = ?", (user_id,)
+            )]
+            for memory_type in types:
+                factor = 0.5 ** (elapsed_days / self.config.policy_for(memory_type).half_life_days)
+                cursor = conn.execute(
+                    "UPDATE memories SET importance = importance * ? WHERE user_id = ? AND memory_type = ?",
+                    (factor, user_id, memory_type)
+                )
+                updated += cursor.rowcount
+            return updated
+
+    def _prune(self, user_id: str, now: float) -> int:
+        """按保留策略删除记忆"""
+        to_delete = []
+        with self.store.pool.connection() as conn:
+            types = [r[0] for r in conn.execute(
+                "SELECT DISTINCT memory_type FROM memories WHERE user_id = ?", (user_id,)
+            )]
+            for memory_type in types:
+                policy = self.config.policy_for(memory_type)
+                min_ts = now - policy.max_age_days * DAY_SECONDS if policy.max_age_days else -1
+                to_delete.extend(r[0] for r in conn.execute(
+                    "SELECT id FROM memories WHERE user_id = ? AND memory_type = ? "
+                    "AND (importance < ? OR timestamp < ?)",
+                    (user_id, memory_type, policy.min_importance, min_ts)
+                ))
+                if policy.max_rows:
+                    to_delete.extend(r[0] for r in conn.execute(
+                        "SELECT id FROM memories WHERE user_id = ? AND memory_type = ? "
+                        "ORDER BY importance DESC, timestamp DESC LIMIT -1 OFFSET ?",
+                        (user_id, memory_type, policy.max_rows)
+                    ))
+        return self._delete(set(to_delete))
+
+    def _merge_duplicates(self, user_id: str) -> int:
+        """合并近似重复的记忆,保留 importance 最高的一条"""
+        removed = set()
+        updates = {}
+        remap = []
+        with self.store.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, memory_type, content, importance FROM memories "
+                "WHERE user_id = ? ORDER BY memory_type, timestamp",
+                (user_id,)
+            ).fetchall()
+
+        by_type: Dict[str, List] = {}
+        for row in rows:
+            by_type.setdefault(row["memory_type"], []).append(row)
+
+        for type_rows in by_type.values():
+            exact: Dict[str, int] = {}
+            tokens = [_tokens(_normalize(r["content"])) for r in type_rows]
+            keep = [True] * len(type_rows)
+            importance = [r["importance"] for r in type_rows]
+
+            for i, row in enumerate(type_rows):
+                digest = hashlib.md5(_normalize(row["content"]).encode("utf-8")).hexdigest()
+                target = exact.get(digest)
+                if target is None:
+                    start = max(0, i - self.config.duplicate_window)
+                    for j in range(i - 1, start - 1, -1):
+                        if keep[j] and _jaccard(tokens[i], tokens[j]) >= self.config.duplicate_threshold:
+                            target = j
+                            break
+                if target is None:
+                    exact[digest] = i
+                    continue
+
+                keep[i] = False
+                importance[target] = max(importance[target], importance[i])
+                removed.add(row["id"])
+                remap.append((type_rows[target]["id"], row["id"]))
+                updates[type_rows[target]["id"]] = importance[target]
+
+        if not removed:
+            return 0
+
+        with self.store.pool.transaction() as conn:
+            conn.executemany(
+                "UPDATE memories SET importance = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(imp, mid) for mid, imp in updates.items()]
+            )
+            # 被合并记忆的概念关联转移到保留的记忆上
+            conn.executemany(
+                "INSERT OR IGNORE INTO memory_concepts (memory_id, concept_id, relevance_score) "
+                "SELECT ?, concept_id, relevance_score FROM memory_concepts WHERE memory_id = ?",
+                remap
+            )
+        return self._delete(removed)
+
+    def _summarize_episodic(self, user_id: str, now: float) -> int:
+        """把旧 episodic 记忆按天汇总为一条 semantic 记忆"""
+        cutoff = now - self.config.summarize_after_days * DAY_SECONDS
+        with self.store.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT id, content, timestamp, importance FROM memories "
+                "WHERE user_id = ? AND memory_type = 'episodic' AND timestamp < ? ORDER BY timestamp",
+                (user_id, cutoff)
+            ).fetchall()
+
+        groups: Dict[int, List] = {}
+        for row in rows:
+            groups.setdefault(int(row["timestamp"] // DAY_SECONDS), []).append(row)
+
+        new_rows = []
+        summarized = set()
+        for day, group in groups.items():
+            if len(group) < self.config.summarize_min_group:
+                continue
+            summary = self.summarizer([r["content"] for r in group])
+            if not summary:
+                continue
+            day_str = time.strftime("%Y-%m-%d", time.localtime(day * DAY_SECONDS))
+            new_rows.append((
+                f"consolidated_{uuid.uuid4().hex}",
+                user_id,
+                f"[{day_str} 会话汇总]\n{summary}",
+                "semantic",
+                int(group[-1]["timestamp"]),
+                max(r["importance"] for r in group),
+                json.dumps({"consolidated_from": len(group), "source": "episodic"}, ensure_ascii=False)
+            ))
+            summarized.update(r["id"] for r in group)
+
+        if not new_rows:
+            return 0
+        with self.store.pool.transaction() as conn:
+            conn.executemany(SQL_INSERT_MEMORY, new_rows)
+        return self._delete(summarized)
+
+    def _delete(self, memory_ids) -> int:
+        if not memory_ids:
+            return 0
+        params = [(mid,) for mid in memory_ids]
+        with self.store.pool.transaction() as conn:
+            conn.executemany("DELETE FROM memory_concepts WHERE memory_id = ?", params)
+            conn.executemany("DELETE FROM memories WHERE id = ?", params)
+        return len(params)
+
+    def vacuum(self) -> bool:
+        """回收空间,VACUUM 不能在事务内执行"""
+        try:
+            with self.store.pool.connection() as conn:
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.execute("VACUUM")
+            return True
+        except Exception as e:
+            print(f"[WARNING] 记忆库 VACUUM 失败: {e}")
+            return False
+
+
+class ConsolidationScheduler:
+    """后台定期执行整理任务的守护线程"""
+
+    def __init__(self, consolidator: MemoryConsolidator, interval: float = 3600):
+        self.consolidator = consolidator
+        self.interval = interval
+        self.last_result: Optional[Dict[str, int]] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="memory-consolidation", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_result = self.consolidator.run()
+                print(f"🧹 记忆整理完成: {self.last_result}")
+            except Exception as e:
+                print(f"[WARNING] 记忆整理失败: {e}")
+
+
+_scheduler: Optional[ConsolidationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def start_consolidation(store: MemoryStore, interval: float = 3600) -> Optional[ConsolidationScheduler]:
+    """启动进程内唯一的整理线程,interval <= 0 时不启动"""
+    global _scheduler
+    if interval <= 0:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = ConsolidationScheduler(MemoryConsolidator(store), interval=interval)
+            _scheduler.start()
+        return _scheduler
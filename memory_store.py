@@ -0,0 +1,175 @@
+"""
+记忆库 SQLite 存储调优层
+
+MemoryTool 的数据落在 memory_data/memory.db 中,每轮对话都会读写
+memories / concepts / memory_concepts / concept_relationships 四张表。
+这里提供:
+- WAL 模式 + busy_timeout,读写互不阻塞
+- 按数据库路径共享的小型连接池(多个 CodebaseMaintainer 共用)
+- 固定 SQL 文本 + sqlite3 语句缓存,等价于预编译语句
+- 事务内批量写入(本模块自己的写入路径: 概念关系、记忆整理)
+- 缺失的复合索引
+
+MemoryTool 每轮的读写在 hello_agents 内部用它自己的连接完成,不经过这里的连接池;
+它受益于数据库文件级的 WAL 设置和这里补齐的索引。
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+DEFAULT_DB_PATH = os.path.join(".", "memory_data", "memory.db")
+
+# 复合索引: (索引名, 表名, 列)
+COMPOSITE_INDEXES = [
+    ("idx_memories_user_type_ts", "memories", "user_id, memory_type, timestamp"),
+    ("idx_memories_user_importance", "memories", "user_id, importance"),
+    ("idx_memory_concepts_concept_memory", "memory_concepts", "concept_id, memory_id"),
+    ("idx_concept_rel_from_strength", "concept_relationships", "from_concept_id, strength"),
+    ("idx_concept_rel_to", "concept_relationships", "to_concept_id"),
+]
+
+# 固定 SQL 文本,sqlite3 按文本缓存编译结果
+SQL_INSERT_MEMORY = (
+    "INSERT OR REPLACE INTO memories "
+    "(id, user_id, content, memory_type, timestamp, importance, properties, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)"
+)
+SQL_INSERT_CONCEPT_RELATIONSHIP = (
+    "INSERT OR REPLACE INTO concept_relationships "
+    "(from_concept_id, to_concept_id, relationship_type, strength, properties) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+def _configure(conn: sqlite3.Connection):
+    """连接级 PRAGMA 设置"""
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-8000")
+
+
+class SQLiteConnectionPool:
+    """固定大小的 SQLite 连接池
+
+    WAL 模式下多个读连接可以与一个写连接并发;写操作额外通过
+    进程内的写锁串行化,避免在 SQLite 层面自旋等待 busy_timeout。
+    """
+
+    def __init__(self, db_path: str, size: int = 4, timeout: float = 10.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=size)
+        self._write_lock = threading.Lock()
+        # 复合索引涉及的表是否都已存在并建好索引(表由 MemoryTool 创建,可能晚于连接池)
+        self.indexes_complete = False
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        for _ in range(size):
+            conn = sqlite3.connect(
+                db_path,
+                timeout=timeout,
+                check_same_thread=False,
+                isolation_level=None,
+                cached_statements=256
+            )
+            conn.row_factory = sqlite3.Row
+            _configure(conn)
+            self._pool.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """借出一个连接,用完自动归还"""
+        conn = self._pool.get(timeout=self.timeout)
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """写事务: BEGIN IMMEDIATE ... COMMIT,异常时回滚"""
+        with self._write_lock, self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
+_pools: Dict[str, SQLiteConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str = DEFAULT_DB_PATH, size: int = 4) -> SQLiteConnectionPool:
+    """按数据库绝对路径获取共享连接池(创建时补齐索引,表尚未全部创建时每次获取都重试)"""
+    key = os.path.abspath(db_path)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SQLiteConnectionPool(key, size=size)
+            _pools[key] = pool
+        if not pool.indexes_complete:
+            ensure_indexes(pool)
+        return pool
+
+
+def ensure_indexes(pool: SQLiteConnectionPool) -> List[str]:
+    """创建缺失的复合索引,返回新建的索引名(表不存在时跳过,下次调用再补)"""
+    created = []
+    with pool.transaction() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        for name, table, columns in COMPOSITE_INDEXES:
+            if table in tables and name not in existing:
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+                created.append(name)
+    pool.indexes_complete = all(table in tables for _, table, _ in COMPOSITE_INDEXES)
+    if created:
+        with pool.connection() as conn:
+            conn.execute("ANALYZE")
+    return created
+
+
+class MemoryStore:
+    """memory.db 的连接池持有者和本项目自己的写入路径(概念图、记忆整理通过 pool 访问)"""
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, pool_size: int = 4):
+        self.pool = get_pool(db_path, size=pool_size)
+
+    def add_concept_relationships(self, rows: Iterable[Sequence[Any]]) -> int:
+        """批量写入概念关系: (from_id, to_id, relationship_type, strength, properties)"""
+        rows = list(rows)
+        if not rows:
+            return 0
+        with self.pool.transaction() as conn:
+            conn.executemany(SQL_INSERT_CONCEPT_RELATIONSHIP, rows)
+        return len(rows)
+
+
+def tune_memory_db(db_path: str = DEFAULT_DB_PATH) -> Optional[SQLiteConnectionPool]:
+    """为已有的 memory.db 开启 WAL 并补齐索引
+
+    WAL 是数据库文件级别的持久设置,开启后 MemoryTool 自身打开的
+    连接同样受益。应在 MemoryTool 建表之后调用; 表还不存在时索引留到下次调用补齐。
+    失败时返回 None,不影响主流程。
+    """
+    try:
+        return get_pool(db_path)
+    except Exception as e:
+        print(f"[WARNING] 记忆库调优失败: {e}")
+        return None
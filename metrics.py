@@ -0,0 +1,207 @@
+"""
+指标收集
+
+进程内的轻量指标注册表: Counter / Gauge / Histogram。
+Histogram 同时维护累积分桶(用于导出)和最近样本窗口(用于计算 p50/p95/p99)。
+"""
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# 延迟分桶(秒),覆盖从毫秒级工具调用到分钟级 LLM 调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Gauge:
+    """可增可减的瞬时值"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+
+class Histogram:
+    """分桶直方图 + 最近样本窗口"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            self._samples.append(value)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.bucket_counts[i] += 1
+
+    def percentile(self, q: float) -> float:
+        """最近窗口内的分位数(最近秩法), q 取 0-100"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return 0.0
+        rank = max(0, min(len(samples) - 1, math.ceil(q / 100 * len(samples)) - 1))
+        return samples[rank]
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else 0.0,
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6)
+        }
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class MetricsRegistry:
+    """按 (指标名, 标签) 管理指标实例"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Dict[LabelKey, object]] = {}
+        self._types: Dict[str, str] = {}
+        self._help: Dict[str, str] = {}
+
+    def _get(self, kind: str, name: str, help_text: str, labels: Optional[Dict[str, str]], factory):
+        key = _label_key(labels)
+        with self._lock:
+            if name in self._types and self._types[name] != kind:
+                raise ValueError(f"指标 {name} 已注册为 {self._types[name]}")
+            self._types[name] = kind
+            if help_text:
+                self._help[name] = help_text
+            series = self._metrics.setdefault(name, {})
+            metric = series.get(key)
+            if metric is None:
+                metric = factory()
+                series[key] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get("gauge", name, help_text, labels, Gauge)
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str = "",
+        labels: Optional[Dict[str, str]] = None,
+        buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def remove(self, name: str, labels: Optional[Dict[str, str]] = None):
+        """删除一个标签组合的序列(标签值会变化的 info 类指标用,避免序列无限增长)"""
+        with self._lock:
+            series = self._metrics.get(name)
+            if series is not None:
+                series.pop(_label_key(labels), None)
+
+    def collect(self) -> List[Tuple[str, str, str, Dict[LabelKey, object]]]:
+        """(指标名, 类型, 说明, {标签: 指标}) 列表"""
+        with self._lock:
+            return [
+                (name, self._types[name], self._help.get(name, ""), dict(series))
+                for name, series in sorted(self._metrics.items())
+            ]
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """JSON 友好的快照"""
+        result: Dict[str, Dict[str, object]] = {}
+        for name, kind, _, series in self.collect():
+            values = {}
+            for key, metric in series.items():
+                label = ",".join(f"{k}={v}" for k, v in key) or "_"
+                values[label] = metric.snapshot() if kind == "histogram" else metric.value
+            result[name] = values
+        return result
+
+
+# 进程级默认注册表
+registry = MetricsRegistry()
+
+
+def _format_labels(key: LabelKey, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(key) + sorted((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus(reg: Optional[MetricsRegistry] = None) -> str:
+    """按 Prometheus 文本格式(0.0.4)导出"""
+    reg = reg or registry
+    lines = []
+    for name, kind, help_text, series in reg.collect():
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, metric in series.items():
+            if kind == "histogram":
+                for bound, count in zip(metric.buckets, metric.bucket_counts):
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': repr(float(bound))})} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {metric.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {metric.sum}")
+                lines.append(f"{name}_count{_format_labels(key)} {metric.count}")
+            else:
+                lines.append(f"{name}{_format_labels(key)} {metric.value}")
+    return "\n".join(lines) + "\n"
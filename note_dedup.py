@@ -0,0 +1,187 @@
+"""
+自动笔记去重
+
+_postprocess_response 每次检测到 "问题"/"bug"/"错误" 都会新建 blocker 笔记,
+同一个问题每个会话问一次就多一条几乎相同的笔记。这里用 SimHash 指纹
+找到内容相近的同类笔记,命中时把新内容追加到原笔记而不是新建。
+问题相同但结论不同(例如 Web 端固定的分析提示词)不算重复。
+
+指纹索引持久化在笔记目录下的 fingerprints.json,缺失时从笔记文件重建。
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+FINGERPRINT_BITS = 64
+FINGERPRINT_FILE = "fingerprints.json"
+
+
+def _features(text: str) -> List[str]:
+    """特征: 英文单词 + 中文二元组"""
+    text = re.sub(r"\s+", " ", text.lower())
+    features = re.findall(r"[a-z_][a-z0-9_]+", text)
+    for run in re.findall(r"[一-鿿]+", text):
+        if len(run) == 1:
+            features.append(run)
+        else:
+            features.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return features
+
+
+def simhash(text: str) -> int:
+    """64 位 SimHash"""
+    weights: Dict[str, int] = {}
+    for feature in _features(text):
+        weights[feature] = weights.get(feature, 0) + 1
+
+    vector = [0] * FINGERPRINT_BITS
+    for feature, weight in weights.items():
+        h = int.from_bytes(hashlib.md5(feature.encode("utf-8")).digest()[:8], "big")
+        for bit in range(FINGERPRINT_BITS):
+            vector[bit] += weight if (h >> bit) & 1 else -weight
+
+    fingerprint = 0
+    for bit, value in enumerate(vector):
+        if value > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _parse_note_file(path: str) -> Optional[Dict[str, str]]:
+    """解析 NoteTool 的 markdown 笔记文件(front matter + 正文)"""
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    match = re.match(r"^---\n(.*?)\n---\n(.*)$", text, re.DOTALL)
+    if not match:
+        return None
+    meta = {}
+    for line in match.group(1).splitlines():
+        key, _, value = line.partition(":")
+        meta[key.strip()] = value.strip()
+    body = match.group(2)
+    heading = re.match(r"\s*# [^\n]*\n+", body)
+    question = re.search(r"## (?:用户输入|讨论)\n(.*?)\n\n## ", body, re.DOTALL)
+    try:
+        tags = json.loads(meta.get("tags", "[]"))
+    except ValueError:
+        tags = []
+    return {
+        "id": meta.get("id", ""),
+        "type": meta.get("type", ""),
+        "tags": tags,
+        "question": question.group(1) if question else "",
+        "content": body,
+        # 去掉 NoteTool 渲染的标题行, 即 update 时传入的 content
+        "text": body[heading.end():] if heading else body.lstrip("\n")
+    }
+
+
+class NoteDeduplicator:
+    """基于 SimHash 的笔记去重索引
+
+    同一类型、笔记内容指纹的汉明距离 <= content_distance 的笔记视为重复;
+    有多条时取内容距离最小的, 再按用户问题指纹的汉明距离取最近。
+    只有问题相近不算重复, 否则同一提示词下的不同发现会合并成一条。
+    """
+
+    def __init__(self, workspace: str, content_distance: int = 6):
+        self.workspace = workspace
+        self.content_distance = content_distance
+        self._path = os.path.join(workspace, FINGERPRINT_FILE)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self._path):
+            try:
+                with open(self._path, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+                return
+            except (OSError, ValueError):
+                pass
+        self.rebuild()
+
+    def _save(self):
+        os.makedirs(self.workspace, exist_ok=True)
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self._path)
+
+    def rebuild(self):
+        """扫描笔记目录重建指纹索引"""
+        entries = {}
+        if os.path.isdir(self.workspace):
+            for filename in sorted(os.listdir(self.workspace)):
+                if not (filename.startswith("note_") and filename.endswith(".md")):
+                    continue
+                try:
+                    note = _parse_note_file(os.path.join(self.workspace, filename))
+                except OSError:
+                    continue
+                if note and note["id"]:
+                    entries[note["id"]] = {
+                        "type": note["type"],
+                        "question": simhash(note["question"]),
+                        "content": simhash(note["content"])
+                    }
+        with self._lock:
+            self._entries = entries
+            self._save()
+
+    def find_duplicate(self, note_type: str, question: str, content: str) -> Optional[str]:
+        """返回最相近的重复笔记ID,没有则返回 None"""
+        question_fp = simhash(question)
+        content_fp = simhash(content)
+        best_id, best_distance = None, None
+        with self._lock:
+            entries = list(self._entries.items())
+        for note_id, entry in entries:
+            if entry["type"] != note_type:
+                continue
+            if not os.path.exists(os.path.join(self.workspace, f"{note_id}.md")):
+                continue
+            q_dist = hamming(question_fp, entry["question"])
+            c_dist = hamming(content_fp, entry["content"])
+            if c_dist <= self.content_distance:
+                distance = (c_dist, q_dist)
+                if best_distance is None or distance < best_distance:
+                    best_id, best_distance = note_id, distance
+        return best_id
+
+    def add(self, note_id: str, note_type: str, question: str, content: str):
+        with self._lock:
+            self._entries[note_id] = {
+                "type": note_type,
+                "question": simhash(question),
+                "content": simhash(content)
+            }
+            self._save()
+
+    def get_content(self, note_id: str) -> str:
+        """读取已有笔记的正文(不含标题行)"""
+        try:
+            note = _parse_note_file(os.path.join(self.workspace, f"{note_id}.md"))
+        except OSError:
+            return ""
+        return note["text"] if note else ""
+
+    def get_tags(self, note_id: str) -> List[str]:
+        """读取已有笔记的标签"""
+        try:
+            note = _parse_note_file(os.path.join(self.workspace, f"{note_id}.md"))
+        except OSError:
+            return []
+        return note["tags"] if note else []
+
+    def __len__(self) -> int:
+        return len(self._entries)
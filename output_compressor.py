@@ -0,0 +1,239 @@
+"""
+工具输出压缩
+
+find / grep / cat 等终端输出在进入回答和上下文前先压缩:
+
+- 路径列表: 按目录折叠为树,同一目录下的文件写在一行
+- grep -n 结果: 按文件分组,去掉每行重复的路径前缀
+- Python 源码: 超过 OUTLINE_MIN_LINES 行且包含导入/赋值/定义时只保留 import、顶层赋值和类/函数签名(基于 AST)
+- 其他输出: 合并连续重复的行,过长时只保留首尾
+
+原始输出按内容哈希保存在会话目录的 tool_outputs/ 下,压缩结果末尾附带句柄,
+需要省略的部分时用 expand(handle, start, end) 按行取回。
+"""
+
+import ast
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional
+
+from metrics import registry
+from token_accounting import count_tokens
+
+# 小于该 token 数的输出原样保留
+COMPRESS_MIN_TOKENS = int(os.getenv("TOOL_OUTPUT_COMPRESS_MIN_TOKENS", "200"))
+# 源码超过该行数时改为大纲
+OUTLINE_MIN_LINES = 80
+# 其他输出保留的首尾行数
+HEAD_LINES = 40
+TAIL_LINES = 10
+# 单行最大长度
+MAX_LINE_CHARS = 200
+# expand 一次最多返回的行数
+MAX_EXPAND_LINES = 200
+
+HANDLE_RE = re.compile(r"^out_[0-9a-f]{12}$")
+GREP_RE = re.compile(r"^([^:\s][^:]*\.\w+):(\d+):(.*)$")
+PATH_RE = re.compile(r"^(?:[A-Za-z]:)?[\w.\-/\\ ]+$")
+
+
+def _clip(line: str) -> str:
+    return line if len(line) <= MAX_LINE_CHARS else line[:MAX_LINE_CHARS] + " ..."
+
+
+def _mostly(lines: List[str], predicate, ratio: float = 0.8) -> bool:
+    return bool(lines) and sum(1 for line in lines if predicate(line)) >= ratio * len(lines)
+
+
+def _normalize_path(path: str) -> str:
+    path = path.strip().replace("\\", "/")
+    while path.startswith("./"):
+        path = path[2:]
+    return path
+
+
+def path_tree(lines: List[str]) -> str:
+    """路径列表 -> 目录树,每个目录一行列出其中的文件"""
+    paths = [_normalize_path(line) for line in lines]
+    # 绝对路径(如 Windows 的 dir /s /b)先去掉公共前缀
+    prefix = ""
+    if all(p.startswith("/") or re.match(r"^[A-Za-z]:/", p) for p in paths):
+        prefix = os.path.commonpath(paths) if len(paths) > 1 else os.path.dirname(paths[0])
+        paths = [p[len(prefix):].lstrip("/") for p in paths]
+
+    tree: Dict[str, dict] = {}
+    for path in paths:
+        parts = [p for p in path.split("/") if p]
+        node = tree
+        for part in parts[:-1]:
+            node = node.setdefault(part + "/", {})
+        if parts:
+            node.setdefault("", []).append(parts[-1])
+
+    out = [f"根目录: {prefix}"] if prefix else []
+
+    def render(node: dict, depth: int):
+        for name in sorted(k for k in node if k):
+            child = node[name]
+            files = child.get("", [])
+            out.append("  " * depth + name + (": " + ", ".join(sorted(files)) if files else ""))
+            render(child, depth + 1)
+
+    if tree.get(""):
+        out.append("./: " + ", ".join(sorted(tree[""])))
+    render(tree, 0)
+    return "\n".join(out)
+
+
+def group_grep(lines: List[str]) -> str:
+    """grep -n 输出按文件分组"""
+    groups: Dict[str, List[str]] = {}
+    others = []
+    for line in lines:
+        m = GREP_RE.match(line)
+        if m:
+            groups.setdefault(_normalize_path(m.group(1)), []).append(f"  {m.group(2)}: {_clip(m.group(3).strip())}")
+        elif line.strip():
+            others.append(_clip(line))
+    out = []
+    for path, matches in groups.items():
+        out.append(f"{path}:")
+        out.extend(matches)
+    return "\n".join(out + others)
+
+
+def python_outline(source: str) -> Optional[str]:
+    """Python 源码 -> 签名级大纲;无法解析时返回 None"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+    # 路径列表等纯表达式(如 app/module_0/views.py)也能被解析,没有定义和导入的不当作源码
+    definitions = (ast.Import, ast.ImportFrom, ast.Assign, ast.AnnAssign,
+                   ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+    if not any(isinstance(node, definitions) for node in tree.body):
+        return None
+    lines = source.splitlines()
+
+    def signature(node) -> str:
+        # 多行签名拼接到以冒号结尾的那一行
+        start = node.lineno - 1
+        end = start
+        while end < len(lines) - 1 and end - start < 10 and not lines[end].rstrip().endswith(":"):
+            end += 1
+        return " ".join(l.strip() for l in lines[start:end + 1])
+
+    def docline(node) -> str:
+        doc = ast.get_docstring(node)
+        return f'  """{doc.strip().splitlines()[0]}"""' if doc and doc.strip() else ""
+
+    out = [f"[文件大纲] 共 {len(lines)} 行,函数体已省略"]
+    imports = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            imports.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.append(f"{'.' * node.level}{node.module or ''}")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            out.append(f"L{node.lineno} {_clip(lines[node.lineno - 1].strip())}")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            out.append(f"L{node.lineno} {signature(node)}{docline(node)}")
+        elif isinstance(node, ast.ClassDef):
+            out.append(f"L{node.lineno} {signature(node)}{docline(node)}")
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    out.append(f"L{item.lineno}   {signature(item)}{docline(item)}")
+    if imports:
+        out.insert(1, "import: " + ", ".join(dict.fromkeys(imports)))
+    return "\n".join(out)
+
+
+def dedup_lines(lines: List[str]) -> List[str]:
+    """合并连续重复的行"""
+    out = []
+    previous, count = None, 0
+    for line in lines + [None]:
+        if line == previous:
+            count += 1
+            continue
+        if previous is not None:
+            out.append(_clip(previous) + (f"  [重复 {count} 次]" if count > 1 else ""))
+        previous, count = line, 1
+    return out
+
+
+class OutputCompressor:
+    """压缩工具输出并保存原文以便按需取回"""
+
+    def __init__(self, store_dir: str, min_tokens: int = COMPRESS_MIN_TOKENS):
+        self.store_dir = store_dir
+        self.min_tokens = min_tokens
+
+    def _save(self, output: str) -> str:
+        handle = "out_" + hashlib.sha1(output.encode("utf-8", "replace")).hexdigest()[:12]
+        path = os.path.join(self.store_dir, f"{handle}.txt")
+        if not os.path.exists(path):
+            os.makedirs(self.store_dir, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(output)
+            os.replace(tmp_path, path)
+        return handle
+
+    def compress(self, output: str) -> str:
+        """返回压缩后的输出;输出较短或压缩无收益时原样返回"""
+        if not isinstance(output, str):
+            output = str(output)
+        original_tokens = count_tokens(output)
+        if original_tokens < self.min_tokens:
+            return output
+
+        lines = output.splitlines()
+        content = [line for line in lines if line.strip()]
+        kind, compressed = "text", None
+        if _mostly(content, GREP_RE.match):
+            kind, compressed = "grep", group_grep(content)
+        elif _mostly(content, lambda l: PATH_RE.match(l) and ("/" in l or "\\" in l)):
+            kind, compressed = "paths", path_tree(content)
+        elif len(lines) >= OUTLINE_MIN_LINES:
+            compressed = python_outline(output)
+            kind = "outline"
+        if compressed is None:
+            kind = "text"
+            deduped = dedup_lines(lines)
+            if len(deduped) > HEAD_LINES + TAIL_LINES:
+                omitted = len(deduped) - HEAD_LINES - TAIL_LINES
+                deduped = deduped[:HEAD_LINES] + [f"... 省略 {omitted} 行 ..."] + deduped[-TAIL_LINES:]
+            compressed = "\n".join(deduped)
+
+        compressed_tokens = count_tokens(compressed)
+        if compressed_tokens >= original_tokens:
+            return output
+        try:
+            handle = self._save(output)
+        except OSError as e:
+            print(f"[WARNING] 工具输出保存失败: {e}")
+            return output
+        registry.counter(
+            "tool_output_tokens_saved_total", "Tokens removed from tool outputs by compression",
+            labels={"kind": kind}
+        ).inc(original_tokens - compressed_tokens)
+        return (
+            f"{compressed}\n[输出已压缩: 原始 {len(lines)} 行 {original_tokens} tokens -> {compressed_tokens} tokens, "
+            f"完整内容句柄 {handle}]"
+        )
+
+    def expand(self, handle: str, start: int = 1, end: Optional[int] = None) -> str:
+        """按句柄取回原始输出的第 start..end 行(从 1 开始,单次最多 MAX_EXPAND_LINES 行)"""
+        if not HANDLE_RE.match(handle or ""):
+            return f"❌ 无效的输出句柄: {handle}"
+        try:
+            with open(os.path.join(self.store_dir, f"{handle}.txt"), "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return f"❌ 输出句柄不存在: {handle}"
+        start = max(1, int(start))
+        end = min(len(lines), int(end) if end else start + MAX_EXPAND_LINES - 1, start + MAX_EXPAND_LINES - 1)
+        body = "\n".join(f"{i}: {lines[i - 1]}" for i in range(start, end + 1))
+        return f"{body}\n[{handle} 第 {start}-{end} 行, 共 {len(lines)} 行]"
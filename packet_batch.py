@@ -0,0 +1,150 @@
+"""
+列式上下文候选包
+
+每轮对话都要为笔记、记忆、预处理结果分别创建 ContextPacket(带 datetime 和 metadata 字典),
+候选数量上百时分配开销明显。PacketBatch 按列保存候选:
+
+- scores / tokens / timestamps: array 并行数组(相关性、token 数、epoch 秒)
+- types: 类型编码(类型名保存在共享的类型表中)
+- contents: 所有正文拼接为一个缓冲区,按 offsets 切片
+- metadata: 只为带额外字段的候选保存字典
+- features / feature_rows: 正文特征哈希及其所属候选(查询相似度打分用)
+
+打分和按预算装箱直接在数组上完成(见 context_scoring),只为最终入选的候选创建 ContextPacket
+交给 ContextBuilder。
+"""
+
+from array import array
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+
+from hello_agents.context import ContextPacket
+
+from context_scoring import pack, score_batch, text_features
+from token_accounting import count_tokens
+
+# 笔记和记忆每轮都会重新加入候选, 按正文缓存 token 数
+_content_tokens = lru_cache(maxsize=4096)(count_tokens)
+
+
+class PacketBatch:
+    """按列存储的候选上下文包"""
+
+    __slots__ = (
+        "scores", "tokens", "timestamps", "types", "offsets", "features", "feature_rows",
+        "final_scores", "_type_names", "_type_codes", "_chunks", "_buffer", "_metadata"
+    )
+
+    def __init__(self):
+        self.scores = array("d")
+        self.tokens = array("l")
+        self.timestamps = array("d")
+        self.types = array("H")
+        # 第 i 个候选的正文为 buffer[offsets[i]:offsets[i + 1]]
+        self.offsets = array("l", [0])
+        self.features = array("q")
+        self.feature_rows = array("q")
+        # 最近一次 select() 的综合分数
+        self.final_scores = None
+        self._type_names: List[str] = []
+        self._type_codes: Dict[str, int] = {}
+        self._chunks: List[str] = []
+        self._buffer: Optional[str] = ""
+        self._metadata: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def _type_code(self, packet_type: str) -> int:
+        code = self._type_codes.get(packet_type)
+        if code is None:
+            code = len(self._type_names)
+            self._type_names.append(packet_type)
+            self._type_codes[packet_type] = code
+        return code
+
+    def add(
+        self,
+        content: str,
+        relevance: float,
+        packet_type: str,
+        timestamp: Optional[float] = None,
+        token_count: int = 0,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> int:
+        """追加一个候选,返回其下标
+
+        Args:
+            relevance: 类型先验(0-1)
+            timestamp: epoch 秒,默认为当前时间
+            token_count: 0 时用 count_tokens 计算(与预算和最终 prompt 统计口径一致)
+            metadata: 除 type 以外的附加字段
+        """
+        index = len(self.scores)
+        self.scores.append(relevance)
+        self.tokens.append(token_count or _content_tokens(content))
+        self.timestamps.append(datetime.now().timestamp() if timestamp is None else timestamp)
+        self.types.append(self._type_code(packet_type))
+        self._chunks.append(content)
+        self.offsets.append(self.offsets[-1] + len(content))
+        self._buffer = None
+        features = text_features(content)
+        self.features.extend(features)
+        self.feature_rows.extend([index] * len(features))
+        if metadata:
+            self._metadata[index] = metadata
+        return index
+
+    def add_packet(self, packet: ContextPacket) -> int:
+        metadata = dict(packet.metadata or {})
+        packet_type = metadata.pop("type", "general")
+        return self.add(
+            packet.content,
+            packet.relevance_score,
+            packet_type,
+            timestamp=packet.timestamp.timestamp(),
+            token_count=packet.token_count,
+            metadata=metadata
+        )
+
+    def extend(self, packets: Iterable[ContextPacket]):
+        for packet in packets:
+            self.add_packet(packet)
+
+    @property
+    def buffer(self) -> str:
+        if self._buffer is None:
+            self._buffer = "".join(self._chunks)
+            self._chunks = [self._buffer]
+        return self._buffer
+
+    def content(self, index: int) -> str:
+        return self.buffer[self.offsets[index]:self.offsets[index + 1]]
+
+    def packet_type(self, index: int) -> str:
+        return self._type_names[self.types[index]]
+
+    def select(self, budget: int, min_relevance: float = 0.0, query: str = "") -> List[int]:
+        """按查询相似度、新近度和类型先验打分,在预算内选出总分最高的候选,按分数降序返回下标"""
+        self.final_scores = score_batch(self, query)
+        return pack(self.final_scores, self.tokens, budget, min_relevance)
+
+    def to_packets(self, indices: Optional[Iterable[int]] = None) -> List[ContextPacket]:
+        """只为给定下标创建 ContextPacket"""
+        if indices is None:
+            indices = range(len(self))
+        packets = []
+        for index in indices:
+            metadata = {"type": self.packet_type(index)}
+            metadata.update(self._metadata.get(index, {}))
+            packets.append(ContextPacket(
+                content=self.content(index),
+                timestamp=datetime.fromtimestamp(self.timestamps[index]),
+                token_count=self.tokens[index],
+                relevance_score=float(
+                    self.scores[index] if self.final_scores is None else self.final_scores[index]
+                ),
+                metadata=metadata
+            ))
+        return packets
@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 """
 为 my_flask_app 添加基本的代码
+
+也可以按种子确定性地生成大规模合成代码库,用于扫描、索引和上下文选择的压测:
+    python populate_my_flask_app.py --synthetic ./synthetic_repo --packages 200 --modules 50 --seed 42
 """
 
+import argparse
+import math
 import os
+import random
 import sys
+import time
 
 def create_file(file_path, content):
     """创建文件"""
@@ -95,5 +102,209 @@ print('Hello, Flask!')
     print("          └── user_service.py")
     print("\n🚀 现在可以运行 use.py 或 web_app.py 来分析这些代码了！")
 
+# === 合成代码库生成 ===
+
+SIZE_DISTRIBUTIONS = ("lognormal", "uniform", "fixed")
+
+TODO_MARKERS = ("TODO", "FIXME", "XXX")
+TODO_TEXTS = (
+    "处理异常情况",
+    "补充单元测试",
+    "拆分过长的函数",
+    "去掉硬编码配置",
+    "add input validation",
+    "cache this lookup",
+)
+ENTITY_NAMES = (
+    "user", "order", "product", "invoice", "payment", "cart", "session",
+    "report", "inventory", "shipment", "review", "coupon", "account", "audit",
+)
+
+
+def _sample_lines(rng, distribution, mean_lines):
+    """按分布采样单个文件的目标行数(至少 5 行)"""
+    if distribution == "fixed":
+        lines = mean_lines
+    elif distribution == "uniform":
+        lines = rng.randint(max(5, mean_lines // 4), mean_lines * 2)
+    else:
+        # 对数正态: 大多数文件较小,少量长尾大文件
+        sigma = 0.9
+        mu = math.log(mean_lines) - sigma ** 2 / 2
+        lines = int(rng.lognormvariate(mu, sigma))
+    return max(5, lines)
+
+
+def _make_function(rng, entity, index, todo_density):
+    """生成一个函数(带随机分支、循环和 TODO 注释)"""
+    name = f"{rng.choice(('get', 'update', 'validate', 'compute', 'sync', 'load'))}_{entity}_{index}"
+    body = [f"def {name}(items, limit=10):", f'    """处理 {entity} 数据"""', "    result = []"]
+    for step in range(rng.randint(2, 6)):
+        if rng.random() < todo_density:
+            body.append(f"    # {rng.choice(TODO_MARKERS)}: {rng.choice(TODO_TEXTS)}")
+        kind = rng.random()
+        if kind < 0.4:
+            body.append("    for item in items[:limit]:")
+            body.append(f"        if item.get('{entity}_id') == {step}:")
+            body.append("            result.append(item)")
+        elif kind < 0.7:
+            body.append(f"    if len(result) > {rng.randint(1, 50)}:")
+            body.append(f"        result = result[:{rng.randint(1, 20)}]")
+        else:
+            body.append(f"    total_{step} = sum(i.get('amount', 0) for i in items)")
+            body.append(f"    result.append({{'step': {step}, 'total': total_{step}}})")
+    body.append("    return result")
+    return name, body
+
+
+def _make_class(rng, entity, index, todo_density):
+    name = f"{entity.capitalize()}Model{index}"
+    lines = [f"class {name}:", f'    """{entity} 模型"""', "", "    def __init__(self, id, name):"]
+    lines.append("        self.id = id")
+    lines.append("        self.name = name")
+    for method in range(rng.randint(1, 4)):
+        lines.append("")
+        if rng.random() < todo_density:
+            lines.append(f"    # {rng.choice(TODO_MARKERS)}: {rng.choice(TODO_TEXTS)}")
+        lines.append(f"    def method_{method}(self, value):")
+        lines.append(f"        return self.id * {method + 1} + value")
+    return name, lines
+
+
+def _render_module(rng, module_path, sibling_imports, target_lines, duplication_rate, todo_density, duplicate_pool):
+    """生成单个模块源码"""
+    entity = rng.choice(ENTITY_NAMES)
+    lines = [f'"""{module_path} - 合成模块({entity})"""', ""]
+    lines.extend(sibling_imports)
+    lines.append("")
+
+    index = 0
+    while len(lines) < target_lines:
+        lines.append("")
+        if duplicate_pool and rng.random() < duplication_rate:
+            # 复制已有代码块,模拟重复代码
+            lines.extend(rng.choice(duplicate_pool))
+            continue
+        if rng.random() < 0.3:
+            _, block = _make_class(rng, entity, index, todo_density)
+        else:
+            _, block = _make_function(rng, entity, index, todo_density)
+        lines.extend(block)
+        if len(duplicate_pool) < 512:
+            duplicate_pool.append(block)
+        index += 1
+    return "\n".join(lines) + "\n"
+
+
+def generate_synthetic_codebase(
+    output_dir,
+    packages=10,
+    modules=20,
+    depth=2,
+    duplication_rate=0.1,
+    todo_density=0.05,
+    size_distribution="lognormal",
+    mean_lines=80,
+    seed=42,
+    verbose=True
+):
+    """确定性地生成合成代码库
+
+    Args:
+        output_dir: 输出目录
+        packages: 包数量
+        modules: 每个包的模块数
+        depth: 包的嵌套深度(每个包位于 depth 层子目录下)
+        duplication_rate: 代码块被复制自已有代码块的概率
+        todo_density: 每个代码块带 TODO/FIXME 注释的概率
+        size_distribution: 文件行数分布(lognormal / uniform / fixed)
+        mean_lines: 平均文件行数
+        seed: 随机种子,相同参数和种子生成完全相同的代码库
+
+    Returns:
+        dict: 生成统计
+    """
+    if size_distribution not in SIZE_DISTRIBUTIONS:
+        raise ValueError(f"未知的文件大小分布: {size_distribution}")
+
+    rng = random.Random(seed)
+    start = time.time()
+    duplicate_pool = []
+    created_dirs = set()
+    stats = {"files": 0, "lines": 0, "bytes": 0, "packages": packages, "modules_per_package": modules}
+
+    def ensure_package(path_parts):
+        for level in range(1, len(path_parts) + 1):
+            rel = os.path.join(*path_parts[:level])
+            if rel in created_dirs:
+                continue
+            created_dirs.add(rel)
+            os.makedirs(os.path.join(output_dir, rel), exist_ok=True)
+            with open(os.path.join(output_dir, rel, "__init__.py"), "w", encoding="utf-8") as f:
+                f.write('"""Python 包初始化文件"""\n')
+            stats["files"] += 1
+
+    module_names = []
+    for p in range(packages):
+        parts = [f"pkg_{p:04d}"] + [f"sub_{rng.randrange(max(1, packages // 10 + 1))}" for _ in range(max(0, depth - 1))]
+        ensure_package(parts)
+        for m in range(modules):
+            module_name = f"mod_{m:03d}"
+            dotted = ".".join(parts + [module_name])
+            # 只导入已生成的模块,保证导入图无环
+            imports = [f"import {rng.choice(module_names)}" for _ in range(min(len(module_names), rng.randint(0, 3)))]
+            source = _render_module(
+                rng,
+                dotted,
+                sorted(set(imports)),
+                _sample_lines(rng, size_distribution, mean_lines),
+                duplication_rate,
+                todo_density,
+                duplicate_pool
+            )
+            with open(os.path.join(output_dir, *parts, f"{module_name}.py"), "w", encoding="utf-8") as f:
+                f.write(source)
+            module_names.append(dotted)
+            stats["files"] += 1
+            stats["lines"] += source.count("\n")
+            stats["bytes"] += len(source.encode("utf-8"))
+            if verbose and stats["files"] % 5000 == 0:
+                print(f"  ... 已生成 {stats['files']} 个文件")
+
+    stats["seconds"] = round(time.time() - start, 2)
+    if verbose:
+        print(f"✅ 合成代码库已生成: {output_dir}")
+        print(f"   文件: {stats['files']}  行数: {stats['lines']}  大小: {stats['bytes'] / 1024 / 1024:.1f} MB  耗时: {stats['seconds']}s")
+    return stats
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="为 my_flask_app 添加基本代码,或生成合成代码库")
+    parser.add_argument("--synthetic", metavar="OUTPUT_DIR", help="生成合成代码库到指定目录")
+    parser.add_argument("--packages", type=int, default=10, help="包数量")
+    parser.add_argument("--modules", type=int, default=20, help="每个包的模块数")
+    parser.add_argument("--depth", type=int, default=2, help="包嵌套深度")
+    parser.add_argument("--dup-rate", type=float, default=0.1, help="重复代码块比例")
+    parser.add_argument("--todo-density", type=float, default=0.05, help="TODO/FIXME 注释密度")
+    parser.add_argument("--size-dist", choices=SIZE_DISTRIBUTIONS, default="lognormal", help="文件大小分布")
+    parser.add_argument("--mean-lines", type=int, default=80, help="平均文件行数")
+    parser.add_argument("--seed", type=int, default=42, help="随机种子")
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-    main()
+    args = parse_args()
+    if args.synthetic:
+        generate_synthetic_codebase(
+            args.synthetic,
+            packages=args.packages,
+            modules=args.modules,
+            depth=args.depth,
+            duplication_rate=args.dup_rate,
+            todo_density=args.todo_density,
+            size_distribution=args.size_dist,
+            mean_lines=args.mean_lines,
+            seed=args.seed
+        )
+    else:
+        main()
@@ -0,0 +1,176 @@
+"""
+采样式性能剖析
+
+在后台线程中定期采样目标线程的调用栈(sys._current_frames),
+结束后导出为 collapsed-stack 文本(flamegraph.pl / speedscope 均可读取)
+和 speedscope JSON。只在显式开启时创建采样线程,关闭时没有额外开销。
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(".", "profiles"))
+MAX_PROFILES = int(os.getenv("PROFILE_KEEP", "50"))
+
+FrameKey = Tuple[str, str, int]  # (文件, 函数名, 函数首行)
+
+
+class SamplingProfiler:
+    """对单个线程做定时栈采样
+
+    用法:
+        with SamplingProfiler(label="run_explore") as profiler:
+            do_work()
+        paths = profiler.save()
+    """
+
+    def __init__(self, label: str = "profile", interval: float = 0.005, thread_id: Optional[int] = None):
+        self.label = label
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks: Dict[Tuple[FrameKey, ...], int] = {}
+        self.samples = 0
+        self.started_at: Optional[datetime] = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = 0.0
+
+    def start(self) -> "SamplingProfiler":
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self.started_at = datetime.now()
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._start_time
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _sample_loop(self):
+        own_file = os.path.abspath(__file__)
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if os.path.abspath(code.co_filename) != own_file:
+                    stack.append((code.co_filename, code.co_name, code.co_firstlineno))
+                frame = frame.f_back
+            stack.reverse()
+            key = tuple(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    # === 导出 ===
+
+    @staticmethod
+    def _frame_name(frame: FrameKey) -> str:
+        filename, name, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def to_collapsed(self) -> str:
+        """collapsed-stack 格式: 每行 "frame;frame;frame count" """
+        lines = []
+        for stack, count in sorted(self.stacks.items(), key=lambda kv: -kv[1]):
+            if stack:
+                lines.append(";".join(self._frame_name(f).replace(";", ":") for f in stack) + f" {count}")
+        return "\n".join(lines) + "\n"
+
+    def to_speedscope(self) -> Dict:
+        """speedscope 'sampled' 格式,相同栈合并为一个样本并以权重表示时长"""
+        frames: List[Dict] = []
+        frame_index: Dict[FrameKey, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            indices = []
+            for frame in stack:
+                idx = frame_index.get(frame)
+                if idx is None:
+                    idx = len(frames)
+                    frame_index[frame] = idx
+                    frames.append({"name": frame[1], "file": frame[0], "line": frame[2]})
+                indices.append(idx)
+            samples.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.label,
+            "exporter": "code_agent.profiler",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.label,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+    def save(self, directory: str = PROFILE_DIR) -> Dict[str, str]:
+        """写出 .collapsed.txt 和 .speedscope.json,返回文件名信息"""
+        os.makedirs(directory, exist_ok=True)
+        safe_label = re.sub(r"[^A-Za-z0-9_.-]", "_", self.label)[:80]
+        name = f"{(self.started_at or datetime.now()).strftime('%Y%m%d_%H%M%S_%f')}_{safe_label}"
+        collapsed_path = os.path.join(directory, f"{name}.collapsed.txt")
+        speedscope_path = os.path.join(directory, f"{name}.speedscope.json")
+        with open(collapsed_path, "w", encoding="utf-8") as f:
+            f.write(self.to_collapsed())
+        with open(speedscope_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_speedscope(), f)
+        with open(os.path.join(directory, f"{name}.meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "name": name,
+                "label": self.label,
+                "started_at": self.started_at.isoformat() if self.started_at else None,
+                "duration_seconds": round(self.duration, 6),
+                "samples": self.samples,
+                "interval": self.interval
+            }, f, ensure_ascii=False)
+        prune_profiles(directory, MAX_PROFILES)
+        return {"name": name, "collapsed": collapsed_path, "speedscope": speedscope_path}
+
+
+def list_profiles(directory: str = PROFILE_DIR) -> List[Dict]:
+    """最近的剖析结果(按时间倒序)"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(directory), reverse=True):
+        if filename.endswith(".meta.json"):
+            try:
+                with open(os.path.join(directory, filename), "r", encoding="utf-8") as f:
+                    profiles.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    return profiles
+
+
+def prune_profiles(directory: str = PROFILE_DIR, keep: int = MAX_PROFILES):
+    """只保留最近 keep 份剖析结果"""
+    for meta in list_profiles(directory)[keep:]:
+        for suffix in (".collapsed.txt", ".speedscope.json", ".meta.json"):
+            path = os.path.join(directory, meta["name"] + suffix)
+            if os.path.exists(path):
+                os.remove(path)
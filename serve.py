@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Web 应用生产环境入口
+
+- 安装了 gunicorn 时: 多 worker 进程 + gthread 线程,共享状态使用 SQLite(STATE_STORE=sqlite)
+- 否则(如 Windows): 多线程 werkzeug 服务器,单进程
+
+两种方式都支持优雅退出: 收到 SIGTERM/SIGINT 后通知 SSE 流结束,
+停止接收新请求,并等待进行中的请求完成(最长 GRACEFUL_TIMEOUT 秒)。
+
+用法:
+    python serve.py --host 0.0.0.0 --port 5000 --workers 4 --threads 8
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _wait_inflight(web_app, timeout: float):
+    """等待进行中的请求结束"""
+    deadline = time.time() + timeout
+    while web_app.inflight_requests() > 0 and time.time() < deadline:
+        time.sleep(0.1)
+    remaining = web_app.inflight_requests()
+    if remaining:
+        print(f"[WARNING] 优雅退出超时, 仍有 {remaining} 个请求未完成")
+
+
+def serve_gunicorn(args):
+    """使用 gunicorn 多进程运行"""
+    from gunicorn.app.base import BaseApplication
+
+    # 多 worker 之间通过 SQLite 共享实时消息和活跃会话
+    if args.workers > 1:
+        os.environ.setdefault("STATE_STORE", "sqlite")
+
+    def post_worker_init(worker):
+        # gunicorn 的 SIGTERM 处理只停止接收新连接, SSE 长连接需要主动通知才能结束
+        import web_app
+        original = signal.getsignal(signal.SIGTERM)
+
+        def handle_term(signum, frame):
+            web_app.shutdown_event.set()
+            if callable(original):
+                original(signum, frame)
+
+        signal.signal(signal.SIGTERM, handle_term)
+
+    class StandaloneApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            import web_app
+            return web_app.app
+
+    print(f"🚀 gunicorn 启动: http://{args.host}:{args.port} (workers={args.workers}, threads={args.threads})")
+    StandaloneApplication({
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": args.threads,
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "post_worker_init": post_worker_init,
+    }).run()
+
+
+def serve_threaded(args):
+    """使用多线程 werkzeug 服务器运行(不支持多进程的平台)"""
+    from werkzeug.serving import make_server
+    import web_app
+
+    server = make_server(args.host, args.port, web_app.app, threaded=True)
+
+    def handle_signal(signum, frame):
+        web_app.shutdown_event.set()
+        # shutdown() 会等待 serve_forever 退出, 不能在主线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    print(f"🚀 多线程服务启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    finally:
+        print("🛑 正在优雅退出, 等待进行中的请求...")
+        _wait_inflight(web_app, args.graceful_timeout)
+        server.server_close()
+        print("✅ 服务已停止")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代码库维护助手 Web 服务")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "8")), help="每个 worker 的线程数")
+    parser.add_argument("--timeout", type=int, default=int(os.getenv("WEB_TIMEOUT", "300")), help="单个请求超时(秒), LLM 调用较慢")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("GRACEFUL_TIMEOUT", "30")))
+    parser.add_argument("--threaded", action="store_true", help="强制使用单进程多线程服务器")
+    args = parser.parse_args()
+
+    if not args.threaded:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            print("[WARNING] 未安装 gunicorn, 使用单进程多线程服务器")
+            args.threaded = True
+
+    if args.threaded:
+        serve_threaded(args)
+    else:
+        serve_gunicorn(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""
+会话检查点存储
+
+将 CodebaseMaintainer 的对话历史、统计信息、预处理上下文缓存和
+待执行的工具调用持久化到磁盘,服务重启后可以按会话ID恢复,
+避免重新执行探索轮次。
+"""
+
+import gzip
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+CHECKPOINT_VERSION = 1
+
+
+def _encode_datetime(value: Any) -> Any:
+    """datetime 转为 ISO 字符串,其余原样返回"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_datetime(value: Any) -> Any:
+    """尝试将 ISO 字符串还原为 datetime"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value
+
+
+def message_to_dict(message) -> Dict[str, Any]:
+    """Message -> dict"""
+    return {
+        "role": message.role,
+        "content": message.content,
+        "timestamp": _encode_datetime(getattr(message, "timestamp", None))
+    }
+
+
+def packet_to_dict(packet) -> Dict[str, Any]:
+    """ContextPacket -> dict"""
+    return {
+        "content": packet.content,
+        "timestamp": _encode_datetime(packet.timestamp),
+        "token_count": packet.token_count,
+        "relevance_score": packet.relevance_score,
+        "metadata": packet.metadata or {}
+    }
+
+
+class SessionCheckpointStore:
+    """会话检查点存储
+
+    每个会话对应一个 gzip 压缩的 JSON 文件: {workspace}/{session_id}.json.gz
+    写入采用临时文件 + os.replace,保证进程崩溃时不会留下半截文件。
+    """
+
+    def __init__(self, workspace: str):
+        self.workspace = workspace
+        os.makedirs(workspace, exist_ok=True)
+
+    def _path(self, session_id: str) -> str:
+        """检查点文件路径
+
+        Raises:
+            ValueError: 会话ID为空或包含路径分隔符(不能指向工作目录以外的文件)
+        """
+        if (
+            not session_id or session_id in (".", "..")
+            or any(sep in session_id for sep in ("/", "\\", os.sep, os.altsep) if sep)
+        ):
+            raise ValueError(f"非法的会话ID: {session_id!r}")
+        return os.path.join(self.workspace, f"{session_id}.json.gz")
+
+    def exists(self, session_id: str) -> bool:
+        return os.path.exists(self._path(session_id))
+
+    def save(
+        self,
+        session_id: str,
+        project_name: str,
+        codebase_path: str,
+        conversation_history: List,
+        stats: Dict[str, Any],
+        preprocess_cache: Dict[str, Dict[str, Any]],
+        pending_tool_calls: List[Dict[str, Any]],
+        last_context: Optional[str] = None,
+        token_totals: Optional[Dict[str, Any]] = None,
+        profile_enabled: bool = False
+    ) -> str:
+        """保存检查点,返回文件路径"""
+        payload = {
+            "version": CHECKPOINT_VERSION,
+            "saved_at": datetime.now().isoformat(),
+            "session_id": session_id,
+            "project_name": project_name,
+            "codebase_path": codebase_path,
+            "conversation_history": [message_to_dict(m) for m in conversation_history],
+            "stats": {k: _encode_datetime(v) for k, v in stats.items()},
+            "preprocess_cache": {
+                mode: {
+                    "created_at": entry["created_at"],
+                    "packets": [packet_to_dict(p) for p in entry["packets"]]
+                }
+                for mode, entry in preprocess_cache.items()
+            },
+            "pending_tool_calls": pending_tool_calls,
+            "last_context": last_context,
+            "token_totals": token_totals,
+            "profile_enabled": profile_enabled
+        }
+
+        path = self._path(session_id)
+        tmp_path = f"{path}.tmp"
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """读取检查点,不存在或版本不兼容时返回 None"""
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return None
+
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+
+        if payload.get("version") != CHECKPOINT_VERSION:
+            return None
+
+        payload["stats"] = {k: _decode_datetime(v) for k, v in payload.get("stats", {}).items()}
+        for message in payload.get("conversation_history", []):
+            message["timestamp"] = _decode_datetime(message.get("timestamp"))
+        for entry in payload.get("preprocess_cache", {}).values():
+            for packet in entry.get("packets", []):
+                packet["timestamp"] = _decode_datetime(packet.get("timestamp"))
+        return payload
+
+    def list_sessions(self) -> List[str]:
+        """列出所有可恢复的会话ID(按修改时间倒序)"""
+        files = [f for f in os.listdir(self.workspace) if f.endswith(".json.gz")]
+        files.sort(key=lambda f: os.path.getmtime(os.path.join(self.workspace, f)), reverse=True)
+        return [f[:-len(".json.gz")] for f in files]
+
+    def delete(self, session_id: str) -> bool:
+        path = self._path(session_id)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
@@ -0,0 +1,344 @@
+"""
+Web 应用共享状态
+
+多 worker 进程部署时,进程内全局变量(realtime_messages、maintainer)
+无法在 worker 之间共享。这里把它们抽象为存储接口:
+- MemoryStateStore: 单进程默认实现,与原来的字典行为一致
+- SQLiteStateStore: 基于 WAL 模式 SQLite 文件,同一主机上的多个 worker 共享
+
+消息流使用游标读取: read(session_id, cursor) 返回 (新消息, 新游标)。
+每个会话只保留最近 STREAM_MAX_MESSAGES 条消息,超过 STREAM_MESSAGE_TTL 秒未更新的消息定期清理。
+当前活跃的维护助手只共享其会话信息,各 worker 通过会话检查点重建实例;
+同一会话的运行通过 lock(name) 租约串行化(SQLite 实现跨 worker 生效),避免多个 worker
+同时加载、修改并保存同一个检查点。持有期间后台线程每 ttl/3 秒续租一次,运行时间超过 ttl 也不会丢锁。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+# 每个会话保留的实时消息条数
+STREAM_MAX_MESSAGES = int(os.getenv("STREAM_MAX_MESSAGES", "1000"))
+# 消息保留时间(秒),每 PRUNE_EVERY 次追加清理一次
+STREAM_MESSAGE_TTL = float(os.getenv("STREAM_MESSAGE_TTL", str(24 * 3600)))
+PRUNE_EVERY = 256
+# 租约默认有效期和等待超时(秒); 持有者进程崩溃、不再续租时租约到期后自动释放
+LOCK_TTL = float(os.getenv("STATE_LOCK_TTL", "900"))
+LOCK_TIMEOUT = float(os.getenv("STATE_LOCK_TIMEOUT", "300"))
+LOCK_POLL_INTERVAL = 0.1
+
+
+class _LockMixin:
+    """在 acquire_lock / renew_lock / release_lock 之上提供续租和 with 语法"""
+
+    def keep_alive(self, name: str, token: str, ttl: float = LOCK_TTL) -> threading.Event:
+        """启动后台续租线程,每 ttl/3 秒续租一次,返回用于停止续租的事件"""
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(ttl / 3):
+                if not self.renew_lock(name, token, ttl):
+                    print(f"[WARNING] 租约已被其他持有者取得, 停止续租: {name}")
+                    return
+
+        threading.Thread(target=renew, name=f"lease-{name}", daemon=True).start()
+        return stop
+
+    def release_held(self, name: str, token: str, heartbeat: threading.Event):
+        """停止续租并释放租约; 租约在持有期间已丢失时打印警告"""
+        heartbeat.set()
+        if not self.release_lock(name, token):
+            print(f"[WARNING] 释放时租约已过期或被其他持有者取得, 本次运行可能与其他 worker 并发: {name}")
+
+    @contextmanager
+    def lock(self, name: str, ttl: float = LOCK_TTL, timeout: float = LOCK_TIMEOUT):
+        token = self.acquire_lock(name, ttl, timeout)
+        heartbeat = self.keep_alive(name, token, ttl)
+        try:
+            yield
+        finally:
+            self.release_held(name, token, heartbeat)
+
+
+class MemoryStateStore(_LockMixin):
+    """进程内状态存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._messages: Dict[str, List[str]] = {}
+        # 每个会话已裁掉的消息数(游标 = 裁掉的条数 + 列表下标)和最后追加时间
+        self._trimmed: Dict[str, int] = {}
+        self._updated: Dict[str, float] = {}
+        self._appends = 0
+        self._values: Dict[str, Any] = {}
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lease_cond = threading.Condition()
+
+    def append(self, session_id: str, message: str):
+        with self._lock:
+            messages = self._messages.setdefault(session_id, [])
+            messages.append(message)
+            now = time.time()
+            self._updated[session_id] = now
+            if len(messages) > STREAM_MAX_MESSAGES:
+                excess = len(messages) - STREAM_MAX_MESSAGES
+                del messages[:excess]
+                self._trimmed[session_id] = self._trimmed.get(session_id, 0) + excess
+            self._appends += 1
+            if self._appends % PRUNE_EVERY == 0:
+                for sid in [k for k, ts in self._updated.items() if now - ts > STREAM_MESSAGE_TTL]:
+                    self._drop(sid)
+
+    def ensure(self, session_id: str):
+        with self._lock:
+            self._messages.setdefault(session_id, [])
+            self._updated.setdefault(session_id, time.time())
+
+    def read(self, session_id: str, cursor: int = 0) -> Tuple[List[str], int]:
+        with self._lock:
+            messages = self._messages.get(session_id, [])
+            trimmed = self._trimmed.get(session_id, 0)
+            return messages[max(cursor - trimmed, 0):], trimmed + len(messages)
+
+    def _drop(self, session_id: str):
+        self._messages.pop(session_id, None)
+        self._trimmed.pop(session_id, None)
+        self._updated.pop(session_id, None)
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "sessions": len(self._messages),
+                "messages": sum(len(m) for m in self._messages.values()),
+                "bytes": sum(len(msg.encode("utf-8")) for m in self._messages.values() for msg in m)
+            }
+
+    def get_value(self, key: str) -> Optional[Any]:
+        with self._lock:
+            return self._values.get(key)
+
+    def set_value(self, key: str, value: Any):
+        with self._lock:
+            self._values[key] = value
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._values[key] = int(self._values.get(key) or 0) + 1
+            return self._values[key]
+
+    def acquire_lock(self, name: str, ttl: float = LOCK_TTL, timeout: float = LOCK_TIMEOUT) -> str:
+        """获取租约,返回释放用的令牌
+
+        Raises:
+            TimeoutError: timeout 秒内未能获取
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        with self._lease_cond:
+            while True:
+                now = time.time()
+                lease = self._leases.get(name)
+                if lease is None or lease[1] <= now:
+                    self._leases[name] = (token, now + ttl)
+                    return token
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"等待锁超时: {name}")
+                self._lease_cond.wait(min(remaining, lease[1] - now))
+
+    def renew_lock(self, name: str, token: str, ttl: float = LOCK_TTL) -> bool:
+        """延长仍由 token 持有的租约,租约已被其他持有者取得时返回 False"""
+        with self._lease_cond:
+            lease = self._leases.get(name)
+            if not lease or lease[0] != token:
+                return False
+            self._leases[name] = (token, time.time() + ttl)
+            return True
+
+    def release_lock(self, name: str, token: str) -> bool:
+        """释放租约,返回释放时是否仍由 token 持有且未过期"""
+        with self._lease_cond:
+            lease = self._leases.get(name)
+            if not lease or lease[0] != token:
+                return False
+            del self._leases[name]
+            self._lease_cond.notify_all()
+            return lease[1] > time.time()
+
+
+class SQLiteStateStore(_LockMixin):
+    """基于 SQLite 文件的跨进程状态存储
+
+    每个线程持有独立连接;WAL 模式下读写互不阻塞。
+    租约保存在 leases 表中,获取时在 BEGIN IMMEDIATE 事务内检查并写入。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS stream_messages ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL, "
+            "message TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_stream_session_seq ON stream_messages (session_id, seq)")
+        conn.execute("CREATE TABLE IF NOT EXISTS stream_sessions (session_id TEXT PRIMARY KEY)")
+        conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._appends = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session_id: str, message: str):
+        conn = self._conn()
+        conn.execute("INSERT OR IGNORE INTO stream_sessions (session_id) VALUES (?)", (session_id,))
+        seq = conn.execute(
+            "INSERT INTO stream_messages (session_id, message, created_at) VALUES (?, ?, ?)",
+            (session_id, message, time.time())
+        ).lastrowid
+        # 只保留本会话最近 STREAM_MAX_MESSAGES 条(按 (session_id, seq) 索引删除)
+        conn.execute(
+            "DELETE FROM stream_messages WHERE session_id = ? AND seq <= ("
+            "SELECT seq FROM stream_messages WHERE session_id = ? AND seq <= ? "
+            "ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+            (session_id, session_id, seq, STREAM_MAX_MESSAGES)
+        )
+        self._appends += 1
+        if self._appends % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self, max_age: float = STREAM_MESSAGE_TTL) -> int:
+        """删除超过 max_age 秒的消息和已无消息的会话,返回删除的消息数"""
+        conn = self._conn()
+        deleted = conn.execute(
+            "DELETE FROM stream_messages WHERE created_at < ?", (time.time() - max_age,)
+        ).rowcount
+        if deleted:
+            conn.execute(
+                "DELETE FROM stream_sessions WHERE session_id NOT IN (SELECT DISTINCT session_id FROM stream_messages)"
+            )
+        return deleted
+
+    def ensure(self, session_id: str):
+        self._conn().execute("INSERT OR IGNORE INTO stream_sessions (session_id) VALUES (?)", (session_id,))
+
+    def read(self, session_id: str, cursor: int = 0) -> Tuple[List[str], int]:
+        rows = self._conn().execute(
+            "SELECT seq, message FROM stream_messages WHERE session_id = ? AND seq > ? ORDER BY seq",
+            (session_id, cursor)
+        ).fetchall()
+        if not rows:
+            return [], cursor
+        return [r[1] for r in rows], rows[-1][0]
+
+    def clear(self, session_id: str):
+        conn = self._conn()
+        conn.execute("DELETE FROM stream_messages WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM stream_sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        sessions = conn.execute("SELECT COUNT(*) FROM stream_sessions").fetchone()[0]
+        messages, size = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(message AS BLOB))), 0) FROM stream_messages"
+        ).fetchone()
+        return {"sessions": sessions, "messages": messages, "bytes": size}
+
+    def get_value(self, key: str) -> Optional[Any]:
+        row = self._conn().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_value(self, key: str, value: Any):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)",
+            (key, json.dumps(value, ensure_ascii=False))
+        )
+
+    def incr(self, key: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+            value = (json.loads(row[0]) if row else 0) + 1
+            conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def acquire_lock(self, name: str, ttl: float = LOCK_TTL, timeout: float = LOCK_TIMEOUT) -> str:
+        """获取跨进程租约,返回释放用的令牌
+
+        Raises:
+            TimeoutError: timeout 秒内未能获取
+        """
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        conn = self._conn()
+        while True:
+            now = time.time()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+                acquired = row is None or row[0] <= now
+                if acquired:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO leases (name, token, expires_at) VALUES (?, ?, ?)",
+                        (name, token, now + ttl)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if acquired:
+                return token
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"等待锁超时: {name}")
+            time.sleep(LOCK_POLL_INTERVAL)
+
+    def renew_lock(self, name: str, token: str, ttl: float = LOCK_TTL) -> bool:
+        """延长仍由 token 持有的租约,租约已被其他持有者取得时返回 False"""
+        return self._conn().execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND token = ?",
+            (time.time() + ttl, name, token)
+        ).rowcount > 0
+
+    def release_lock(self, name: str, token: str) -> bool:
+        """释放租约,返回释放时是否仍由 token 持有且未过期"""
+        conn = self._conn()
+        row = conn.execute("SELECT expires_at FROM leases WHERE name = ? AND token = ?", (name, token)).fetchone()
+        conn.execute("DELETE FROM leases WHERE name = ? AND token = ?", (name, token))
+        return row is not None and row[0] > time.time()
+
+
+def create_state_store():
+    """按环境变量选择实现
+
+    STATE_STORE=sqlite 时使用 STATE_DB_PATH(默认 ./runtime_data/state.db),否则使用进程内存储。
+    """
+    if os.getenv("STATE_STORE", "memory").lower() == "sqlite":
+        return SQLiteStateStore(os.getenv("STATE_DB_PATH", os.path.join(".", "runtime_data", "state.db")))
+    return MemoryStateStore()
@@ -0,0 +1,102 @@
+let eventSource = null;
+
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text;
+    return div.innerHTML;
+}
+
+document.getElementById('upload-form').addEventListener('submit', function(e) {
+    e.preventDefault();
+
+    const formData = new FormData(this);
+    const resultDiv = document.getElementById('result');
+    const resultContent = document.getElementById('result-content');
+    const outputContent = document.getElementById('output-content');
+
+    // 批量上传时通过 SSE 接收每个文件的分析结果
+    const sessionId = 'upload_' + Date.now();
+    formData.append('session_id', sessionId);
+    if (eventSource) {
+        eventSource.close();
+    }
+    eventSource = new EventSource(`/api/stream/${sessionId}`);
+    eventSource.onmessage = function(event) {
+        try {
+            const data = JSON.parse(event.data);
+            if (data.type === 'message') {
+                const p = document.createElement('p');
+                p.textContent = data.message;
+                outputContent.appendChild(p);
+                outputContent.scrollTop = outputContent.scrollHeight;
+            }
+        } catch (e) {
+            console.error('Error parsing SSE message:', e);
+        }
+    };
+    eventSource.onerror = function() {
+        eventSource.close();
+    };
+
+    function finish() {
+        if (eventSource) {
+            eventSource.close();
+        }
+        fetch(`/api/clear-stream/${sessionId}`, { method: 'POST' });
+    }
+
+    // 显示实时输出
+    outputContent.innerHTML = '<p>正在上传文件...</p>';
+
+    resultContent.innerHTML = '<div class="text-center"><div class="spinner-border" role="status"><span class="sr-only">分析中...</span></div><p class="mt-2">正在分析代码，请稍候...</p></div>';
+    resultDiv.classList.remove('d-none');
+
+    fetch('/api/upload', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.status === 'success' && data.files) {
+            outputContent.innerHTML += `<p>📊 批量分析完成，共 ${data.files.length} 个文件！</p>`;
+            let html = '';
+            data.files.forEach(file => {
+                html += `
+                    <div class="card step-card">
+                        <div class="card-header">
+                            <h5>${escapeHtml(file.filename)}</h5>
+                        </div>
+                        <div class="card-body">
+                            <div class="result-block">
+                                ${escapeHtml(file.response).replace(/\n/g, '<br>')}
+                            </div>
+                        </div>
+                    </div>
+                `;
+            });
+            if (data.skipped.length) {
+                html += '<div class="alert alert-warning">跳过的文件：<br>' +
+                    data.skipped.map(s => `${escapeHtml(s.path)}：${escapeHtml(s.reason)}`).join('<br>') + '</div>';
+            }
+            resultContent.innerHTML = html;
+        } else if (data.status === 'success') {
+            outputContent.innerHTML += '<p>✅ 文件上传成功！</p>';
+            outputContent.innerHTML += '<p>📊 分析完成！</p>';
+            resultContent.innerHTML = `
+                <p class="text-success">✅ 文件 <strong>${data.filename}</strong> 已成功上传并分析</p>
+                <div class="result-block">
+                    ${data.response.replace(/\n/g, '<br>')}
+                </div>
+            `;
+        } else {
+            outputContent.innerHTML += `<p class="text-danger">❌ ${data.message}</p>`;
+            resultContent.innerHTML = `<div class="alert alert-danger">${data.message}</div>`;
+        }
+        finish();
+    })
+    .catch(error => {
+        outputContent.innerHTML += `<p class="text-danger">❌ 上传失败: ${error.message}</p>`;
+        resultContent.innerHTML = `<div class="alert alert-danger">❌ 上传失败: ${error.message}</div>`;
+        finish();
+    });
+});
@@ -0,0 +1,170 @@
+"""
+Token 与成本统计
+
+记录每次 LLM 调用的 prompt/completion token,并按运行模式
+(explore/analyze/plan/auto)和上下文来源(系统指令、对话历史、笔记、
+记忆、预处理结果)拆分,用于评估哪些上下文来源在浪费预算。
+
+计数优先使用 tiktoken(可选依赖),不可用时按字符类别估算。
+"""
+
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# tiktoken 的编码表加载较慢(首次还可能需要下载),第一次计数时才加载
+_ENCODING = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+_CJK_RE = re.compile(r"[　-〿一-鿿＀-￯]")
+
+LEDGER_FILE = "token_ledger.jsonl"
+
+
+def _get_encoding():
+    global _ENCODING, _encoding_loaded
+    if not _encoding_loaded:
+        with _encoding_lock:
+            if not _encoding_loaded:
+                try:
+                    import tiktoken
+                    _ENCODING = tiktoken.get_encoding("cl100k_base")
+                except Exception:  # 未安装或离线无法加载编码表
+                    _ENCODING = None
+                _encoding_loaded = True
+    return _ENCODING
+
+
+def count_tokens(text: str) -> int:
+    """统计 token 数"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # 估算: 中文字符约 1 token/字,其余约 4 字符/token
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def attribute_context(context: str, sources: Dict[str, List[str]]) -> Dict[str, int]:
+    """把最终上下文的 token 按来源拆分
+
+    ContextBuilder 会筛选/压缩候选内容,只有实际出现在上下文中的
+    片段才计入对应来源,剩余部分计为 "other"(模板、分隔符等)。
+    """
+    total = count_tokens(context)
+    breakdown: Dict[str, int] = {}
+    used = 0
+    for source, contents in sources.items():
+        tokens = sum(count_tokens(c) for c in contents if c and c in context)
+        if tokens:
+            breakdown[source] = tokens
+            used += tokens
+    breakdown["other"] = max(0, total - used)
+    return breakdown
+
+
+def _price(kind: str) -> float:
+    """每 1K token 单价,通过环境变量配置"""
+    try:
+        return float(os.getenv(f"LLM_{kind.upper()}_PRICE_PER_1K", "0"))
+    except ValueError:
+        return 0.0
+
+
+class TokenLedger:
+    """单个项目的 token 账本
+
+    每次调用追加一行到 {workspace}/token_ledger.jsonl,内存中维护本会话汇总。
+    """
+
+    def __init__(self, workspace: str, project_name: str, session_id: str):
+        self.workspace = workspace
+        self.project_name = project_name
+        self.session_id = session_id
+        self._path = os.path.join(workspace, LEDGER_FILE)
+        self._lock = threading.Lock()
+        self.session_totals = self._empty_totals()
+        os.makedirs(workspace, exist_ok=True)
+
+    @staticmethod
+    def _empty_totals() -> Dict[str, Any]:
+        return {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cost": 0.0,
+            "by_mode": {},
+            "by_source": {}
+        }
+
+    @staticmethod
+    def _accumulate(totals: Dict[str, Any], entry: Dict[str, Any]):
+        totals["calls"] += 1
+        totals["prompt_tokens"] += entry["prompt_tokens"]
+        totals["completion_tokens"] += entry["completion_tokens"]
+        totals["cost"] = round(totals["cost"] + entry["cost"], 6)
+
+        mode = totals["by_mode"].setdefault(entry["mode"], {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        mode["calls"] += 1
+        mode["prompt_tokens"] += entry["prompt_tokens"]
+        mode["completion_tokens"] += entry["completion_tokens"]
+
+        for source, tokens in entry["sources"].items():
+            totals["by_source"][source] = totals["by_source"].get(source, 0) + tokens
+
+    def record(
+        self,
+        mode: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        sources: Dict[str, int],
+        usage_source: str = "estimate"
+    ) -> Dict[str, Any]:
+        """记录一次 LLM 调用"""
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "project": self.project_name,
+            "session_id": self.session_id,
+            "mode": mode,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "sources": sources,
+            "usage_source": usage_source,
+            "cost": round(
+                prompt_tokens / 1000 * _price("prompt") + completion_tokens / 1000 * _price("completion"), 6
+            )
+        }
+        with self._lock:
+            self._accumulate(self.session_totals, entry)
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+
+    def restore(self, totals: Optional[Dict[str, Any]]):
+        """从会话检查点恢复本会话汇总"""
+        if totals:
+            self.session_totals = totals
+
+    def project_totals(self) -> Dict[str, Any]:
+        """汇总账本中该项目所有会话的记录"""
+        totals = self._empty_totals()
+        totals["sessions"] = 0
+        if not os.path.exists(self._path):
+            return totals
+        sessions = set()
+        with self._lock, open(self._path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                sessions.add(entry.get("session_id"))
+                self._accumulate(totals, entry)
+        totals["sessions"] = len(sessions)
+        return totals
@@ -0,0 +1,410 @@
+"""
+上传文件处理流水线
+
+- 流式写入: 按块读取上传流,边写临时文件边计算 SHA-256,超过 UPLOAD_MAX_BYTES 立即中止
+- 内容寻址暂存: 文件保存为 {staging_dir}/{sha[:2]}/{sha}{ext},相同内容只保存一份,
+  分析结果按哈希缓存,重复上传直接返回
+- 分块分析: 超过 UPLOAD_CHUNK_TOKENS 的文件按行(优先在 def/class 处)切分,
+  各块在线程池中并发分析后按顺序合并,避免单次请求超出上下文窗口
+- 批量上传: 多个文件或 zip/tar 压缩包(逐个成员流式解压)写入独立的批次目录并建立索引,
+  每个文件在有界线程池中分析,完成一个回调一个
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import time
+import uuid
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from token_accounting import count_tokens
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(".", "runtime_data", "uploads"))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(2 * 1024 * 1024)))
+UPLOAD_CHUNK_TOKENS = int(os.getenv("UPLOAD_CHUNK_TOKENS", "2000"))
+UPLOAD_ANALYSIS_WORKERS = int(os.getenv("UPLOAD_ANALYSIS_WORKERS", "4"))
+# 批量上传: 请求体上限、压缩包解压后总大小和文件数上限、同时分析的文件数
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv("UPLOAD_BATCH_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_ARCHIVE_MAX_BYTES = int(os.getenv("UPLOAD_ARCHIVE_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_ARCHIVE_MAX_FILES = int(os.getenv("UPLOAD_ARCHIVE_MAX_FILES", "500"))
+UPLOAD_FILE_WORKERS = int(os.getenv("UPLOAD_FILE_WORKERS", "4"))
+# 批次目录分析完成后即删除; 进程中途退出遗留的目录超过该时长(秒)后在创建新批次时清理
+UPLOAD_BATCH_TTL = int(os.getenv("UPLOAD_BATCH_TTL", str(24 * 3600)))
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+READ_BLOCK = 64 * 1024
+# 顶层或类中一级缩进的定义处适合换块
+_BOUNDARY_RE = re.compile(r"^(?: {4})?(?:(?:async\s+)?def\s|class\s|@)")
+
+
+class UploadError(Exception):
+    """上传内容不可接受(过大、为空或不是文本)"""
+
+
+class UploadTooLarge(UploadError):
+    """超过大小限制"""
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def _safe_member_path(name: str) -> Optional[str]:
+    """压缩包成员的安全相对路径,绝对路径和 .. 越界返回 None"""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts or ":" in parts[0]:
+        return None
+    return "/".join(parts)
+
+
+def build_prompt(filename: str, code: str, chunk: Optional[Dict[str, Any]] = None, total: int = 1) -> str:
+    """单文件/单个片段的分析提示词"""
+    if chunk is None or total == 1:
+        return f'请分析以下代码文件的质量和潜在问题：\n\n文件名: {filename}\n\n代码内容:\n```python\n{code}\n```'
+    return (
+        f'请分析以下代码文件片段的质量和潜在问题：\n\n'
+        f'文件名: {filename} (片段 {chunk["index"] + 1}/{total}, 第 {chunk["start_line"]}-{chunk["end_line"]} 行)\n\n'
+        f'代码内容:\n```python\n{code}\n```'
+    )
+
+
+def split_chunks(text: str, max_tokens: int = UPLOAD_CHUNK_TOKENS) -> List[Dict[str, Any]]:
+    """按 token 上限切分代码
+
+    超过上限一半后遇到顶层或类中的 def/class/装饰器就换块,单行超限时按字符硬切。
+    返回 [{"index", "start_line", "end_line", "text", "tokens"}]
+    """
+    chunks: List[Dict[str, Any]] = []
+    lines: List[str] = []
+    tokens = 0
+    start_line = 1
+
+    def flush(end_line: int):
+        nonlocal lines, tokens, start_line
+        if lines:
+            chunks.append({
+                "index": len(chunks),
+                "start_line": start_line,
+                "end_line": end_line,
+                "text": "".join(lines),
+                "tokens": tokens
+            })
+        lines, tokens, start_line = [], 0, end_line + 1
+
+    for lineno, line in enumerate(text.splitlines(keepends=True), 1):
+        line_tokens = count_tokens(line)
+        at_boundary = tokens >= max_tokens // 2 and _BOUNDARY_RE.match(line)
+        if lines and (tokens + line_tokens > max_tokens or at_boundary):
+            flush(lineno - 1)
+        if line_tokens > max_tokens:
+            # 超长单行(压缩代码、内嵌数据)按字符切开
+            step = max(1, len(line) * max_tokens // line_tokens)
+            for i in range(0, len(line), step):
+                lines, tokens, start_line = [line[i:i + step]], count_tokens(line[i:i + step]), lineno
+                flush(lineno)
+            start_line = lineno + 1
+            continue
+        lines.append(line)
+        tokens += line_tokens
+    flush(start_line + len(lines) - 1)
+    return chunks
+
+
+class UploadPipeline:
+    """上传文件的暂存、去重和分块分析"""
+
+    def __init__(
+        self,
+        staging_dir: str = UPLOAD_DIR,
+        max_bytes: int = UPLOAD_MAX_BYTES,
+        chunk_tokens: int = UPLOAD_CHUNK_TOKENS,
+        workers: int = UPLOAD_ANALYSIS_WORKERS
+    ):
+        self.staging_dir = staging_dir
+        self.max_bytes = max_bytes
+        self.chunk_tokens = chunk_tokens
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload-analysis")
+        # 批量上传按文件并发; 与分块线程池分开, 避免文件任务占满线程后等待自己的分块任务
+        self.file_executor = ThreadPoolExecutor(max_workers=UPLOAD_FILE_WORKERS, thread_name_prefix="upload-file")
+        self.batch_dir = os.path.join(staging_dir, "batches")
+        os.makedirs(staging_dir, exist_ok=True)
+
+    # === 暂存 ===
+
+    def _path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.staging_dir, sha256[:2], f"{sha256}{ext}")
+
+    def _copy_stream(self, stream: BinaryIO, out_path: str, max_bytes: int, text_only: bool = True):
+        """按块复制并计算哈希,超过 max_bytes 或(text_only 时)遇到二进制内容抛出 UploadError
+
+        返回 (sha256, size)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        with open(out_path, "wb") as out:
+            while True:
+                block = stream.read(READ_BLOCK)
+                if not block:
+                    break
+                if text_only and size == 0 and b"\x00" in block[:8192]:
+                    raise UploadError("仅支持文本文件")
+                size += len(block)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"文件超过大小限制 ({max_bytes // 1024} KB)")
+                digest.update(block)
+                out.write(block)
+        if size == 0:
+            raise UploadError("文件内容为空")
+        return digest.hexdigest(), size
+
+    def stage(self, stream: BinaryIO, filename: str, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+        """流式保存上传内容,返回 {"sha256", "filename", "path", "size", "deduplicated"}"""
+        filename = os.path.basename(filename or "")
+        if not filename:
+            raise UploadError("文件名不能为空")
+        ext = os.path.splitext(filename)[1].lower()[:16]
+        archive = is_archive(filename)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.staging_dir, suffix=".part")
+        os.close(fd)
+        try:
+            sha256, size = self._copy_stream(
+                stream, tmp_path,
+                max_bytes or (UPLOAD_BATCH_MAX_BYTES if archive else self.max_bytes),
+                text_only=not archive
+            )
+            path = self._path(sha256, ext)
+            deduplicated = os.path.exists(path)
+            if deduplicated:
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return {"sha256": sha256, "filename": filename, "path": path, "size": size, "deduplicated": deduplicated}
+
+    def read_text(self, staged: Dict[str, Any]) -> str:
+        with open(staged["path"], "r", encoding="utf-8", errors="replace") as f:
+            return f.read()
+
+    # === 分析结果缓存 ===
+
+    def _result_path(self, sha256: str) -> str:
+        return os.path.join(self.staging_dir, sha256[:2], f"{sha256}.result.json")
+
+    def cached_result(self, sha256: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._result_path(sha256), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_result(self, sha256: str, result: Dict[str, Any]):
+        path = self._result_path(sha256)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    # === 分析 ===
+
+    def analyze(self, staged: Dict[str, Any], analyze_fn: Callable[[str], str]) -> Dict[str, Any]:
+        """分析暂存的文件: 命中缓存直接返回,否则分块并发调用 analyze_fn(prompt) 后合并
+
+        analyze_fn 抛出异常的片段记为失败; 有片段失败时结果带 "error": True 且不写入缓存,
+        下次上传相同内容会重新分析。
+
+        返回 {"response", "chunks", "cached"}(失败时另有 "error")
+        """
+        cached = self.cached_result(staged["sha256"])
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        chunks = split_chunks(self.read_text(staged), self.chunk_tokens)
+        prompts = [build_prompt(staged["filename"], c["text"], c, len(chunks)) for c in chunks]
+        failed = []
+
+        def analyze_chunk(prompt: str) -> str:
+            try:
+                return analyze_fn(prompt)
+            except Exception as e:
+                failed.append(e)
+                return f"❌ 分析失败: {e}"
+
+        if len(prompts) == 1:
+            responses = [analyze_chunk(prompts[0])]
+        else:
+            print(f"✂️ {staged['filename']} 切分为 {len(prompts)} 个片段并发分析")
+            responses = list(self.executor.map(analyze_chunk, prompts))
+
+        if len(chunks) == 1:
+            response = responses[0]
+        else:
+            response = "\n\n".join(
+                f"### 片段 {c['index'] + 1}/{len(chunks)} (第 {c['start_line']}-{c['end_line']} 行)\n{r}"
+                for c, r in zip(chunks, responses)
+            )
+        result = {"response": response, "chunks": len(chunks)}
+        if failed:
+            print(f"[WARNING] {staged['filename']} 有 {len(failed)} 个片段分析失败, 结果不缓存")
+            return {**result, "cached": False, "error": True}
+        try:
+            self.save_result(staged["sha256"], result)
+        except OSError as e:
+            print(f"[WARNING] 保存分析结果缓存失败: {e}")
+        return {**result, "cached": False}
+
+    # === 批量上传 ===
+
+    def create_batch(self) -> Dict[str, Any]:
+        """创建独立的批次工作目录, 顺便清理过期的遗留批次
+
+        解压出的文件放在工作目录下的 files/ 中, index.json 与它并列, 成员名不会覆盖索引
+        """
+        self.prune_batches()
+        batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+        workspace = os.path.join(self.batch_dir, batch_id)
+        files_dir = os.path.join(workspace, "files")
+        os.makedirs(files_dir)
+        return {
+            "batch_id": batch_id, "workspace": workspace, "files_dir": files_dir,
+            "files": [], "skipped": [], "total_bytes": 0
+        }
+
+    def _add_to_batch(self, batch: Dict[str, Any], stream: BinaryIO, name: str):
+        """把一个文件流式写入批次目录并登记到索引,不可用的文件记入 skipped"""
+        rel_path = _safe_member_path(name)
+        if rel_path is None:
+            batch["skipped"].append({"path": name, "reason": "非法路径"})
+            return
+        if len(batch["files"]) >= UPLOAD_ARCHIVE_MAX_FILES:
+            raise UploadError(f"文件数超过上限 ({UPLOAD_ARCHIVE_MAX_FILES})")
+        out_path = os.path.join(batch["files_dir"], *rel_path.split("/"))
+        if os.path.exists(out_path):
+            batch["skipped"].append({"path": rel_path, "reason": "路径重复"})
+            return
+        try:
+            os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        except OSError:
+            # 上级路径已是一个文件(先有成员 a 再有 a/b)
+            batch["skipped"].append({"path": rel_path, "reason": "路径与已有文件冲突"})
+            return
+        remaining = UPLOAD_ARCHIVE_MAX_BYTES - batch["total_bytes"]
+        try:
+            sha256, size = self._copy_stream(stream, out_path, min(self.max_bytes, remaining))
+        except OSError as e:
+            if os.path.isfile(out_path):
+                os.remove(out_path)
+            batch["skipped"].append({"path": rel_path, "reason": f"写入失败: {e}"})
+            return
+        except UploadError as e:
+            if os.path.exists(out_path):
+                os.remove(out_path)
+            if isinstance(e, UploadTooLarge) and remaining < self.max_bytes:
+                raise UploadError(f"解压后总大小超过上限 ({UPLOAD_ARCHIVE_MAX_BYTES // 1024 // 1024} MB)")
+            batch["skipped"].append({"path": rel_path, "reason": str(e)})
+            return
+        batch["total_bytes"] += size
+        batch["files"].append({
+            "sha256": sha256, "filename": rel_path, "path": out_path, "size": size, "deduplicated": False
+        })
+
+    def add_file(self, batch: Dict[str, Any], stream: BinaryIO, filename: str):
+        """批次中加入一个普通文件,压缩包则逐个成员流式解压"""
+        if not is_archive(filename):
+            self._add_to_batch(batch, stream, os.path.basename(filename))
+            return
+        staged = self.stage(stream, filename)
+        try:
+            if filename.lower().endswith(".zip"):
+                with zipfile.ZipFile(staged["path"]) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir():
+                            continue
+                        with archive.open(info) as member:
+                            self._add_to_batch(batch, member, info.filename)
+            else:
+                # 流模式顺序读取, 不需要随机访问整个压缩包
+                with tarfile.open(staged["path"], mode="r|*") as archive:
+                    for member in archive:
+                        if not member.isfile():
+                            continue
+                        self._add_to_batch(batch, archive.extractfile(member), member.name)
+        except (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError) as e:
+            raise UploadError(f"压缩包无法解压: {e}")
+
+    def discard_batch(self, batch: Dict[str, Any]):
+        """删除批次的工作目录(分析结果已按哈希缓存, 解压出的文件不再需要)"""
+        shutil.rmtree(batch["workspace"], ignore_errors=True)
+
+    def prune_batches(self, max_age: int = UPLOAD_BATCH_TTL) -> int:
+        """删除修改时间早于 max_age 秒的遗留批次目录, 返回删除数量"""
+        try:
+            names = os.listdir(self.batch_dir)
+        except FileNotFoundError:
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in names:
+            path = os.path.join(self.batch_dir, name)
+            try:
+                if not name.startswith("batch_") or os.path.getmtime(path) >= cutoff:
+                    continue
+            except OSError:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+        return removed
+
+    def write_index(self, batch: Dict[str, Any]) -> str:
+        path = os.path.join(batch["workspace"], "index.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "batch_id": batch["batch_id"],
+                "files": [{k: f[k] for k in ("filename", "sha256", "size")} for f in batch["files"]],
+                "skipped": batch["skipped"]
+            }, f, ensure_ascii=False, indent=2)
+        return path
+
+    def analyze_batch(
+        self,
+        batch: Dict[str, Any],
+        analyze_fn: Callable[[str], str],
+        on_result: Optional[Callable[[Dict[str, Any], Dict[str, Any]], None]] = None
+    ) -> List[Dict[str, Any]]:
+        """并发分析批次中的每个文件,每完成一个调用 on_result(file, result)
+
+        返回与 batch["files"] 顺序一致的结果列表。分析结束(包括异常退出)后删除批次目录
+        """
+        futures: Dict[Any, int] = {}
+        try:
+            for i, f in enumerate(batch["files"]):
+                futures[self.file_executor.submit(self.analyze, f, analyze_fn)] = i
+            results: List[Optional[Dict[str, Any]]] = [None] * len(futures)
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"response": f"❌ 分析失败: {e}", "chunks": 0, "cached": False, "error": True}
+                results[index] = result
+                if on_result:
+                    on_result(batch["files"][index], result)
+            return results
+        finally:
+            # on_result 抛异常时仍在运行的任务还在读文件, 等它们结束再删除
+            for future in futures:
+                future.cancel()
+            wait(list(futures))
+            self.discard_batch(batch)
@@ -9,21 +9,221 @@ import os
 import sys
 import json
 import time
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
 # 确保能导入必要的模块
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, g, send_from_directory, abort
 from code_agent.main import CodebaseMaintainer
+from metrics import registry, render_prometheus
+from profiler import PROFILE_DIR, list_profiles
+from shared_state import create_state_store
+from web_assets import init_assets
+from upload_pipeline import UploadError, UploadPipeline, UPLOAD_BATCH_MAX_BYTES, is_archive
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
+# 上传请求体上限(多留 64KB 给 multipart 表单开销), 超出时 Flask 直接返回 413;
+# 单个文件的上限由上传流水线检查
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_BATCH_MAX_BYTES + 64 * 1024
 
 # 全局变量
-maintainer = None  # 维护助手实例
-realtime_messages = {}  # 存储实时输出的消息
+maintainer = None  # 本进程内的维护助手实例
+maintainer_version = None  # 本地实例对应的共享版本号
+state_store = create_state_store()  # 实时消息和活跃会话(多 worker 部署时为 SQLite)
+shutdown_event = threading.Event()  # 优雅退出: 通知 SSE 流结束
+
+upload_pipeline = UploadPipeline()  # 上传暂存、去重和分块分析
+_upload_maintainer = None  # 上传分析复用的常驻助手(共享 LLM 客户端和工具)
+_upload_maintainer_lock = threading.Lock()
+
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def current_maintainer():
+    """获取当前维护助手
+
+    其他 worker 初始化或运行过助手后共享版本号会变化,
+    此时从会话检查点重建本地实例,保证各 worker 看到同一会话。
+    """
+    global maintainer, maintainer_version
+    active = state_store.get_value('active_maintainer')
+    version = state_store.get_value('active_maintainer_version')
+    if active and (maintainer is None or version != maintainer_version):
+        maintainer = CodebaseMaintainer(
+            project_name=active['project_name'],
+            codebase_path=active['codebase_path'],
+            session_id=active['session_id']
+        )
+        maintainer_version = version
+    return maintainer
+
+
+def publish_maintainer(instance):
+    """把本地实例登记为活跃会话,并让其他 worker 的副本失效"""
+    global maintainer, maintainer_version
+    maintainer = instance
+    state_store.set_value('active_maintainer', {
+        'project_name': instance.project_name,
+        'codebase_path': instance.codebase_path,
+        'session_id': instance.session_id
+    })
+    maintainer_version = state_store.incr('active_maintainer_version')
+
+
+@contextmanager
+def locked_maintainer(create=None):
+    """持有活跃会话的运行锁(多 worker 时跨进程生效)并返回维护助手
+
+    锁内才检查共享版本号并按需从检查点重建, 保证拿到的是上一次运行保存后的状态;
+    调用方应在锁内运行并 publish_maintainer。没有活跃会话时: create 为 None 返回 None,
+    否则调用 create() 创建实例, 在持有新会话锁的情况下登记为活跃会话。
+    """
+    while True:
+        active = state_store.get_value('active_maintainer')
+        if not active:
+            if create is None:
+                yield None
+                return
+            instance = create()
+            with state_store.lock(f"session:{instance.session_id}"):
+                publish_maintainer(instance)
+                yield instance
+            return
+        with state_store.lock(f"session:{active['session_id']}"):
+            instance = current_maintainer()
+            if instance is None or instance.session_id == active['session_id']:
+                yield instance
+                return
+        # 等锁期间活跃会话已切换, 改为锁定新会话
+
+
+def upload_maintainer():
+    """上传分析使用的常驻助手, 首次使用时创建"""
+    global _upload_maintainer
+    with _upload_maintainer_lock:
+        if _upload_maintainer is None:
+            # 上传分析只用 analyze_file, 不监听/索引暂存目录
+            _upload_maintainer = CodebaseMaintainer(
+                project_name='temp_project',
+                codebase_path=upload_pipeline.staging_dir,
+                index_codebase=False
+            )
+        return _upload_maintainer
+
+
+def process_upload_batch(uploads, session_id, emit=None):
+    """批量上传: 多个文件或压缩包写入独立批次目录, 逐文件并发分析
+
+    Args:
+        uploads: [(文件名, 二进制流)]
+        session_id: 实时消息会话, 每个文件分析完成即推送
+        emit: 推送函数 emit(session_id, message), 默认写入状态存储
+    """
+    emit = emit or state_store.append
+    state_store.ensure(session_id)
+    batch = upload_pipeline.create_batch()
+    emit(session_id, f"📦 收到 {len(uploads)} 个上传, 正在解压并建立索引...")
+    try:
+        for filename, stream in uploads:
+            upload_pipeline.add_file(batch, stream, filename)
+    except UploadError:
+        upload_pipeline.discard_batch(batch)
+        raise
+    upload_pipeline.write_index(batch)
+    total = len(batch['files'])
+    emit(session_id, f"🗂️ 共 {total} 个文件待分析, 跳过 {len(batch['skipped'])} 个")
+
+    done = [0]
+
+    def on_result(file, result):
+        done[0] += 1
+        status = '❌' if result.get('error') else '✅'
+        cached = ' (缓存)' if result.get('cached') else ''
+        emit(session_id, f"{status} [{done[0]}/{total}] {file['filename']}{cached}：{result['response']}")
+
+    analyzer = upload_maintainer()
+    results = upload_pipeline.analyze_batch(batch, analyzer.analyze_file, on_result)
+    emit(session_id, "🎉 批量分析完成！")
+    return {
+        'status': 'success',
+        'batch_id': batch['batch_id'],
+        'files': [
+            {
+                'filename': f['filename'],
+                'sha256': f['sha256'],
+                'size': f['size'],
+                'response': r['response'],
+                'chunks': r['chunks'],
+                'cached': r['cached']
+            }
+            for f, r in zip(batch['files'], results)
+        ],
+        'skipped': batch['skipped']
+    }
+
+
+def inflight_requests():
+    """进行中的非流式请求数(优雅退出时等待其归零)"""
+    return _inflight
+
+
+@app.before_request
+def _start_timer():
+    global _inflight
+    g.request_start = time.perf_counter()
+    g.counted_inflight = request.endpoint != 'api_stream'
+    if g.counted_inflight:
+        with _inflight_lock:
+            _inflight += 1
+
+
+@app.teardown_request
+def _finish_request(exc):
+    global _inflight
+    if getattr(g, 'counted_inflight', False):
+        with _inflight_lock:
+            _inflight -= 1
+
+
+@app.after_request
+def _record_request(response):
+    """按路由记录请求数和耗时(SSE 只记录建立连接的耗时)"""
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = {'route': route, 'method': request.method, 'status': str(response.status_code)}
+    registry.counter('http_requests_total', 'HTTP requests', labels=labels).inc()
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        registry.histogram(
+            'http_request_duration_seconds', 'HTTP request latency',
+            labels={'route': route, 'method': request.method}
+        ).observe(time.perf_counter() - start)
+    return response
+
+
+# 模板预编译 + 字节码缓存, 静态资源带版本号长期缓存
+# (after_request 按注册的逆序执行: 在 _record_request 之后注册, 静态资源先转为 304 再被计数)
+init_assets(app)
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus 指标"""
+    # 抓取时刷新瞬时值
+    stream_stats = state_store.stats()
+    registry.gauge('realtime_sessions', 'Sessions with buffered realtime messages').set(stream_stats['sessions'])
+    registry.gauge('realtime_messages', 'Buffered realtime messages').set(stream_stats['messages'])
+    registry.gauge('realtime_messages_bytes', 'UTF-8 size of buffered realtime messages').set(stream_stats['bytes'])
+    registry.gauge('http_inflight_requests', 'In-flight non-streaming requests').set(inflight_requests())
+    registry.gauge('maintainer_pool_size', 'Live CodebaseMaintainer instances held by the app').set(
+        1 if maintainer else 0
+    )
+    return app.response_class(render_prometheus(registry), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
@@ -48,15 +248,14 @@ def upload():
 @app.route('/api/init', methods=['POST'])
 def api_init():
     """初始化助手"""
-    global maintainer
     project_name = request.json.get('project_name', 'my_flask_app')
     codebase_path = request.json.get('codebase_path', './my_flask_app')
     
     try:
-        maintainer = CodebaseMaintainer(
+        publish_maintainer(CodebaseMaintainer(
             project_name=project_name,
             codebase_path=codebase_path
-        )
+        ))
         return jsonify({'status': 'success', 'message': f'✅ 代码库维护助手已初始化: {project_name}'})
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'❌ 初始化失败: {str(e)}'})
@@ -64,608 +263,231 @@ def api_init():
 @app.route('/api/run', methods=['POST'])
 def api_run():
     """运行助手"""
-    global maintainer
     user_input = request.json.get('user_input', '')
     mode = request.json.get('mode', 'auto')
-    
-    if not maintainer:
-        return jsonify({'status': 'error', 'message': '❌ 助手未初始化'})
+    # 请求头 X-Profile: 1 时对本次调用做采样剖析
+    profile = request.headers.get('X-Profile', '').lower() in ('1', 'true', 'yes')
     
     try:
-        response = maintainer.run(user_input, mode)
-        return jsonify({'status': 'success', 'response': response})
+        # 同一会话的运行跨 worker 串行, 避免并发加载/保存同一检查点
+        with locked_maintainer() as maintainer:
+            if not maintainer:
+                return jsonify({'status': 'error', 'message': '❌ 助手未初始化'})
+            if mode == 'diff':
+                # 增量分析: rev_range 为 git 修订范围, user_input 作为关注点
+                rev_range = request.json.get('rev_range') or 'HEAD~1..HEAD'
+                response = maintainer.analyze_diff(rev_range, user_input)
+            else:
+                response = maintainer.run(user_input, mode, profile=profile)
+            publish_maintainer(maintainer)
+        result = {'status': 'success', 'response': response}
+        if profile and maintainer.last_profile:
+            result['profile'] = maintainer.last_profile['name']
+        return jsonify(result)
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'❌ 运行失败: {str(e)}'})
 
 @app.route('/api/analyze-my-flask-app', methods=['POST'])
 def api_analyze_my_flask_app():
     """分析 my_flask_app 代码库"""
-    global maintainer
     session_id = request.json.get('session_id', 'default')
     
     try:
         # 初始化会话消息队列
-        if session_id not in realtime_messages:
-            realtime_messages[session_id] = []
+        state_store.ensure(session_id)
         
         # 添加开始消息
-        realtime_messages[session_id].append("🔍 开始分析 my_flask_app 代码库...")
+        state_store.append(session_id, "🔍 开始分析 my_flask_app 代码库...")
         
         # 初始化维护器（如果尚未初始化）
-        if not maintainer:
-            realtime_messages[session_id].append("📦 初始化代码库维护助手...")
-            maintainer = CodebaseMaintainer(
+        def create_maintainer():
+            state_store.append(session_id, "📦 初始化代码库维护助手...")
+            instance = CodebaseMaintainer(
                 project_name='my_flask_app',
                 codebase_path='./my_flask_app'
             )
-            realtime_messages[session_id].append("✅ 代码库维护助手初始化成功！")
+            state_store.append(session_id, "✅ 代码库维护助手初始化成功！")
+            return instance
         
-        # 执行分析步骤
-        results = []
+        # 三个步骤在同一把会话锁内执行
+        with locked_maintainer(create_maintainer) as maintainer:
+            # 执行分析步骤
+            results = []
         
-        # 第一步：探索代码库
-        realtime_messages[session_id].append("🔍 探索代码库结构...")
-        try:
-            explore_response = maintainer.run('请探索 . 的代码结构，列出所有的 Python 文件和目录结构', mode='explore')
-            realtime_messages[session_id].append(f"✅ 探索完成：{explore_response}")
-            results.append({
-                'step': '探索代码库',
-                'response': explore_response
-            })
-        except Exception as e:
-            error_msg = f'探索失败: {str(e)}'
-            realtime_messages[session_id].append(f"❌ {error_msg}")
-            results.append({
-                'step': '探索代码库',
-                'response': error_msg
-            })
+            # 第一步：探索代码库
+            state_store.append(session_id, "🔍 探索代码库结构...")
+            try:
+                explore_response = maintainer.run('请探索 . 的代码结构，列出所有的 Python 文件和目录结构', mode='explore')
+                state_store.append(session_id, f"✅ 探索完成：{explore_response}")
+                results.append({
+                    'step': '探索代码库',
+                    'response': explore_response
+                })
+            except Exception as e:
+                error_msg = f'探索失败: {str(e)}'
+                state_store.append(session_id, f"❌ {error_msg}")
+                results.append({
+                    'step': '探索代码库',
+                    'response': error_msg
+                })
         
-        # 第二步：分析代码质量
-        realtime_messages[session_id].append("📊 分析代码质量...")
-        try:
-            analyze_response = maintainer.run('请分析代码库的质量，查找潜在的问题，包括代码重复、复杂度、缺少测试等', mode='analyze')
-            realtime_messages[session_id].append(f"✅ 质量分析完成：{analyze_response}")
-            results.append({
-                'step': '分析代码质量',
-                'response': analyze_response
-            })
-        except Exception as e:
-            error_msg = f'分析失败: {str(e)}'
-            realtime_messages[session_id].append(f"❌ {error_msg}")
-            results.append({
-                'step': '分析代码质量',
-                'response': error_msg
-            })
+            # 第二步：分析代码质量
+            state_store.append(session_id, "📊 分析代码质量...")
+            try:
+                analyze_response = maintainer.run('请分析代码库的质量，查找潜在的问题，包括代码重复、复杂度、缺少测试等', mode='analyze')
+                state_store.append(session_id, f"✅ 质量分析完成：{analyze_response}")
+                results.append({
+                    'step': '分析代码质量',
+                    'response': analyze_response
+                })
+            except Exception as e:
+                error_msg = f'分析失败: {str(e)}'
+                state_store.append(session_id, f"❌ {error_msg}")
+                results.append({
+                    'step': '分析代码质量',
+                    'response': error_msg
+                })
         
-        # 第三步：规划重构任务
-        realtime_messages[session_id].append("📋 规划重构任务...")
-        try:
-            plan_response = maintainer.run('请基于之前的分析，规划重构任务，列出优先级和工作量', mode='plan')
-            realtime_messages[session_id].append(f"✅ 任务规划完成：{plan_response}")
-            results.append({
-                'step': '规划重构任务',
-                'response': plan_response
-            })
-        except Exception as e:
-            error_msg = f'规划失败: {str(e)}'
-            realtime_messages[session_id].append(f"❌ {error_msg}")
-            results.append({
-                'step': '规划重构任务',
-                'response': error_msg
-            })
+            # 第三步：规划重构任务
+            state_store.append(session_id, "📋 规划重构任务...")
+            try:
+                plan_response = maintainer.run('请基于之前的分析，规划重构任务，列出优先级和工作量', mode='plan')
+                state_store.append(session_id, f"✅ 任务规划完成：{plan_response}")
+                results.append({
+                    'step': '规划重构任务',
+                    'response': plan_response
+                })
+            except Exception as e:
+                error_msg = f'规划失败: {str(e)}'
+                state_store.append(session_id, f"❌ {error_msg}")
+                results.append({
+                    'step': '规划重构任务',
+                    'response': error_msg
+                })
         
-        realtime_messages[session_id].append("🎉 分析完成！")
+            publish_maintainer(maintainer)
+        state_store.append(session_id, "🎉 分析完成！")
         
         return jsonify({'status': 'success', 'results': results})
     except Exception as e:
         error_msg = f'❌ 分析失败: {str(e)}'
-        if session_id in realtime_messages:
-            realtime_messages[session_id].append(error_msg)
+        state_store.append(session_id, error_msg)
         return jsonify({'status': 'error', 'message': error_msg})
 
 
 
 @app.route('/api/upload', methods=['POST'])
 def api_upload():
-    """上传代码文件并分析"""
+    """上传代码文件并分析(多个文件或压缩包时按批次逐文件分析)"""
     if 'file' not in request.files:
         return jsonify({'status': 'error', 'message': '❌ 未收到文件'})
     
-    file = request.files['file']
-    if file.filename == '':
+    files = [f for f in request.files.getlist('file') if f.filename]
+    if not files:
         return jsonify({'status': 'error', 'message': '❌ 文件名不能为空'})
     
-    # 创建 tem 目录 - 使用正确的路径
-    code_agent_dir = os.path.dirname(__file__)
-    tem_dir = os.path.join(code_agent_dir, 'my_flask_app', 'tem')
-    os.makedirs(tem_dir, exist_ok=True)
+    if len(files) > 1 or is_archive(files[0].filename):
+        session_id = request.form.get('session_id') or 'default'
+        try:
+            return jsonify(process_upload_batch([(f.filename, f.stream) for f in files], session_id))
+        except UploadError as e:
+            state_store.append(session_id, f"❌ {e}")
+            return jsonify({'status': 'error', 'message': f'❌ {e}'})
     
-    # 保存文件
-    file_path = os.path.join(tem_dir, file.filename)
-    file.save(file_path)
+    file = files[0]
+    # 流式写入内容寻址的暂存区(不再写入被分析的代码库)
+    try:
+        staged = upload_pipeline.stage(file.stream, file.filename)
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': f'❌ {e}'})
     
-    print(f"✅ 文件已保存到: {file_path}")
+    print(f"✅ 文件已保存到: {staged['path']}{' (重复上传)' if staged['deduplicated'] else ''}")
     
     # 分析文件
     try:
-        # 初始化临时维护器
-        temp_maintainer = CodebaseMaintainer(
-            project_name='temp_project',
-            codebase_path=tem_dir
-        )
-        
-        # 读取文件内容
-        with open(file_path, 'r', encoding='utf-8') as f:
-            file_content = f.read()
-        
-        # 分析上传的文件
-        response = temp_maintainer.run(f'请分析以下代码文件的质量和潜在问题：\n\n文件名: {file.filename}\n\n代码内容:\n```python\n{file_content}\n```')
-        return jsonify({'status': 'success', 'response': response, 'filename': file.filename, 'filepath': file_path})
+        result = upload_pipeline.analyze(staged, upload_maintainer().analyze_file)
+        if result.get('error'):
+            return jsonify({'status': 'error', 'message': result['response']})
+        return jsonify({
+            'status': 'success',
+            'response': result['response'],
+            'filename': staged['filename'],
+            'filepath': staged['path'],
+            'sha256': staged['sha256'],
+            'chunks': result['chunks'],
+            'cached': result['cached']
+        })
     except Exception as e:
         return jsonify({'status': 'error', 'message': f'❌ 分析失败: {str(e)}'})
 
+@app.errorhandler(413)
+def upload_too_large(e):
+    """请求体超过 MAX_CONTENT_LENGTH"""
+    return jsonify({'status': 'error', 'message': f'❌ 上传内容超过大小限制 ({UPLOAD_BATCH_MAX_BYTES // 1024 // 1024} MB)'}), 413
+
 @app.route('/api/stream/<session_id>')
 def api_stream(session_id):
     """服务器发送事件 (SSE) 端点，用于实时输出内容"""
     def event_stream():
         # 初始化会话消息
-        if session_id not in realtime_messages:
-            realtime_messages[session_id] = []
-        
-        # 发送初始消息
-        yield 'data: {"type": "info", "message": "开始分析..."}\n\n'
-        
-        # 持续发送消息
-        last_index = 0
-        while True:
-            messages = realtime_messages.get(session_id, [])
-            if len(messages) > last_index:
-                for msg in messages[last_index:]:
+        state_store.ensure(session_id)
+
+        active_streams = registry.gauge('sse_active_connections', 'Open SSE streams')
+        active_streams.inc()
+        try:
+            # 发送初始消息
+            yield 'data: {"type": "info", "message": "开始分析..."}\n\n'
+
+            # 持续发送消息(服务退出时结束)
+            cursor = 0
+            while not shutdown_event.is_set():
+                messages, cursor = state_store.read(session_id, cursor)
+                for msg in messages:
                     yield 'data: ' + json.dumps({"type": "message", "message": msg}, ensure_ascii=False) + '\n\n'
-                last_index = len(messages)
-            time.sleep(0.5)
+                shutdown_event.wait(0.5)
+        finally:
+            # 客户端断开时生成器被关闭
+            active_streams.dec()
     
     return app.response_class(event_stream(), mimetype='text/event-stream')
 
+@app.route('/api/profile-session', methods=['POST'])
+def api_profile_session():
+    """开启/关闭当前会话的采样剖析"""
+    enabled = bool(request.json.get('enabled', True))
+    # 开关保存在会话检查点中, 发布新版本后其他 worker 从检查点重建时沿用
+    with locked_maintainer() as maintainer:
+        if not maintainer:
+            return jsonify({'status': 'error', 'message': '❌ 助手未初始化'})
+        maintainer.set_profile_enabled(enabled)
+        publish_maintainer(maintainer)
+    return jsonify({'status': 'success', 'enabled': enabled})
+
+@app.route('/api/profiles')
+def api_profiles():
+    """最近的剖析结果列表"""
+    return jsonify({'status': 'success', 'profiles': list_profiles()})
+
+@app.route('/api/profiles/<name>')
+def api_profile_download(name):
+    """下载剖析结果, format=speedscope(默认) 或 collapsed"""
+    fmt = request.args.get('format', 'speedscope')
+    suffix = {'speedscope': '.speedscope.json', 'collapsed': '.collapsed.txt'}.get(fmt)
+    if suffix is None or name not in {p['name'] for p in list_profiles()}:
+        abort(404)
+    return send_from_directory(os.path.abspath(PROFILE_DIR), name + suffix, as_attachment=True)
+
 @app.route('/api/clear-stream/<session_id>', methods=['POST'])
 def api_clear_stream(session_id):
     """清除指定会话的消息"""
-    if session_id in realtime_messages:
-        del realtime_messages[session_id]
+    state_store.clear(session_id)
     return jsonify({'status': 'success'})
 
 
 if __name__ == '__main__':
-    # 创建 templates 目录
-    templates_dir = os.path.join(os.path.dirname(__file__), 'templates')
-    os.makedirs(templates_dir, exist_ok=True)
-    
-    # 创建基础模板文件
-    base_template = '''<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{{ title }} - 代码库维护助手</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <style>
-        body {
-            background-color: #f8f9fa;
-        }
-        .navbar {
-            background-color: #343a40;
-        }
-        .navbar-brand {
-            color: #ffffff;
-        }
-        .navbar-nav .nav-link {
-            color: rgba(255, 255, 255, 0.8);
-        }
-        .navbar-nav .nav-link:hover {
-            color: #ffffff;
-        }
-        .container {
-            margin-top: 20px;
-            margin-bottom: 40px;
-        }
-        .card {
-            margin-bottom: 20px;
-            box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-        }
-        .code-block {
-            background-color: #f8f9fa;
-            border: 1px solid #dee2e6;
-            border-radius: 4px;
-            padding: 15px;
-            font-family: 'Courier New', Courier, monospace;
-            white-space: pre-wrap;
-            margin-top: 10px;
-            margin-bottom: 10px;
-        }
-        .result-block {
-            background-color: #e9ecef;
-            border: 1px solid #dee2e6;
-            border-radius: 4px;
-            padding: 15px;
-            margin-top: 10px;
-            margin-bottom: 10px;
-        }
-        .step-card {
-            margin-bottom: 20px;
-        }
-        .step-title {
-            font-weight: bold;
-            margin-bottom: 10px;
-        }
-        .step-description {
-            color: #6c757d;
-            margin-bottom: 15px;
-        }
-        .btn-primary {
-            background-color: #0d6efd;
-            border-color: #0d6efd;
-        }
-        .btn-success {
-            background-color: #198754;
-            border-color: #198754;
-        }
-    </style>
-</head>
-<body>
-    <nav class="navbar navbar-expand-lg">
-        <div class="container-fluid">
-            <a class="navbar-brand" href="/">代码库维护助手</a>
-            <button class="navbar-toggler" type="button" data-bs-toggle="collapse" data-bs-target="#navbarNav">
-                <span class="navbar-toggler-icon"></span>
-            </button>
-            <div class="collapse navbar-collapse" id="navbarNav">
-                <ul class="navbar-nav">
-                    <li class="nav-item">
-                        <a class="nav-link" href="/">首页</a>
-                    </li>
-                    <li class="nav-item">
-                        <a class="nav-link" href="/analyze-my-flask-app">分析 my_flask_app</a>
-                    </li>
-                    <li class="nav-item">
-                        <a class="nav-link" href="/upload">上传代码文件</a>
-                    </li>
-                    <li class="nav-item">
-                        <a class="nav-link" href="/about">关于</a>
-                    </li>
-                </ul>
-            </div>
-        </div>
-    </nav>
-    
-    <div class="container">
-        <h1 class="mt-4 mb-4">{{ title }}</h1>
-        {% block content %}{% endblock %}
-    </div>
-    
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-    {% block scripts %}{% endblock %}
-</body>
-</html>'''
-    
-    # 创建首页模板
-    index_template = '''{% extends "base.html" %}
-{% block content %}
-    <div class="card">
-        <div class="card-body">
-            <h2 class="card-title">代码库维护助手</h2>
-            <p class="card-text">一个智能的代码库维护工具，帮助您探索代码结构、分析代码质量、规划重构任务。</p>
-            
-            <h3 class="mt-4">核心功能</h3>
-            <div class="row mt-3">
-                <div class="col-md-6">
-                    <div class="card">
-                        <div class="card-body">
-                            <h5 class="card-title">📦 分析 my_flask_app</h5>
-                            <p class="card-text">自动分析 my_flask_app 目录下的代码库，包括代码结构探索、质量分析和任务规划。</p>
-                            <a href="/analyze-my-flask-app" class="btn btn-primary">开始分析</a>
-                        </div>
-                    </div>
-                </div>
-                <div class="col-md-6">
-                    <div class="card">
-                        <div class="card-body">
-                            <h5 class="card-title">📤 上传代码文件</h5>
-                            <p class="card-text">上传单个代码文件进行分析，支持 Python 等常见编程语言的质量分析。</p>
-                            <a href="/upload" class="btn btn-success">上传文件</a>
-                        </div>
-                    </div>
-                </div>
-            </div>
-            
-            <h3 class="mt-4">关于 use.py</h3>
-            <div class="card mt-3">
-                <div class="card-body">
-                    <p><code>use.py</code> 是一个使用示例，展示了如何使用 <code>CodebaseMaintainer</code> 类来维护代码库。</p>
-                    <p>本 Web 应用基于相同的 <code>CodebaseMaintainer</code> 类，提供了可视化的界面来执行相同的功能。</p>
-                </div>
-            </div>
-        </div>
-    </div>
-{% endblock %}'''
-    
-    # 创建关于页面模板
-    about_template = '''{% extends "base.html" %}
-{% block content %}
-    <div class="card">
-        <div class="card-body">
-            <h2 class="card-title">关于代码库维护助手</h2>
-            <p class="card-text">代码库维护助手是一个智能的工具，帮助开发者更有效地管理和维护代码库。</p>
-            
-            <h3 class="mt-4">技术特点</h3>
-            <ul class="list-group list-group-flush mt-2">
-                <li class="list-group-item">
-                    <strong>长程任务支持</strong>
-                    <p class="mt-1">通过 NoteTool 实现跨会话的状态管理，适合持续数天的重构任务。</p>
-                </li>
-                <li class="list-group-item">
-                    <strong>智能上下文</strong>
-                    <p class="mt-1">通过 ContextBuilder 构建优化的上下文，确保高信号密度，避免信息过载。</p>
-                </li>
-                <li class="list-group-item">
-                    <strong>按需探索</strong>
-                    <p class="mt-1">通过 TerminalTool 实现即时、按需的代码探索，只在需要时查看具体文件。</p>
-                </li>
-            </ul>
-            
-            <h3 class="mt-4">文件说明</h3>
-            <ul class="mt-2">
-                <li><strong>main.py</strong>: 包含 CodebaseMaintainer 类，是核心功能实现</li>
-                <li><strong>use.py</strong>: 使用示例，展示如何在命令行中使用 CodebaseMaintainer</li>
-                <li><strong>web_app.py</strong>: Web 应用，提供可视化界面</li>
-                <li><strong>my_flask_app/</strong>: 示例代码库，用于演示分析功能</li>
-            </ul>
-        </div>
-    </div>
-{% endblock %}'''
-    
-    # 创建分析 my_flask_app 页面模板
-    analyze_my_flask_app_template = '''{% extends "base.html" %}
-{% block content %}
-    <div class="card">
-        <div class="card-body">
-            <h2 class="card-title">分析 my_flask_app</h2>
-            <p class="card-text">自动分析 my_flask_app 目录下的代码库，包括代码结构探索、质量分析和任务规划。</p>
-            
-            <button id="analyze-btn" class="btn btn-primary btn-lg">开始分析 my_flask_app</button>
-            <button id="clear-btn" class="btn btn-secondary btn-lg ml-2">清除输出</button>
-            
-           <div id="realtime-output" class="mt-4 p-3 bg-light rounded border" style="white-space: pre-wrap; word-wrap: break-word; overflow: visible; height: auto;">
-    <h4>实时输出</h4>
-    <div id="output-content" class="mt-2">
-        <p>点击上方按钮开始分析...</p>
-    </div>
-</div>
-            
-            <div id="results" class="mt-4 d-none">
-                <h3>分析结果</h3>
-                <div id="results-content"></div>
-            </div>
-        </div>
-    </div>
-{% endblock %}
-
-{% block scripts %}
-    <script>
-        let sessionId = 'session_' + Date.now();
-        let eventSource = null;
-        
-        // 清除输出
-        document.getElementById('clear-btn').addEventListener('click', function() {
-            document.getElementById('output-content').innerHTML = '<p>点击上方按钮开始分析...</p>';
-            fetch(`/api/clear-stream/${sessionId}`, {
-                method: 'POST'
-            });
-        });
-        
-        // 开始分析
-        document.getElementById('analyze-btn').addEventListener('click', function() {
-            const btn = this;
-            const resultsDiv = document.getElementById('results');
-            const resultsContent = document.getElementById('results-content');
-            const outputContent = document.getElementById('output-content');
-            
-            // 生成新的会话ID
-            sessionId = 'session_' + Date.now();
-            
-            // 清除之前的输出
-            outputContent.innerHTML = '<p>开始分析...</p>';
-            
-            // 启动SSE连接
-            if (eventSource) {
-                eventSource.close();
-            }
-            eventSource = new EventSource(`/api/stream/${sessionId}`);
-            
-            eventSource.onmessage = function(event) {
-                try {
-                    const data = JSON.parse(event.data);
-                    if (data.type === 'message' || data.type === 'info') {
-                        const p = document.createElement('p');
-                        p.textContent = data.message;
-                        outputContent.appendChild(p);
-                        // 滚动到底部
-                        outputContent.scrollTop = outputContent.scrollHeight;
-                    }
-                } catch (e) {
-                    console.error('Error parsing SSE message:', e);
-                }
-            };
-            
-            eventSource.onerror = function() {
-                eventSource.close();
-            };
-            
-            btn.disabled = true;
-            btn.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> 分析中...';
-            resultsDiv.classList.remove('d-none');
-            resultsContent.innerHTML = '<div class="text-center"><div class="spinner-border" role="status"><span class="sr-only">分析中...</span></div><p class="mt-2">正在分析代码库，请稍候...</p></div>';
-            
-            fetch('/api/analyze-my-flask-app', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({ session_id: sessionId })
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'success') {
-                    let html = '';
-                    data.results.forEach(result => {
-                        html += `
-                            <div class="card step-card">
-                                <div class="card-header">
-                                    <h4>${result.step}</h4>
-                                </div>
-                                <div class="card-body">
-                                    <div class="result-block">
-                                        ${result.response.replace(/\\n/g, '<br>')}
-                                    </div>
-                                </div>
-                            </div>
-                        `;
-                    });
-                    resultsContent.innerHTML = html;
-                } else {
-                    resultsContent.innerHTML = `<div class="alert alert-danger">${data.message}</div>`;
-                }
-                btn.disabled = false;
-                btn.innerHTML = '重新分析';
-                // 关闭SSE连接
-                if (eventSource) {
-                    eventSource.close();
-                }
-            })
-            .catch(error => {
-                resultsContent.innerHTML = `<div class="alert alert-danger">❌ 分析失败: ${error.message}</div>`;
-                btn.disabled = false;
-                btn.innerHTML = '重新分析';
-                // 关闭SSE连接
-                if (eventSource) {
-                    eventSource.close();
-                }
-            });
-        });
-    </script>
-{% endblock %}''' 
-    
-    # 创建上传页面模板
-    upload_template = '''{% extends "base.html" %}
-{% block content %}
-    <div class="card">
-        <div class="card-body">
-            <h2 class="card-title">上传代码文件</h2>
-            <p class="card-text">上传单个代码文件进行分析，支持 Python 等常见编程语言。</p>
-            
-            <form id="upload-form" enctype="multipart/form-data">
-                <div class="mb-3">
-                    <label for="file" class="form-label">选择文件</label>
-                    <input type="file" class="form-control" id="file" name="file" required>
-                </div>
-                <button type="submit" class="btn btn-primary">上传并分析</button>
-            </form>
-            
-            <div id="realtime-output" class="mt-4 p-3 bg-light rounded border" style="white-space: pre-wrap; word-wrap: break-word; overflow: visible; height: auto;">
-    <h4>实时输出</h4>
-    <div id="output-content" class="mt-2">
-        <p>选择文件并点击上传按钮开始分析...</p>
-    </div>
-</div>
-            
-            <div id="result" class="mt-4 d-none">
-                <div class="card">
-                    <div class="card-header">
-                        <h4>分析结果</h4>
-                    </div>
-                    <div class="card-body">
-                        <div id="result-content"></div>
-                    </div>
-                </div>
-            </div>
-        </div>
-    </div>
-{% endblock %}
-
-{% block scripts %}
-    <script>
-        document.getElementById('upload-form').addEventListener('submit', function(e) {
-            e.preventDefault();
-            
-            const formData = new FormData(this);
-            const resultDiv = document.getElementById('result');
-            const resultContent = document.getElementById('result-content');
-            const outputContent = document.getElementById('output-content');
-            
-            // 显示实时输出
-            outputContent.innerHTML = '<p>正在上传文件...</p>';
-            
-            resultContent.innerHTML = '<div class="text-center"><div class="spinner-border" role="status"><span class="sr-only">分析中...</span></div><p class="mt-2">正在分析代码，请稍候...</p></div>';
-            resultDiv.classList.remove('d-none');
-            
-            fetch('/api/upload', {
-                method: 'POST',
-                body: formData
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'success') {
-                    outputContent.innerHTML += '<p>✅ 文件上传成功！</p>';
-                    outputContent.innerHTML += '<p>📊 分析完成！</p>';
-                    resultContent.innerHTML = `
-                        <p class="text-success">✅ 文件 <strong>${data.filename}</strong> 已成功上传并分析</p>
-                        <div class="result-block">
-                            ${data.response.replace(/\\n/g, '<br>')}
-                        </div>
-                    `;
-                } else {
-                    outputContent.innerHTML += `<p class="text-danger">❌ ${data.message}</p>`;
-                    resultContent.innerHTML = `<div class="alert alert-danger">${data.message}</div>`;
-                }
-            })
-            .catch(error => {
-                outputContent.innerHTML += `<p class="text-danger">❌ 上传失败: ${error.message}</p>`;
-                resultContent.innerHTML = `<div class="alert alert-danger">❌ 上传失败: ${error.message}</div>`;
-            });
-        });
-    </script>
-{% endblock %}''' 
-    
-    # 写入模板文件
-    with open(os.path.join(templates_dir, 'base.html'), 'w', encoding='utf-8') as f:
-        f.write(base_template)
-    
-    with open(os.path.join(templates_dir, 'index.html'), 'w', encoding='utf-8') as f:
-        f.write(index_template)
-    
-    with open(os.path.join(templates_dir, 'about.html'), 'w', encoding='utf-8') as f:
-        f.write(about_template)
-    
-    with open(os.path.join(templates_dir, 'analyze_my_flask_app.html'), 'w', encoding='utf-8') as f:
-        f.write(analyze_my_flask_app_template)
-    
-    with open(os.path.join(templates_dir, 'upload.html'), 'w', encoding='utf-8') as f:
-        f.write(upload_template)
-    
-    print("✅ Web 应用已创建成功！")
-    print("📁 生成的文件：")
-    print("   - code_agent/web_app.py       # Web 应用主文件")
-    print("   - code_agent/templates/        # 模板目录")
-    print("   - code_agent/templates/base.html      # 基础模板")
-    print("   - code_agent/templates/index.html     # 首页模板")
-    print("   - code_agent/templates/about.html     # 关于页面模板")
-    print("   - code_agent/templates/analyze_my_flask_app.html # 分析 my_flask_app 页面")
-    print("   - code_agent/templates/upload.html    # 上传页面模板")
-    print("\\n🚀 启动 Web 应用：")
-    print("   cd code_agent")
-    print("   python web_app.py")
-    print("\\n🌐 访问 Web 应用：")
-    print("   http://localhost:5000")
+    # 模板位于 templates/, 样式和脚本位于 static/, 启动时不再重新生成
+    print("🚀 启动 Web 应用 (生产环境请使用 serve.py 或 asgi_app.py)")
+    print("🌐 访问 Web 应用: http://localhost:5000")
     
     # 启动应用 - 禁用 debug 模式，避免文件变化导致服务重启
-    # 或者使用 extra_files 参数来指定要监视的文件
     app.run(debug=False, host='0.0.0.0', port=5000)
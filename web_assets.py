@@ -0,0 +1,95 @@
+"""
+Web 应用的模板与静态资源
+
+- 模板在启动时全部预编译,编译结果写入 Jinja 字节码缓存(JINJA_CACHE_DIR),
+  重启后直接加载字节码,首个请求也不再解析模板
+- 静态资源 URL 带内容哈希(static_url('css/app.css') -> /static/css/app.css?v=1a2b3c4d),
+  带版本号的请求返回一年的 immutable 缓存,其余请求用 ETag 协商缓存
+"""
+
+import hashlib
+import os
+import time
+from typing import Dict
+
+from flask import request, url_for
+from jinja2 import FileSystemBytecodeCache
+
+JINJA_CACHE_DIR = os.getenv(
+    "JINJA_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "runtime_data", "jinja_cache")
+)
+STATIC_MAX_AGE = 365 * 24 * 3600
+
+
+class StaticVersions:
+    """静态文件的内容哈希(按修改时间失效)"""
+
+    def __init__(self, static_folder: str):
+        self.static_folder = static_folder
+        self._versions: Dict[str, tuple] = {}
+
+    def version(self, filename: str) -> str:
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return ""
+        cached = self._versions.get(filename)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.md5(f.read()).hexdigest()[:8]
+        self._versions[filename] = (mtime, digest)
+        return digest
+
+
+def precompile_templates(app) -> int:
+    """预编译全部模板并写入字节码缓存,返回模板数量"""
+    env = app.jinja_env
+    count = 0
+    for name in env.list_templates(extensions=["html"]):
+        try:
+            env.get_template(name)
+            count += 1
+        except Exception as e:
+            print(f"[WARNING] 模板预编译失败 {name}: {e}")
+    return count
+
+
+def init_assets(app):
+    """配置字节码缓存、预编译模板并注册静态资源缓存策略"""
+    try:
+        os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+    except OSError as e:
+        print(f"[WARNING] 无法创建模板缓存目录: {e}")
+
+    versions = StaticVersions(app.static_folder)
+
+    @app.context_processor
+    def _static_url():
+        def static_url(filename: str) -> str:
+            return url_for("static", filename=filename, v=versions.version(filename) or None)
+        return {"static_url": static_url}
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if request.endpoint != "static" or response.status_code != 200:
+            return response
+        digest = versions.version(request.view_args.get("filename", ""))
+        if digest:
+            response.set_etag(digest)
+        if request.args.get("v"):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        # If-None-Match 命中时返回 304
+        return response.make_conditional(request)
+
+    start = time.perf_counter()
+    count = precompile_templates(app)
+    print(f"🧩 已预编译 {count} 个模板 ({(time.perf_counter() - start) * 1000:.1f}ms)")